@@ -1,19 +1,31 @@
-from fastapi import APIRouter, HTTPException, Request, Cookie, UploadFile, File
+from fastapi import APIRouter, HTTPException, Request, Response, Cookie, Depends, UploadFile, File
 from typing import Optional
 from datetime import datetime, timezone
 import uuid
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
 import os
 import shutil
-import csv
-import io
 from pathlib import Path
-from auth import get_current_admin_user
-
-# Get DB connection
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'singgifts_db')]
+from database import get_db
+from auth import get_current_admin_user, AUTH_MODE
+from catalog import find_product, remember, forget
+from session_cache import session_cache
+from revocation import revocation_list
+from password_service import password_service
+from search import search_index, ranked_page
+from pagination import fetch_page, cached_count, count_by
+from response_cache import response_cache
+from paypal_client import paypal_client
+from payment_gateway import payment_gateway
+from checkout_status import checkout_status_cache
+from jobs import job_queue
+from reviews import rebuild_review_stats
+from deals import current_price_fields
+import csv_import
+import exports
+import dashboard
+import reports
 
 admin_router = APIRouter(prefix="/admin")
 
@@ -23,7 +35,8 @@ admin_router = APIRouter(prefix="/admin")
 async def upload_image(
     request: Request,
     file: UploadFile = File(...),
-    session_token: Optional[str] = Cookie(None)
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Upload an image file and return the URL"""
     await get_current_admin_user(request, db, session_token)
@@ -57,43 +70,127 @@ async def upload_image(
 # ============== ADMIN DASHBOARD STATS ==============
 
 @admin_router.get("/dashboard/stats")
-async def get_dashboard_stats(request: Request, session_token: Optional[str] = Cookie(None)):
+async def get_dashboard_stats(request: Request, session_token: Optional[str] = Cookie(None), db: AsyncIOMotorDatabase = Depends(get_db)):
     """Get admin dashboard statistics"""
     await get_current_admin_user(request, db, session_token)
     
-    total_products = await db.products.count_documents({})
-    total_orders = await db.payment_transactions.count_documents({"payment_status": "paid"})
-    total_customers = await db.users.count_documents({"is_admin": {"$ne": True}})
+    stats = await dashboard.get_stats(db)
+    return {
+        "total_products": stats["total_products"],
+        "total_orders": stats["total_orders"],
+        "total_customers": stats["total_customers"],
+        "total_revenue": stats["total_revenue"],
+        "recent_orders": stats["recent_orders"],
+        "low_stock_products": stats["low_stock_products"],
+        "updated_at": stats["updated_at"]
+    }
+
+@admin_router.post("/dashboard/rebuild")
+async def rebuild_dashboard_stats(request: Request, session_token: Optional[str] = Cookie(None), db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Recompute dashboard statistics from the source collections"""
+    await get_current_admin_user(request, db, session_token)
     
-    # Calculate total revenue
-    revenue_pipeline = [
-        {"$match": {"payment_status": "paid"}},
-        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-    ]
-    revenue_result = await db.payment_transactions.aggregate(revenue_pipeline).to_list(length=1)
-    total_revenue = revenue_result[0]["total"] if revenue_result else 0
+    stats = await dashboard.rebuild(db)
+    return {"message": "Dashboard stats rebuilt", "rebuilt_at": stats["rebuilt_at"]}
+
+# ============== SALES REPORTS ==============
+
+@admin_router.get("/reports/sales")
+async def get_sales_report(
+    request: Request,
+    session_token: Optional[str] = Cookie(None),
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    interval: str = "day",
+    top: int = 10,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Revenue, orders, AOV, coupon usage and top products for start..end (YYYY-MM-DD, default last 30 days).
+
+    The first request builds the rollups from all past payment transactions,
+    so it takes longer; later ones read the rollups only.
+    """
+    await get_current_admin_user(request, db, session_token)
     
-    # Get recent orders
-    recent_orders = await db.payment_transactions.find(
-        {"payment_status": "paid"},
-        {"_id": 0}
-    ).sort("created_at", -1).limit(10).to_list(length=10)
+    start, end = reports.parse_range(start, end)
+    return await reports.sales_report(db, start, end, interval, top)
+
+@admin_router.post("/reports/rebuild")
+async def rebuild_sales_reports(
+    request: Request,
+    session_token: Optional[str] = Cookie(None),
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Recompute the sales rollups for start..end from payment transactions"""
+    await get_current_admin_user(request, db, session_token)
     
-    # Get low stock products
-    low_stock_products = await db.products.find(
-        {"stock": {"$lt": 10}},
-        {"_id": 0}
-    ).sort("stock", 1).limit(10).to_list(length=10)
+    start, end = reports.parse_range(start, end)
+    await reports.rebuild(db, start, end)
+    return {"message": f"Sales reports rebuilt for {start} to {end}"}
+
+# ============== ADMIN METRICS ==============
+
+@admin_router.get("/metrics")
+async def get_metrics(request: Request, session_token: Optional[str] = Cookie(None), db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Get in-process cache and service metrics"""
+    await get_current_admin_user(request, db, session_token)
     
     return {
-        "total_products": total_products,
-        "total_orders": total_orders,
-        "total_customers": total_customers,
-        "total_revenue": total_revenue,
-        "recent_orders": recent_orders,
-        "low_stock_products": low_stock_products
+        "auth_mode": AUTH_MODE,
+        "session_cache": session_cache.stats(),
+        "revoked_tokens": len(revocation_list),
+        "password_pool": password_service.stats(),
+        "response_cache": response_cache.stats(),
+        "paypal": paypal_client.stats(),
+        "payment_gateway": payment_gateway.name,
+        "checkout_status": checkout_status_cache.stats(),
+        "jobs": await job_queue.stats(db)
     }
 
+# ============== ADMIN JOBS ==============
+
+@admin_router.get("/jobs")
+async def get_jobs(
+    request: Request,
+    status: str = "dead",
+    limit: int = 50,
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """List background jobs by status, most recent first"""
+    await get_current_admin_user(request, db, session_token)
+    
+    jobs = await db.jobs.find({"status": status}, {"_id": 0}).sort("run_at", -1).limit(limit).to_list(length=limit)
+    return {"jobs": jobs}
+
+@admin_router.post("/jobs/{job_id}/retry")
+async def retry_job(job_id: str, request: Request, session_token: Optional[str] = Cookie(None), db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Requeue a dead job"""
+    await get_current_admin_user(request, db, session_token)
+    
+    if not await job_queue.retry(db, job_id):
+        raise HTTPException(status_code=404, detail="Dead job not found")
+    return {"message": "Job requeued"}
+
+# ============== ADMIN REVIEW STATS ==============
+
+@admin_router.post("/reviews/rebuild-stats")
+async def rebuild_review_stats_admin(
+    request: Request,
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Recompute product rating stats from all reviews.
+    
+    Cached review summaries and their ETags are invalidated for every product rebuilt.
+    """
+    await get_current_admin_user(request, db, session_token)
+    
+    updated = await rebuild_review_stats(db)
+    return {"message": f"Rebuilt review stats for {updated} products", "updated_count": updated}
+
 # ============== ADMIN PRODUCT MANAGEMENT ==============
 
 @admin_router.get("/products")
@@ -103,30 +200,32 @@ async def get_all_products_admin(
     search: Optional[str] = None,
     category_id: Optional[str] = None,
     skip: int = 0,
-    limit: int = 50
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Get all products for admin"""
     await get_current_admin_user(request, db, session_token)
     
     query = {}
-    if search:
-        query["$or"] = [
-            {"name": {"$regex": search, "$options": "i"}},
-            {"description": {"$regex": search, "$options": "i"}},
-            {"sku": {"$regex": search, "$options": "i"}}
-        ]
     if category_id:
         query["category_id"] = category_id
     
-    products = await db.products.find(query, {"_id": 0}).skip(skip).limit(limit).to_list(length=limit)
-    total = await db.products.count_documents(query)
+    if search:
+        ranked_ids = [product_id for product_id, _, _ in search_index.search(search, ["general"])]
+        products, total = await ranked_page(db.products, ranked_ids, query, skip, limit)
+        next_cursor = None
+    else:
+        products, next_cursor = await fetch_page(db.products, query, [], limit, cursor=cursor, skip=skip)
+        total = await cached_count(db.products, query)
     
-    return {"products": products, "total": total}
+    return {"products": products, "total": total, "next_cursor": next_cursor}
 
 @admin_router.post("/products")
 async def create_product_admin(
     request: Request,
-    session_token: Optional[str] = Cookie(None)
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Create new product"""
     await get_current_admin_user(request, db, session_token)
@@ -158,7 +257,15 @@ async def create_product_admin(
         "updated_at": datetime.now(timezone.utc).isoformat()
     }
     
-    result = await db.products.insert_one(product_data)
+    product_data.update(await current_price_fields(db, product_data))
+    try:
+        result = await db.products.insert_one(product_data)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail=f"SKU {product_data['sku']} already exists")
+    remember(product_data["id"], "general")
+    search_index.add(product_data, "general")
+    await dashboard.adjust(db, total_products=1)
+    await dashboard.refresh_low_stock(db)
     
     # Return clean response without MongoDB ObjectId
     response_product = {k: v for k, v in product_data.items() if k != '_id'}
@@ -169,14 +276,15 @@ async def create_product_admin(
 async def update_product_admin(
     request: Request,
     product_id: str,
-    session_token: Optional[str] = Cookie(None)
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Update existing product"""
     await get_current_admin_user(request, db, session_token)
     
     product = await request.json()
     
-    existing_product = await db.products.find_one({"id": product_id}, {"_id": 0})
+    existing_product = await find_product(db, product_id, "general")
     if not existing_product:
         raise HTTPException(status_code=404, detail="Product not found")
     
@@ -199,14 +307,18 @@ async def update_product_admin(
         "updated_at": datetime.now(timezone.utc).isoformat()
     }
     
+    update_data.update(await current_price_fields(db, {**existing_product, **update_data}))
     await db.products.update_one({"id": product_id}, {"$set": update_data})
+    search_index.add({**existing_product, **update_data}, "general")
+    await dashboard.refresh_low_stock(db)
     return {"message": "Product updated successfully"}
 
 @admin_router.delete("/products/{product_id}")
 async def delete_product_admin(
     request: Request,
     product_id: str,
-    session_token: Optional[str] = Cookie(None)
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Delete product"""
     await get_current_admin_user(request, db, session_token)
@@ -214,6 +326,10 @@ async def delete_product_admin(
     result = await db.products.delete_one({"id": product_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
+    forget(product_id)
+    search_index.remove(product_id)
+    await dashboard.adjust(db, total_products=-1)
+    await dashboard.refresh_low_stock(db)
     
     return {"message": "Product deleted successfully"}
 
@@ -225,7 +341,9 @@ async def get_all_orders_admin(
     session_token: Optional[str] = Cookie(None),
     status: Optional[str] = None,
     skip: int = 0,
-    limit: int = 50
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Get all orders for admin"""
     await get_current_admin_user(request, db, session_token)
@@ -234,16 +352,17 @@ async def get_all_orders_admin(
     if status:
         query["status"] = status
     
-    orders = await db.payment_transactions.find(query, {"_id": 0}).sort("created_at", -1).skip(skip).limit(limit).to_list(length=limit)
-    total = await db.payment_transactions.count_documents(query)
+    orders, next_cursor = await fetch_page(db.payment_transactions, query, [("created_at", -1)], limit, cursor=cursor, skip=skip)
+    total = await cached_count(db.payment_transactions, query)
     
-    return {"orders": orders, "total": total}
+    return {"orders": orders, "total": total, "next_cursor": next_cursor}
 
 @admin_router.get("/orders/{order_id}")
 async def get_order_details_admin(
     request: Request,
     order_id: str,
-    session_token: Optional[str] = Cookie(None)
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Get order details"""
     await get_current_admin_user(request, db, session_token)
@@ -258,7 +377,8 @@ async def get_order_details_admin(
 async def update_order_status_admin(
     request: Request,
     order_id: str,
-    session_token: Optional[str] = Cookie(None)
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Update order status"""
     await get_current_admin_user(request, db, session_token)
@@ -270,13 +390,15 @@ async def update_order_status_admin(
     if status not in valid_statuses:
         raise HTTPException(status_code=400, detail=f"Invalid status")
     
+    updated_at = datetime.now(timezone.utc).isoformat()
     result = await db.payment_transactions.update_one(
         {"id": order_id},
-        {"$set": {"status": status, "updated_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"status": status, "updated_at": updated_at}}
     )
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Order not found")
+    await dashboard.order_status_changed(db, order_id, status, updated_at)
     
     return {"message": "Order status updated successfully"}
 
@@ -285,24 +407,26 @@ async def update_order_status_admin(
 @admin_router.get("/categories")
 async def get_all_categories_admin(
     request: Request,
-    session_token: Optional[str] = Cookie(None)
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Get all categories for admin"""
     await get_current_admin_user(request, db, session_token)
     
     categories = await db.categories.find({}, {"_id": 0}).sort("order", 1).to_list(length=100)
     
-    # Add product count for each category
+    # Product count for every category in one aggregation
+    counts = await count_by(db.products, "category_id", [category["id"] for category in categories])
     for category in categories:
-        product_count = await db.products.count_documents({"category_id": category["id"]})
-        category["product_count"] = product_count
+        category["product_count"] = counts[category["id"]]
     
     return {"categories": categories}
 
 @admin_router.post("/categories")
 async def create_category_admin(
     request: Request,
-    session_token: Optional[str] = Cookie(None)
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Create new category"""
     await get_current_admin_user(request, db, session_token)
@@ -322,7 +446,8 @@ async def create_category_admin(
     }
     
     # Insert into database
-    result = await db.categories.insert_one(category_data)
+    await db.categories.insert_one(category_data)
+    await response_cache.invalidate("categories")
     
     # Return clean response without MongoDB ObjectId
     response_category = {
@@ -342,7 +467,8 @@ async def create_category_admin(
 async def update_category_admin(
     request: Request,
     category_id: str,
-    session_token: Optional[str] = Cookie(None)
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Update existing category"""
     await get_current_admin_user(request, db, session_token)
@@ -363,13 +489,15 @@ async def update_category_admin(
     }
     
     await db.categories.update_one({"id": category_id}, {"$set": update_data})
+    await response_cache.invalidate("categories")
     return {"message": "Category updated successfully"}
 
 @admin_router.delete("/categories/{category_id}")
 async def delete_category_admin(
     request: Request,
     category_id: str,
-    session_token: Optional[str] = Cookie(None)
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Delete category"""
     await get_current_admin_user(request, db, session_token)
@@ -385,6 +513,7 @@ async def delete_category_admin(
     result = await db.categories.delete_one({"id": category_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Category not found")
+    await response_cache.invalidate("categories")
     
     return {"message": "Category deleted successfully"}
 
@@ -396,7 +525,9 @@ async def get_all_customers_admin(
     session_token: Optional[str] = Cookie(None),
     search: Optional[str] = None,
     skip: int = 0,
-    limit: int = 50
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Get all customers for admin"""
     await get_current_admin_user(request, db, session_token)
@@ -408,21 +539,26 @@ async def get_all_customers_admin(
             {"name": {"$regex": search, "$options": "i"}}
         ]
     
-    customers = await db.users.find(query, {"_id": 0, "password_hash": 0}).skip(skip).limit(limit).to_list(length=limit)
-    total = await db.users.count_documents(query)
+    customers, next_cursor = await fetch_page(
+        db.users, query, [], limit, cursor=cursor, skip=skip, projection={"_id": 0, "password_hash": 0}
+    )
+    total = await cached_count(db.users, query)
     
-    # Add order count for each customer
+    # Paid order count for every customer on the page in one aggregation
+    counts = await count_by(
+        db.payment_transactions, "user_id", [customer["id"] for customer in customers], {"payment_status": "paid"}
+    )
     for customer in customers:
-        order_count = await db.payment_transactions.count_documents({"user_id": customer["id"], "payment_status": "paid"})
-        customer["order_count"] = order_count
+        customer["order_count"] = counts[customer["id"]]
     
-    return {"customers": customers, "total": total}
+    return {"customers": customers, "total": total, "next_cursor": next_cursor}
 
 @admin_router.get("/customers/{customer_id}/orders")
 async def get_customer_orders_admin(
     request: Request,
     customer_id: str,
-    session_token: Optional[str] = Cookie(None)
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Get customer order history"""
     await get_current_admin_user(request, db, session_token)
@@ -439,7 +575,8 @@ async def get_customer_orders_admin(
 @admin_router.get("/coupons")
 async def get_all_coupons_admin(
     request: Request,
-    session_token: Optional[str] = Cookie(None)
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Get all coupons for admin"""
     await get_current_admin_user(request, db, session_token)
@@ -450,7 +587,8 @@ async def get_all_coupons_admin(
 @admin_router.post("/coupons")
 async def create_coupon_admin(
     request: Request,
-    session_token: Optional[str] = Cookie(None)
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Create new coupon"""
     await get_current_admin_user(request, db, session_token)
@@ -481,7 +619,8 @@ async def create_coupon_admin(
 async def update_coupon_admin(
     request: Request,
     coupon_id: str,
-    session_token: Optional[str] = Cookie(None)
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Update existing coupon"""
     await get_current_admin_user(request, db, session_token)
@@ -509,7 +648,8 @@ async def update_coupon_admin(
 async def delete_coupon_admin(
     request: Request,
     coupon_id: str,
-    session_token: Optional[str] = Cookie(None)
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Delete coupon"""
     await get_current_admin_user(request, db, session_token)
@@ -524,7 +664,8 @@ async def delete_coupon_admin(
 async def toggle_coupon_status_admin(
     request: Request,
     coupon_id: str,
-    session_token: Optional[str] = Cookie(None)
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Toggle coupon active status"""
     await get_current_admin_user(request, db, session_token)
@@ -547,124 +688,103 @@ async def toggle_coupon_status_admin(
 @admin_router.post("/import-csv")
 async def import_csv_data(
     request: Request,
+    response: Response,
     file: UploadFile = File(...),
-    session_token: Optional[str] = Cookie(None)
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
-    """Import data from CSV file"""
+    """Import data from CSV file.
+    
+    Large files are imported in the background: the response carries an
+    import_id to poll at /admin/import-csv/{import_id}.
+    """
     await get_current_admin_user(request, db, session_token)
     
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="File must be a CSV")
     
-    # Read CSV content
-    contents = await file.read()
-    decoded = contents.decode('utf-8')
-    csv_reader = csv.DictReader(io.StringIO(decoded))
-    
     # Get import type from form data
     form = await request.form()
     import_type = form.get('import_type', 'products')
+    if import_type not in csv_import.IMPORTERS:
+        raise HTTPException(status_code=400, detail=f"Unknown import type {import_type}")
     
-    imported_count = 0
-    errors = []
+    path, size = await csv_import.spool_upload(file)
     
-    try:
-        if import_type == 'products':
-            # Import general products
-            for row in csv_reader:
-                try:
-                    product_data = {
-                        "id": str(uuid.uuid4()),
-                        "name": row['name'],
-                        "description": row['description'],
-                        "price": float(row['price']),
-                        "sale_price": float(row['sale_price']) if row.get('sale_price') else None,
-                        "category_id": row['category_id'],
-                        "stock": int(row['stock']),
-                        "images": [img.strip() for img in row.get('images', '').split(',') if img.strip()],
-                        "sku": row.get('sku', f"SG-{str(uuid.uuid4())[:8].upper()}"),
-                        "slug": row['name'].lower().replace(' ', '-'),
-                        "created_at": datetime.now(timezone.utc).isoformat(),
-                        "updated_at": datetime.now(timezone.utc).isoformat()
-                    }
-                    await db.products.insert_one(product_data)
-                    imported_count += 1
-                except Exception as e:
-                    errors.append(f"Row {imported_count + 1}: {str(e)}")
-        
-        elif import_type == 'customers':
-            # Import customers for marketing
-            for row in csv_reader:
-                try:
-                    # Check if email already exists
-                    existing = await db.marketing_contacts.find_one({"email": row['email']})
-                    if not existing:
-                        contact_data = {
-                            "id": str(uuid.uuid4()),
-                            "name": row.get('name', ''),
-                            "email": row['email'],
-                            "phone": row.get('phone', ''),
-                            "created_at": datetime.now(timezone.utc).isoformat()
-                        }
-                        await db.marketing_contacts.insert_one(contact_data)
-                        imported_count += 1
-                except Exception as e:
-                    errors.append(f"Row {imported_count + 1}: {str(e)}")
-        
-        elif import_type == 'explore_singapore':
-            # Import Explore Singapore products
-            for row in csv_reader:
-                try:
-                    product_data = {
-                        "id": str(uuid.uuid4()),
-                        "name": row['name'],
-                        "description": row['description'],
-                        "price": float(row['price']),
-                        "sale_price": float(row['sale_price']) if row.get('sale_price') else None,
-                        "landmark_id": row['landmark_id'],
-                        "stock": int(row['stock']),
-                        "images": [img.strip() for img in row.get('images', '').split(',') if img.strip()],
-                        "sku": row.get('sku', f"ESP-{str(uuid.uuid4())[:8].upper()}"),
-                        "slug": row['name'].lower().replace(' ', '-'),
-                        "created_at": datetime.now(timezone.utc).isoformat(),
-                        "updated_at": datetime.now(timezone.utc).isoformat()
-                    }
-                    await db.explore_singapore_products.insert_one(product_data)
-                    imported_count += 1
-                except Exception as e:
-                    errors.append(f"Row {imported_count + 1}: {str(e)}")
-        
-        elif import_type == 'batik':
-            # Import Batik products
-            for row in csv_reader:
-                try:
-                    product_data = {
-                        "id": str(uuid.uuid4()),
-                        "name": row['name'],
-                        "description": row['description'],
-                        "price": float(row['price']),
-                        "sale_price": float(row['sale_price']) if row.get('sale_price') else None,
-                        "stock": int(row['stock']),
-                        "images": [img.strip() for img in row.get('images', '').split(',') if img.strip()],
-                        "sku": row.get('sku', f"BTK-{str(uuid.uuid4())[:8].upper()}"),
-                        "slug": row['name'].lower().replace(' ', '-'),
-                        "created_at": datetime.now(timezone.utc).isoformat(),
-                        "updated_at": datetime.now(timezone.utc).isoformat()
-                    }
-                    await db.batik_products.insert_one(product_data)
-                    imported_count += 1
-                except Exception as e:
-                    errors.append(f"Row {imported_count + 1}: {str(e)}")
+    if size > csv_import.CSV_IMPORT_INLINE_BYTES:
+        import_id = await csv_import.start_background_import(db, path, import_type, file.filename)
+        response.status_code = 202
+        return {"message": "Import started", "import_id": import_id}
     
+    try:
+        result = await csv_import.run_import(db, path, import_type)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="CSV must be UTF-8 encoded")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Import failed: {str(e)}")
-    
-    message = f"Successfully imported {imported_count} records"
-    if errors:
-        message += f". {len(errors)} errors occurred"
+    finally:
+        os.unlink(path)
     
     return {
-        "message": message,
-        "imported_count": imported_count,
-        "errors": errors[:10]  # Return first 10 errors
+        "message": csv_import.message(result),
+        "imported_count": result["imported_count"],
+        "updated_count": result["updated_count"],
+        "errors": result["errors"][:10]  # Return first 10 errors
     }
+
+@admin_router.get("/import-csv/{import_id}")
+async def get_csv_import(import_id: str, request: Request, session_token: Optional[str] = Cookie(None), db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Progress of a background CSV import"""
+    await get_current_admin_user(request, db, session_token)
+    
+    status = await csv_import.import_status(db, import_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="Import not found")
+    return status
+
+# ============== EXPORT ==============
+
+@admin_router.get("/export/products")
+async def export_products(
+    request: Request,
+    session_token: Optional[str] = Cookie(None),
+    collection_type: Optional[str] = None,
+    search: Optional[str] = None,
+    category_id: Optional[str] = None,
+    format: str = "csv",
+    gzip: bool = False,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Stream products as CSV or JSON Lines; all three collections unless collection_type is given"""
+    await get_current_admin_user(request, db, session_token)
+    
+    sources = exports.product_sources(db, collection_type, search, category_id)
+    return exports.export_response("products", sources, exports.PRODUCT_COLUMNS, format, gzip)
+
+@admin_router.get("/export/orders")
+async def export_orders(
+    request: Request,
+    session_token: Optional[str] = Cookie(None),
+    status: Optional[str] = None,
+    format: str = "csv",
+    gzip: bool = False,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Stream orders (payment transactions) as CSV or JSON Lines"""
+    await get_current_admin_user(request, db, session_token)
+    
+    return exports.export_response("orders", exports.order_sources(db, status), exports.ORDER_COLUMNS, format, gzip)
+
+@admin_router.get("/export/customers")
+async def export_customers(
+    request: Request,
+    session_token: Optional[str] = Cookie(None),
+    search: Optional[str] = None,
+    format: str = "csv",
+    gzip: bool = False,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Stream customers as CSV or JSON Lines"""
+    await get_current_admin_user(request, db, session_token)
+    
+    return exports.export_response("customers", exports.customer_sources(db, search), exports.CUSTOMER_COLUMNS, format, gzip)
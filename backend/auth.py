@@ -1,10 +1,12 @@
 from fastapi import HTTPException, Request, Cookie
-from jose import JWTError, jwt
+from jose import ExpiredSignatureError, JWTError, jwt
 import bcrypt
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 import os
 from dotenv import load_dotenv
+from session_cache import session_cache
+from revocation import revocation_list
 
 load_dotenv()
 
@@ -12,6 +14,10 @@ SECRET_KEY = os.environ.get('JWT_SECRET_KEY')
 ALGORITHM = os.environ.get('JWT_ALGORITHM')
 ACCESS_TOKEN_EXPIRE_DAYS = int(os.environ.get('ACCESS_TOKEN_EXPIRE_DAYS', 7))
 
+# 'session': every token is checked against user_sessions
+# 'jwt': tokens we signed are verified locally and checked against the revocation list
+AUTH_MODE = os.environ.get('AUTH_MODE', 'session')
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against a hash"""
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
@@ -30,6 +36,46 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def decode_access_token(token: str) -> Optional[dict]:
+    """Verify a JWT issued by create_access_token, None if the token is not one of ours"""
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Session expired")
+    except JWTError:
+        return None
+
+async def _get_user_from_jwt(token: str, db) -> Optional[dict]:
+    """Stateless fast path: verify signature and revocation, read only the user document"""
+    claims = decode_access_token(token)
+    if not claims or not claims.get('sub'):
+        return None
+    
+    await revocation_list.refresh(db)
+    if revocation_list.is_revoked(token):
+        raise HTTPException(status_code=401, detail="Invalid session")
+    
+    cached_user = session_cache.get(token)
+    if cached_user:
+        return cached_user
+    
+    user = await db.users.find_one({"id": claims['sub']}, {"_id": 0})
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    session_cache.set(token, user, datetime.fromtimestamp(claims['exp'], timezone.utc))
+    return user
+
+async def end_session(db, token: str):
+    """Log a token out of the cache, the session store and (for JWTs) the revocation list"""
+    session_cache.invalidate(token)
+    await db.user_sessions.delete_one({"session_token": token})
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return
+    await revocation_list.revoke(db, token, datetime.fromtimestamp(claims['exp'], timezone.utc))
+
 async def get_current_user(request: Request, db, session_token: Optional[str] = Cookie(None)):
     """Get current user from session_token cookie or Authorization header"""
     token = session_token
@@ -43,6 +89,15 @@ async def get_current_user(request: Request, db, session_token: Optional[str] =
     if not token:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
+    if AUTH_MODE == 'jwt':
+        user = await _get_user_from_jwt(token, db)
+        if user:
+            return user
+    
+    cached_user = session_cache.get(token)
+    if cached_user:
+        return cached_user
+    
     # Check if session exists and is valid
     session = await db.user_sessions.find_one({"session_token": token})
     if not session:
@@ -62,6 +117,7 @@ async def get_current_user(request: Request, db, session_token: Optional[str] =
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
+    session_cache.set(token, user, expires_at)
     return user
 
 async def get_current_user_optional(request: Request, db, session_token: Optional[str] = Cookie(None)):
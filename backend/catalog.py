@@ -0,0 +1,91 @@
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+# Product collections in lookup precedence order, keyed by collection_type
+PRODUCT_COLLECTIONS = {
+    "general": "products",
+    "explore_singapore": "explore_singapore_products",
+    "batik": "batik_products",
+}
+
+ROUTING_INDEX_SIZE = 50000
+
+# Routing index: product id -> collection_type, filled in as products are resolved
+_routes: "OrderedDict[str, str]" = OrderedDict()
+
+def remember(product_id: str, collection_type: str):
+    """Record which collection a product lives in"""
+    _routes[product_id] = collection_type
+    _routes.move_to_end(product_id)
+    while len(_routes) > ROUTING_INDEX_SIZE:
+        _routes.popitem(last=False)
+
+def forget(product_id: str):
+    """Drop a product from the routing index (after delete)"""
+    _routes.pop(product_id, None)
+
+def collection_for(db, collection_type: str):
+    """Get the Mongo collection for a collection_type"""
+    return db[PRODUCT_COLLECTIONS[collection_type]]
+
+def _union_pipeline(match: dict) -> list:
+    """Build a single aggregation that searches all product collections in precedence order"""
+    types = list(PRODUCT_COLLECTIONS)
+    pipeline = [{"$match": match}, {"$addFields": {"collection_type": types[0]}}]
+    for collection_type in types[1:]:
+        pipeline.append({"$unionWith": {
+            "coll": PRODUCT_COLLECTIONS[collection_type],
+            "pipeline": [{"$match": match}, {"$addFields": {"collection_type": collection_type}}]
+        }})
+    pipeline.append({"$project": {"_id": 0}})
+    return pipeline
+
+async def find_product(db, product_id: str, collection_type: Optional[str] = None) -> Optional[dict]:
+    """Resolve a product id from any collection in one lookup, tagged with collection_type"""
+    if collection_type:
+        product = await collection_for(db, collection_type).find_one({"id": product_id}, {"_id": 0})
+        if product:
+            product['collection_type'] = collection_type
+            remember(product_id, collection_type)
+        return product
+
+    routed = _routes.get(product_id)
+    if routed:
+        product = await collection_for(db, routed).find_one({"id": product_id}, {"_id": 0})
+        if product:
+            product['collection_type'] = routed
+            return product
+        forget(product_id)
+
+    pipeline = _union_pipeline({"id": product_id}) + [{"$limit": 1}]
+    results = await db[PRODUCT_COLLECTIONS["general"]].aggregate(pipeline).to_list(length=1)
+    if not results:
+        return None
+
+    product = results[0]
+    remember(product_id, product['collection_type'])
+    return product
+
+async def find_products(db, product_ids: Iterable[str]) -> Dict[str, dict]:
+    """Resolve many product ids at once with one $in query per collection, keyed by id"""
+    ids = list(dict.fromkeys(pid for pid in product_ids if pid))
+    if not ids:
+        return {}
+
+    async def fetch(collection_type: str):
+        cursor = collection_for(db, collection_type).find({"id": {"$in": ids}}, {"_id": 0})
+        return collection_type, await cursor.to_list(length=None)
+
+    results = await asyncio.gather(*(fetch(collection_type) for collection_type in PRODUCT_COLLECTIONS))
+
+    # gather preserves order, so earlier collections take precedence on duplicate ids
+    products = {}
+    for collection_type, docs in results:
+        for product in docs:
+            if product['id'] in products:
+                continue
+            product['collection_type'] = collection_type
+            products[product['id']] = product
+            remember(product['id'], collection_type)
+    return products
@@ -0,0 +1,83 @@
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable
+
+# How long a worker answers polls for an unpaid session without asking Stripe again
+CHECKOUT_PENDING_TTL_SECONDS = float(os.environ.get('CHECKOUT_PENDING_TTL_SECONDS', 3))
+CHECKOUT_PENDING_CACHE_SIZE = 10000
+
+class CheckoutStatusCache:
+    """Per-process state for the order-success page's status polling.
+
+    Concurrent polls for one session share a single resolution, and a session
+    Stripe last reported as unpaid is not re-checked until its entry expires.
+    Paid sessions are never cached here: they are answered from the
+    transaction record.
+    """
+
+    def __init__(self, ttl: float = CHECKOUT_PENDING_TTL_SECONDS, maxsize: int = CHECKOUT_PENDING_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._pending = {}  # session_id -> (status, expires_at)
+        self._inflight = {}  # session_id -> Future
+        self.gateway_calls = 0
+        self.pending_hits = 0
+        self.coalesced = 0
+
+    def get_pending(self, session_id: str):
+        entry = self._pending.get(session_id)
+        if entry is None:
+            return None
+        status, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._pending[session_id]
+            return None
+        self.pending_hits += 1
+        return status
+
+    def set_pending(self, session_id: str, status: dict):
+        if len(self._pending) >= self.maxsize:
+            now = time.monotonic()
+            self._pending = {k: v for k, v in self._pending.items() if v[1] > now}
+            if len(self._pending) >= self.maxsize:
+                self._pending.clear()
+        self._pending[session_id] = (status, time.monotonic() + self.ttl)
+
+    def forget(self, session_id: str):
+        self._pending.pop(session_id, None)
+
+    async def resolve(self, session_id: str, resolver: Callable[[], Awaitable[Any]]):
+        """Run resolver once for all concurrent callers asking about the same session"""
+        inflight = self._inflight.get(session_id)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[session_id] = future
+        try:
+            result = await resolver()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so a failure nobody else awaited is not logged as unhandled
+            future.exception()
+            raise
+        finally:
+            del self._inflight[session_id]
+
+    def stats(self) -> dict:
+        return {
+            "pending_sessions": len(self._pending),
+            "in_flight": len(self._inflight),
+            "gateway_calls": self.gateway_calls,
+            "pending_hits": self.pending_hits,
+            "coalesced": self.coalesced,
+        }
+
+checkout_status_cache = CheckoutStatusCache()
@@ -0,0 +1,239 @@
+"""
+CSV Import
+Streams an uploaded CSV in batches, validates each row and writes every batch
+with a single unordered bulk_write of upserts: products are keyed on SKU,
+marketing contacts on email. Large uploads run in the background and report
+progress in the csv_imports collection.
+"""
+
+import asyncio
+import codecs
+import csv
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import Callable, Dict, List, Optional, Tuple
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from search import search_index
+from response_cache import response_cache
+from deals import price_fields, refresh_deals
+import dashboard
+
+logger = logging.getLogger(__name__)
+
+CSV_IMPORT_BATCH_SIZE = int(os.environ.get('CSV_IMPORT_BATCH_SIZE', 1000))
+# Uploads larger than this run as a background import
+CSV_IMPORT_INLINE_BYTES = int(os.environ.get('CSV_IMPORT_INLINE_BYTES', 1024 * 1024))
+MAX_REPORTED_ERRORS = 100
+# A running import that has not reported progress for this long lost its worker
+CSV_IMPORT_STALE_SECONDS = float(os.environ.get('CSV_IMPORT_STALE_SECONDS', 300))
+
+class RowError(ValueError):
+    pass
+
+def _required(row: dict, field: str) -> str:
+    value = (row.get(field) or "").strip()
+    if not value:
+        raise RowError(f"missing {field}")
+    return value
+
+def _number(row: dict, field: str, cast, required: bool = True):
+    raw = (row.get(field) or "").strip()
+    if not raw:
+        if required:
+            raise RowError(f"missing {field}")
+        return None
+    try:
+        value = cast(raw)
+    except ValueError:
+        raise RowError(f"invalid {field} '{raw}'")
+    if value < 0:
+        raise RowError(f"{field} must not be negative")
+    return value
+
+def _product(row: dict, sku_prefix: str, **fields) -> Tuple[dict, dict, dict]:
+    name = _required(row, 'name')
+    sku = (row.get('sku') or "").strip() or f"{sku_prefix}-{str(uuid.uuid4())[:8].upper()}"
+    now = datetime.now(timezone.utc)
+    update = {
+        "name": name,
+        "description": _required(row, 'description'),
+        "price": _number(row, 'price', float),
+        "sale_price": _number(row, 'sale_price', float, required=False),
+        "stock": _number(row, 'stock', int),
+        "images": [img.strip() for img in (row.get('images') or '').split(',') if img.strip()],
+        "slug": name.lower().replace(' ', '-'),
+        "updated_at": now.isoformat(),
+        **fields
+    }
+    # Priced from the row's own prices; run_import's deal pass then discounts products on a deal
+    update.update(price_fields(update, {}, now))
+    return {"sku": sku}, update, {"id": str(uuid.uuid4()), "rating": 0.0, "review_count": 0, "created_at": now.isoformat()}
+
+def _general_product(row: dict):
+    return _product(row, "SG", category_id=_required(row, 'category_id'))
+
+def _explore_singapore_product(row: dict):
+    return _product(row, "ESP", landmark_id=_required(row, 'landmark_id'))
+
+def _batik_product(row: dict):
+    return _product(row, "BTK")
+
+def _contact(row: dict):
+    email = _required(row, 'email')
+    if "@" not in email:
+        raise RowError(f"invalid email '{email}'")
+    contact = {
+        "id": str(uuid.uuid4()),
+        "name": (row.get('name') or "").strip(),
+        "phone": (row.get('phone') or "").strip(),
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+    # Existing contacts are left as they are
+    return {"email": email}, None, contact
+
+# import_type -> (collection, row builder)
+IMPORTERS: Dict[str, Tuple[str, Callable[[dict], tuple]]] = {
+    "products": ("products", _general_product),
+    "customers": ("marketing_contacts", _contact),
+    "explore_singapore": ("explore_singapore_products", _explore_singapore_product),
+    "batik": ("batik_products", _batik_product),
+}
+
+def _read_batch(reader: csv.DictReader, size: int) -> List[Tuple[int, dict]]:
+    batch = []
+    for row in islice(reader, size):
+        batch.append((reader.line_num, row))
+    return batch
+
+async def run_import(db, path: str, import_type: str, import_id: Optional[str] = None) -> dict:
+    """Import a CSV file from disk, returning counts and per-row errors"""
+    collection_name, build = IMPORTERS[import_type]
+    collection = db[collection_name]
+    result = {"processed": 0, "imported_count": 0, "updated_count": 0, "error_count": 0, "errors": []}
+
+    def error(line: int, message: str):
+        result["error_count"] += 1
+        if len(result["errors"]) < MAX_REPORTED_ERRORS:
+            result["errors"].append(f"Row {line}: {message}")
+
+    with open(path, "rb") as raw:
+        # utf-8-sig drops the BOM spreadsheet exports often start with
+        reader = csv.DictReader(codecs.getreader("utf-8-sig")(raw))
+        while True:
+            batch = await asyncio.to_thread(_read_batch, reader, CSV_IMPORT_BATCH_SIZE)
+            if not batch:
+                break
+
+            requests, lines = [], []
+            for line, row in batch:
+                try:
+                    key, update, on_insert = build(row)
+                except (RowError, KeyError) as e:
+                    error(line, str(e))
+                    continue
+                operation = {"$setOnInsert": on_insert}
+                if update:
+                    operation["$set"] = update
+                requests.append(UpdateOne(key, operation, upsert=True))
+                lines.append(line)
+
+            if requests:
+                try:
+                    outcome = (await collection.bulk_write(requests, ordered=False)).bulk_api_result
+                except BulkWriteError as e:
+                    outcome = e.details
+                    for write_error in outcome.get("writeErrors", []):
+                        error(lines[write_error["index"]], write_error.get("errmsg", "write failed"))
+                result["imported_count"] += outcome.get("nUpserted", 0)
+                if import_type != "customers":
+                    result["updated_count"] += outcome.get("nMatched", 0)
+
+            result["processed"] += len(batch)
+            if import_id:
+                await db.csv_imports.update_one({"id": import_id}, {"$set": {**result, "updated_at": datetime.now(timezone.utc)}})
+
+    if import_type != "customers" and (result["imported_count"] or result["updated_count"]):
+        await search_index.rebuild(db)
+        # Applies live deals to the imported products
+        await refresh_deals(db)
+        if import_type in ("explore_singapore", "batik"):
+            await response_cache.invalidate(collection_name)
+        else:
+            await dashboard.refresh_products(db)
+    return result
+
+def message(result: dict) -> str:
+    text = f"Successfully imported {result['imported_count']} records"
+    if result.get("updated_count"):
+        text += f", updated {result['updated_count']}"
+    if result["error_count"]:
+        text += f". {result['error_count']} errors occurred"
+    return text
+
+async def spool_upload(upload) -> Tuple[str, int]:
+    """Copy an upload to a temp file this process owns; returns (path, size)"""
+    def copy():
+        upload.file.seek(0)
+        with tempfile.NamedTemporaryFile(prefix="csv-import-", suffix=".csv", delete=False) as target:
+            shutil.copyfileobj(upload.file, target, 1024 * 1024)
+            return target.name, target.tell()
+    return await asyncio.to_thread(copy)
+
+_running = set()  # keeps background import tasks referenced until they finish
+
+async def start_background_import(db, path: str, import_type: str, filename: str) -> str:
+    import_id = str(uuid.uuid4())
+    await db.csv_imports.insert_one({
+        "id": import_id,
+        "import_type": import_type,
+        "filename": filename,
+        "status": "running",
+        "processed": 0,
+        "imported_count": 0,
+        "updated_count": 0,
+        "error_count": 0,
+        "errors": [],
+        "created_at": datetime.now(timezone.utc),
+        # Heartbeat: run_import moves it after every batch
+        "updated_at": datetime.now(timezone.utc)
+    })
+
+    async def run():
+        try:
+            result = await run_import(db, path, import_type, import_id)
+            update = {**result, "status": "completed", "message": message(result)}
+        except Exception as e:
+            logger.error(f"CSV import {import_id} failed: {e}")
+            update = {"status": "failed", "message": f"Import failed: {str(e)}"}
+        finally:
+            os.unlink(path)
+        await db.csv_imports.update_one({"id": import_id}, {"$set": {**update, "finished_at": datetime.now(timezone.utc)}})
+
+    task = asyncio.create_task(run())
+    _running.add(task)
+    task.add_done_callback(_running.discard)
+    return import_id
+
+async def import_status(db, import_id: str) -> Optional[dict]:
+    """A background import's progress; one whose worker died is reported as failed"""
+    status = await db.csv_imports.find_one({"id": import_id}, {"_id": 0})
+    if status is None or status["status"] != "running":
+        return status
+    stale = datetime.now(timezone.utc) - timedelta(seconds=CSV_IMPORT_STALE_SECONDS)
+    failed = await db.csv_imports.find_one_and_update(
+        {"id": import_id, "status": "running", "updated_at": {"$lt": stale}},
+        {"$set": {
+            "status": "failed",
+            "message": "Import stopped before it finished; upload the file again",
+            "finished_at": datetime.now(timezone.utc)
+        }},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    return failed or status
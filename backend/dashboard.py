@@ -0,0 +1,129 @@
+"""
+Dashboard Stats
+Keeps the admin dashboard's figures in one dashboard_stats document so the
+dashboard loads with a single read. Writes adjust the document as they happen:
+
+- paid orders bump the order count and revenue and join recent_orders
+- product and customer writes adjust their counts and the low-stock list
+
+rebuild() recomputes everything from the source collections, one $facet
+pipeline per collection, run concurrently. It runs when the document is
+missing and on demand from the admin API. Paid orders are counted under
+recording.exclusive_rebuild, so an order is counted by its job or by the
+rebuild but never both.
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+from fastapi import HTTPException
+from recording import exclusive_rebuild, wait_for_rebuild
+
+logger = logging.getLogger(__name__)
+
+STATS_ID = "dashboard"
+RECENT_ORDERS = 10
+LOW_STOCK_THRESHOLD = 10
+LOW_STOCK_PRODUCTS = 10
+
+PAID = {"payment_status": "paid"}
+# Set on a payment transaction once its order is in total_orders and total_revenue
+RECORDED = "dashboard_recorded"
+CUSTOMERS = {"is_admin": {"$ne": True}}
+
+def _low_stock_pipeline() -> list:
+    return [
+        {"$match": {"stock": {"$lt": LOW_STOCK_THRESHOLD}}},
+        {"$sort": {"stock": 1, "id": 1}},
+        {"$limit": LOW_STOCK_PRODUCTS},
+        {"$project": {"_id": 0}},
+    ]
+
+async def _first(cursor) -> dict:
+    result = await cursor.to_list(length=1)
+    return result[0] if result else {}
+
+async def rebuild(db) -> dict:
+    """Recompute the stats document from scratch"""
+    async with exclusive_rebuild(db, RECORDED, PAID):
+        orders, products, customers = await asyncio.gather(
+            _first(db.payment_transactions.aggregate([
+                {"$match": PAID},
+                {"$facet": {
+                    "totals": [
+                        {"$match": {RECORDED: True}},
+                        {"$group": {"_id": None, "count": {"$sum": 1}, "revenue": {"$sum": "$amount"}}},
+                    ],
+                    "recent": [{"$sort": {"created_at": -1}}, {"$limit": RECENT_ORDERS}, {"$project": {"_id": 0}}],
+                }}
+            ])),
+            _first(db.products.aggregate([
+                {"$facet": {
+                    "count": [{"$count": "n"}],
+                    "low_stock": _low_stock_pipeline(),
+                }}
+            ])),
+            db.users.count_documents(CUSTOMERS),
+        )
+        totals = orders["totals"][0] if orders.get("totals") else {}
+        now = datetime.now(timezone.utc)
+        stats = {
+            "id": STATS_ID,
+            "total_products": products["count"][0]["n"] if products.get("count") else 0,
+            "total_orders": totals.get("count", 0),
+            "total_customers": customers,
+            "total_revenue": totals.get("revenue", 0),
+            "recent_orders": orders.get("recent", []),
+            "low_stock_products": products.get("low_stock", []),
+            "rebuilt_at": now,
+            "updated_at": now,
+        }
+        await db.dashboard_stats.replace_one({"id": STATS_ID}, stats, upsert=True)
+    logger.info("Dashboard stats rebuilt")
+    return stats
+
+async def get_stats(db) -> dict:
+    stats = await db.dashboard_stats.find_one({"id": STATS_ID}, {"_id": 0})
+    if stats is None:
+        try:
+            stats = await rebuild(db)
+        except HTTPException:
+            # Another request is already building it
+            await wait_for_rebuild(db, RECORDED)
+            stats = await db.dashboard_stats.find_one({"id": STATS_ID}, {"_id": 0})
+            if stats is None:
+                raise
+    return stats
+
+async def _update(db, update: dict):
+    # No upsert: a missing document is rebuilt in full on the next read
+    update.setdefault("$set", {})["updated_at"] = datetime.now(timezone.utc)
+    await db.dashboard_stats.update_one({"id": STATS_ID}, update)
+
+async def adjust(db, **deltas):
+    """Add to counters, e.g. adjust(db, total_products=1)"""
+    await _update(db, {"$inc": deltas})
+
+async def record_order(db, transaction: dict):
+    """Count a newly paid order and put it at the top of recent_orders"""
+    await _update(db, {
+        "$inc": {"total_orders": 1, "total_revenue": transaction['amount']},
+        "$push": {"recent_orders": {"$each": [transaction], "$position": 0, "$slice": RECENT_ORDERS}},
+    })
+
+async def order_status_changed(db, order_id: str, status: str, updated_at: str):
+    await db.dashboard_stats.update_one(
+        {"id": STATS_ID, "recent_orders.id": order_id},
+        {"$set": {"recent_orders.$.status": status, "recent_orders.$.updated_at": updated_at}}
+    )
+
+async def refresh_low_stock(db):
+    """Re-read the low-stock list after stock changed; one indexed query"""
+    low_stock = await db.products.aggregate(_low_stock_pipeline()).to_list(length=LOW_STOCK_PRODUCTS)
+    await _update(db, {"$set": {"low_stock_products": low_stock}})
+
+async def refresh_products(db):
+    """Product count and low-stock list after a bulk write such as a CSV import"""
+    total = await db.products.count_documents({})
+    low_stock = await db.products.aggregate(_low_stock_pipeline()).to_list(length=LOW_STOCK_PRODUCTS)
+    await _update(db, {"$set": {"total_products": total, "low_stock_products": low_stock}})
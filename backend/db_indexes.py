@@ -0,0 +1,286 @@
+"""
+Index Management
+Declares every index the backend relies on and applies them on startup.
+
+Run directly to apply or inspect indexes:
+    python db_indexes.py               # create missing indexes
+    python db_indexes.py --check       # report drift only
+    python db_indexes.py --dedupe-skus # rename duplicate skus, then create indexes
+"""
+
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever INDEXES changes so deployments re-apply the declarations
+INDEX_VERSION = 13
+
+INDEXES = {
+    "users": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    "user_sessions": [
+        IndexModel([("session_token", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING)]),
+    ],
+    "revoked_tokens": [
+        IndexModel([("token_digest", ASCENDING)], unique=True),
+        IndexModel([("revoked_at", ASCENDING)]),
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "response_cache": [
+        IndexModel([("namespace", ASCENDING)]),
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "jobs": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("key", ASCENDING)], unique=True, partialFilterExpression={"key": {"$type": "string"}}),
+        IndexModel([("status", ASCENDING), ("run_at", ASCENDING)]),
+        IndexModel([("status", ASCENDING), ("locked_until", ASCENDING)]),
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "otps": [
+        IndexModel([("email", ASCENDING), ("otp", ASCENDING)]),
+    ],
+    "login_otps": [
+        IndexModel([("email", ASCENDING), ("otp", ASCENDING)]),
+    ],
+    "categories": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("order", ASCENDING)]),
+    ],
+    "products": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("category_id", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("sku", ASCENDING)], unique=True, partialFilterExpression={"sku": {"$type": "string"}}),
+        IndexModel([("stock", ASCENDING)]),
+        IndexModel([("location", ASCENDING)]),
+        IndexModel([("deal_active", ASCENDING)]),
+        # Keyset pagination: every listing sort ends with the id tiebreak
+        IndexModel([("effective_price", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("created_at", DESCENDING), ("id", ASCENDING)]),
+        IndexModel([("rating", DESCENDING), ("id", ASCENDING)]),
+        IndexModel([("review_count", DESCENDING), ("id", ASCENDING)]),
+    ],
+    "explore_singapore_products": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("landmark_id", ASCENDING)]),
+        IndexModel([("sku", ASCENDING)], unique=True, partialFilterExpression={"sku": {"$type": "string"}}),
+    ],
+    "batik_products": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("sku", ASCENDING)], unique=True, partialFilterExpression={"sku": {"$type": "string"}}),
+    ],
+    "csv_imports": [
+        IndexModel([("id", ASCENDING)], unique=True),
+    ],
+    "dashboard_stats": [
+        IndexModel([("id", ASCENDING)], unique=True),
+    ],
+    "landmarks": [
+        IndexModel([("id", ASCENDING)], unique=True),
+    ],
+    "cart_items": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING), ("product_id", ASCENDING)], unique=True),
+    ],
+    "wishlist": [
+        IndexModel([("user_id", ASCENDING), ("product_id", ASCENDING)], unique=True),
+    ],
+    "reviews": [
+        IndexModel([("product_id", ASCENDING), ("created_at", DESCENDING), ("id", ASCENDING)]),
+    ],
+    "orders": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel(
+            [("idempotency_key", ASCENDING)],
+            unique=True,
+            partialFilterExpression={"idempotency_key": {"$type": "string"}}
+        ),
+    ],
+    "stock_reservations": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("status", ASCENDING), ("expires_at", ASCENDING)]),
+    ],
+    "payment_transactions": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("session_id", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING), ("payment_status", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("payment_status", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("created_at", DESCENDING), ("id", ASCENDING)]),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING), ("id", ASCENDING)]),
+    ],
+    "sales_daily": [
+        IndexModel([("day", ASCENDING)], unique=True),
+    ],
+    "sales_products_daily": [
+        IndexModel([("day", ASCENDING), ("product_id", ASCENDING)], unique=True),
+    ],
+    "sales_coupons_daily": [
+        IndexModel([("day", ASCENDING), ("code", ASCENDING)], unique=True),
+    ],
+    "deals": [
+        IndexModel([("is_live", ASCENDING)]),
+    ],
+    "cms_sections": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("page", ASCENDING), ("order", ASCENDING)]),
+    ],
+    "coupons": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("code", ASCENDING)], unique=True),
+    ],
+    "marketing_contacts": [
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    "chat_messages": [
+        IndexModel([("session_id", ASCENDING), ("created_at", ASCENDING)]),
+    ],
+}
+
+# CSV imports upsert products on sku, so it must be unique per collection
+SKU_COLLECTIONS = ("products", "explore_singapore_products", "batik_products")
+
+SKU_KEY = (("sku", 1),)
+
+def _sku_duplicates(db, collection: str):
+    """Skus shared by several products, with their _ids oldest first"""
+    return db[collection].aggregate([
+        {"$match": {"sku": {"$type": "string"}}},
+        {"$sort": {"created_at": 1, "_id": 1}},
+        {"$group": {"_id": "$sku", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ])
+
+async def duplicate_skus(db) -> Dict[str, List[str]]:
+    """{collection: [sku, ...]} for every collection where products share a sku"""
+    duplicates = {}
+    for collection in SKU_COLLECTIONS:
+        skus = [duplicate["_id"] async for duplicate in _sku_duplicates(db, collection)]
+        if skus:
+            duplicates[collection] = skus
+    return duplicates
+
+async def dedupe_skus(db) -> int:
+    """Give every product after the oldest sharing a sku a new one; returns how many were renamed.
+
+    Renaming rather than deleting keeps the duplicates' orders, reviews and
+    stock intact for an admin to merge by hand. Only run from the command line.
+    """
+    renamed = 0
+    for collection in SKU_COLLECTIONS:
+        async for duplicate in _sku_duplicates(db, collection):
+            for n, _id in enumerate(duplicate["ids"][1:], start=2):
+                await db[collection].update_one({"_id": _id}, {"$set": {"sku": f"{duplicate['_id']}-DUP{n}"}})
+                renamed += 1
+            logger.warning(f"Renamed {len(duplicate['ids']) - 1} duplicates of sku {duplicate['_id']} in {collection}")
+    return renamed
+
+async def _drop_non_unique_sku_indexes(db, collections):
+    """The unique sku index reuses the old non-unique one's name, so drop that first"""
+    for collection in collections:
+        try:
+            info = await db[collection].index_information()
+        except OperationFailure:
+            continue
+        for name, index in info.items():
+            if _spec(index) == (SKU_KEY, False):
+                await db[collection].drop_index(name)
+
+def _spec(index: dict) -> tuple:
+    """Comparable (keys, unique) signature for a declared or existing index"""
+    keys = index["key"]
+    if isinstance(keys, dict):
+        keys = keys.items()
+    keys = tuple((field, direction if isinstance(direction, str) else int(direction)) for field, direction in keys)
+    return keys, bool(index.get("unique", False))
+
+async def index_drift(db) -> dict:
+    """Compare declared indexes to the database: {collection: {"missing": [...], "unexpected": [...]}}"""
+    drift = {}
+    for collection, models in INDEXES.items():
+        declared = {_spec(model.document): model.document["name"] for model in models}
+        existing = {}
+        try:
+            info = await db[collection].index_information()
+        except OperationFailure:
+            info = {}
+        for name, index in info.items():
+            if name != "_id_":
+                existing[_spec(index)] = name
+
+        missing = [name for spec, name in declared.items() if spec not in existing]
+        unexpected = [name for spec, name in existing.items() if spec not in declared]
+        if missing or unexpected:
+            drift[collection] = {"missing": missing, "unexpected": unexpected}
+    return drift
+
+async def ensure_indexes(db, force: bool = False) -> dict:
+    """Create declared indexes if the stored index version is behind, then report drift.
+
+    A collection whose products share skus keeps its old sku index, and the
+    version is not recorded, until the duplicates are resolved (by hand or
+    with --dedupe-skus); the next start tries again.
+    """
+    state = await db.schema_migrations.find_one({"_id": "indexes"})
+    if force or not state or state.get("version", 0) < INDEX_VERSION:
+        blocked = await duplicate_skus(db)
+        for collection, skus in blocked.items():
+            logger.error(
+                f"{len(skus)} skus are shared by several products in {collection}, e.g. {', '.join(skus[:5])}; "
+                f"skipping its unique sku index until they are resolved (python db_indexes.py --dedupe-skus)"
+            )
+        await _drop_non_unique_sku_indexes(db, [c for c in SKU_COLLECTIONS if c not in blocked])
+        for collection, models in INDEXES.items():
+            if collection in blocked:
+                models = [model for model in models if _spec(model.document)[0] != SKU_KEY]
+            try:
+                await db[collection].create_indexes(models)
+            except OperationFailure as e:
+                # Usually duplicate data blocking a unique index; keep the rest of the indexes going
+                logger.error(f"Index creation failed on {collection}: {e}")
+        if not blocked:
+            await db.schema_migrations.update_one(
+                {"_id": "indexes"},
+                {"$set": {"version": INDEX_VERSION, "applied_at": datetime.now(timezone.utc).isoformat()}},
+                upsert=True
+            )
+            logger.info(f"Applied index version {INDEX_VERSION}")
+
+    drift = await index_drift(db)
+    for collection, diff in drift.items():
+        logger.warning(f"Index drift on {collection}: missing={diff['missing']} unexpected={diff['unexpected']}")
+    return drift
+
+async def main():
+    """Apply or check indexes from the command line"""
+    parser = argparse.ArgumentParser(description="Manage MongoDB indexes")
+    parser.add_argument("--check", action="store_true", help="only report drift, do not create indexes")
+    parser.add_argument("--dedupe-skus", action="store_true", help="rename duplicate product skus before creating indexes")
+    args = parser.parse_args()
+
+    from database import get_db, close
+    db = get_db()
+
+    try:
+        if args.dedupe_skus and not args.check:
+            renamed = await dedupe_skus(db)
+            print(f"✓ Renamed {renamed} products with duplicate skus")
+        drift = await index_drift(db) if args.check else await ensure_indexes(db, force=True)
+        if not drift:
+            print(f"✓ Indexes match declared version {INDEX_VERSION}")
+        for collection, diff in drift.items():
+            print(f"✗ {collection}: missing={diff['missing']} unexpected={diff['unexpected']}")
+    finally:
+        close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
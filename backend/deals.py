@@ -0,0 +1,136 @@
+"""
+Deal Scheduler
+Materializes deal state onto documents so reads never evaluate deal windows:
+
+- products (all three collections) get `deal_active` and `effective_price`,
+  the price a customer pays right now
+- deals get `is_live`, true while the deal is enabled and inside its window
+
+The scheduler wakes at the next start/end boundary (or every
+DEAL_SCHEDULER_SECONDS at most) and rewrites only documents whose state changed.
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+from pymongo import UpdateOne
+from catalog import PRODUCT_COLLECTIONS, collection_for
+from response_cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+DEAL_SCHEDULER_SECONDS = float(os.environ.get('DEAL_SCHEDULER_SECONDS', 60))
+
+PRICE_PROJECTION = {
+    "_id": 0, "id": 1, "price": 1, "sale_price": 1, "is_on_deal": 1, "deal_percentage": 1,
+    "deal_start_date": 1, "deal_end_date": 1, "deal_active": 1, "effective_price": 1,
+}
+
+def _parse(value) -> Optional[datetime]:
+    if not value:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+def _in_window(start, end, now: datetime) -> bool:
+    """Open-ended on either side when a date is missing"""
+    start, end = _parse(start), _parse(end)
+    return (start is None or start <= now) and (end is None or now <= end)
+
+def _boundaries(start, end, now: datetime):
+    return [moment for moment in (_parse(start), _parse(end)) if moment and moment > now]
+
+def deal_is_live(deal: dict, now: datetime) -> bool:
+    return bool(deal.get('is_active', True)) and _in_window(deal.get('start_date'), deal.get('end_date'), now)
+
+def price_fields(product: dict, discounts: Dict[str, float], now: datetime) -> dict:
+    """deal_active and effective_price for a product given the live deal discounts"""
+    percentage = discounts.get(product.get('id'))
+    own_deal_live = product.get('is_on_deal') and _in_window(product.get('deal_start_date'), product.get('deal_end_date'), now)
+    if own_deal_live and product.get('deal_percentage'):
+        percentage = max(percentage or 0, float(product['deal_percentage']))
+
+    price = float(product.get('price') or 0)
+    effective = float(product.get('sale_price') or price)
+    if percentage:
+        effective = min(effective, price * (1 - percentage / 100))
+    return {"deal_active": bool(percentage), "effective_price": round(effective, 2)}
+
+async def deal_discounts(db, now: Optional[datetime] = None) -> Dict[str, float]:
+    """product_id -> best discount percentage among live deals"""
+    now = now or datetime.now(timezone.utc)
+    discounts = {}
+    async for deal in db.deals.find({"is_active": True}, {"_id": 0, "product_ids": 1, "discount_percentage": 1, "start_date": 1, "end_date": 1}):
+        if deal_is_live(deal, now):
+            for product_id in deal.get('product_ids', []):
+                discounts[product_id] = max(discounts.get(product_id, 0), float(deal['discount_percentage']))
+    return discounts
+
+async def current_price_fields(db, product: dict) -> dict:
+    """Price fields for a product about to be written"""
+    return price_fields(product, await deal_discounts(db), datetime.now(timezone.utc))
+
+async def refresh_deals(db) -> Tuple[int, Optional[datetime]]:
+    """Re-materialize deal state; returns (documents changed, next start/end boundary)"""
+    now = datetime.now(timezone.utc)
+    boundaries = []
+
+    deal_updates = []
+    discounts = {}
+    async for deal in db.deals.find({}, {"_id": 0, "id": 1, "product_ids": 1, "discount_percentage": 1, "start_date": 1, "end_date": 1, "is_active": 1, "is_live": 1}):
+        live = deal_is_live(deal, now)
+        if deal.get('is_active', True):
+            boundaries += _boundaries(deal.get('start_date'), deal.get('end_date'), now)
+        if live:
+            for product_id in deal.get('product_ids', []):
+                discounts[product_id] = max(discounts.get(product_id, 0), float(deal['discount_percentage']))
+        if deal.get('is_live') != live:
+            deal_updates.append(UpdateOne({"id": deal['id']}, {"$set": {"is_live": live}}))
+    if deal_updates:
+        await db.deals.bulk_write(deal_updates, ordered=False)
+        await response_cache.invalidate("deals")
+
+    changed = len(deal_updates)
+    candidates = {"$or": [
+        {"is_on_deal": True},
+        {"deal_active": True},
+        {"id": {"$in": list(discounts)}},
+        # Never priced, e.g. written before this field existed or by a bulk import
+        {"effective_price": {"$exists": False}},
+    ]}
+    for collection_type in PRODUCT_COLLECTIONS:
+        collection = collection_for(db, collection_type)
+        updates = []
+        async for product in collection.find(candidates, PRICE_PROJECTION):
+            if product.get('is_on_deal'):
+                boundaries += _boundaries(product.get('deal_start_date'), product.get('deal_end_date'), now)
+            fields = price_fields(product, discounts, now)
+            if any(product.get(field) != value for field, value in fields.items()):
+                updates.append(UpdateOne({"id": product['id']}, {"$set": fields}))
+        if updates:
+            await collection.bulk_write(updates, ordered=False)
+            changed += len(updates)
+            await response_cache.invalidate_products([collection_type])
+
+    if changed:
+        logger.info(f"Deal scheduler updated {changed} documents")
+    return changed, min(boundaries) if boundaries else None
+
+async def run_scheduler(db):
+    """Keep deal state current, waking at the next boundary"""
+    while True:
+        delay = DEAL_SCHEDULER_SECONDS
+        try:
+            _, next_boundary = await refresh_deals(db)
+            if next_boundary:
+                until = (next_boundary - datetime.now(timezone.utc)).total_seconds()
+                delay = min(delay, max(until, 0) + 0.5)
+        except Exception as e:
+            logger.error(f"Deal scheduler run failed: {e}")
+        await asyncio.sleep(delay)
@@ -0,0 +1,140 @@
+"""
+Data Exports
+Streams products, orders and customers out as CSV or JSON Lines. Documents are
+read from the Mongo cursor a batch at a time and each batch is written to the
+response as soon as it is encoded, optionally gzipped on the fly, so memory
+stays flat however large the export is.
+"""
+
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional, Tuple
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from catalog import PRODUCT_COLLECTIONS, collection_for
+from pagination import with_tiebreak
+from search import search_index
+
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson",
+}
+
+# CSV columns; JSON Lines exports carry every stored field
+PRODUCT_COLUMNS = [
+    "id", "sku", "collection_type", "name", "slug", "category_id", "landmark_id", "price", "sale_price",
+    "effective_price", "deal_active", "stock", "sold_count", "rating", "review_count", "images", "tags",
+    "created_at", "updated_at",
+]
+ORDER_COLUMNS = [
+    "id", "session_id", "order_id", "user_id", "user_email", "is_guest", "subtotal", "discount", "amount",
+    "currency", "payment_status", "status", "cart_items", "shipping_address", "coupon", "created_at", "updated_at",
+]
+CUSTOMER_COLUMNS = ["id", "email", "name", "picture", "created_at"]
+
+# (cursor, fields added to every document it yields)
+Source = Tuple[object, dict]
+
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return value
+
+def _csv(rows: List[list]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+def _encode(batch: List[dict], columns: List[str], fmt: str) -> str:
+    if fmt == "csv":
+        return _csv([[_cell(doc.get(column)) for column in columns] for doc in batch])
+    return "".join(json.dumps(doc, default=str) + "\n" for doc in batch)
+
+async def stream_export(sources: List[Source], columns: List[str], fmt: str, compress: bool = False) -> AsyncIterator[bytes]:
+    """Yield the export one encoded batch at a time"""
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31: gzip framing
+
+    def output(text: str) -> bytes:
+        data = text.encode("utf-8")
+        return compressor.compress(data) if compressor else data
+
+    if fmt == "csv":
+        yield output(_csv([columns]))
+    for cursor, extra in sources:
+        while True:
+            batch = await cursor.to_list(length=EXPORT_BATCH_SIZE)
+            if not batch:
+                break
+            for doc in batch:
+                doc.update(extra)
+            chunk = output(_encode(batch, columns, fmt))
+            if chunk:
+                yield chunk
+    if compressor:
+        yield compressor.flush()
+
+def export_response(name: str, sources: List[Source], columns: List[str], fmt: str, compress: bool) -> StreamingResponse:
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format must be one of: {', '.join(FORMATS)}")
+    filename = f"{name}-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.{fmt}"
+    media_type = FORMATS[fmt]
+    if compress:
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        stream_export(sources, columns, fmt, compress),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+def _find(collection, query: dict, sort, projection: Optional[dict] = None):
+    return collection.find(query, projection or {"_id": 0}).sort(with_tiebreak(sort)).batch_size(EXPORT_BATCH_SIZE)
+
+def product_sources(db, collection_type: Optional[str] = None, search: Optional[str] = None, category_id: Optional[str] = None) -> List[Source]:
+    """Same filters as the admin product listing, over one collection or all of them"""
+    if collection_type and collection_type not in PRODUCT_COLLECTIONS:
+        raise HTTPException(status_code=400, detail="Invalid collection type")
+    types = [collection_type] if collection_type else list(PRODUCT_COLLECTIONS)
+
+    matches = None
+    if search:
+        matches = {t: [] for t in types}
+        for product_id, match_type, _ in search_index.search(search, types):
+            matches[match_type].append(product_id)
+
+    sources = []
+    for t in types:
+        query = {}
+        if matches is not None:
+            if not matches[t]:
+                continue
+            query["id"] = {"$in": matches[t]}
+        if category_id:
+            query["category_id"] = category_id
+        sources.append((_find(collection_for(db, t), query, []), {"collection_type": t}))
+    return sources
+
+def order_sources(db, status: Optional[str] = None) -> List[Source]:
+    """Same filters as the admin order listing"""
+    query = {"status": status} if status else {}
+    return [(_find(db.payment_transactions, query, [("created_at", -1)]), {})]
+
+def customer_sources(db, search: Optional[str] = None) -> List[Source]:
+    """Same filters as the admin customer listing"""
+    query = {"is_admin": {"$ne": True}}
+    if search:
+        query["$or"] = [
+            {"email": {"$regex": search, "$options": "i"}},
+            {"name": {"$regex": search, "$options": "i"}}
+        ]
+    return [(_find(db.users, query, [], {"_id": 0, "password_hash": 0}), {})]
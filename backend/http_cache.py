@@ -0,0 +1,88 @@
+import hashlib
+import json
+import time
+from typing import Iterable, Optional
+from fastapi import Request, Response
+from pymongo import ReturnDocument, UpdateOne
+from database import get_db
+
+# Browser/CDN freshness for catalog data; stale copies may be served while revalidating
+CATALOG_MAX_AGE = 60
+CATALOG_STALE_WHILE_REVALIDATE = 300
+
+# How long a worker trusts its last read of a collection version
+VERSION_MEMO_SECONDS = 1.0
+
+_versions = {}  # namespace -> (version, read_at)
+
+async def collection_version(namespace: str) -> int:
+    """Change counter for a cached collection, shared by all workers"""
+    memo = _versions.get(namespace)
+    if memo and time.monotonic() - memo[1] < VERSION_MEMO_SECONDS:
+        return memo[0]
+    doc = await get_db().collection_versions.find_one({"_id": namespace})
+    version = doc["version"] if doc else 0
+    _versions[namespace] = (version, time.monotonic())
+    return version
+
+async def bump_version(namespace: str):
+    """Record that a collection changed so list ETags move on"""
+    doc = await get_db().collection_versions.find_one_and_update(
+        {"_id": namespace},
+        {"$inc": {"version": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    _versions[namespace] = (doc["version"], time.monotonic())
+
+async def bump_versions(namespaces: Iterable[str]):
+    """bump_version for several namespaces in one write"""
+    namespaces = list(namespaces)
+    if not namespaces:
+        return
+    await get_db().collection_versions.bulk_write(
+        [UpdateOne({"_id": namespace}, {"$inc": {"version": 1}}, upsert=True) for namespace in namespaces],
+        ordered=False
+    )
+    for namespace in namespaces:
+        _versions.pop(namespace, None)
+
+def make_etag(*parts) -> str:
+    """Weak ETag over the given version parts"""
+    digest = hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+def document_etag(doc: dict) -> str:
+    """ETag for a single document, derived from its stored content"""
+    return make_etag(doc)
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+def conditional(
+    request: Request,
+    response: Response,
+    etag: str,
+    max_age: int = CATALOG_MAX_AGE,
+    stale_while_revalidate: int = CATALOG_STALE_WHILE_REVALIDATE
+) -> Optional[Response]:
+    """Return a 304 if the client already has this version, otherwise tag the response"""
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={max_age}, stale-while-revalidate={stale_while_revalidate}",
+    }
+    if _matches(request.headers.get("If-None-Match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,174 @@
+"""
+Inventory Reservations
+Holds stock for a checkout session from the moment it is created, so
+concurrent buyers cannot oversell a product. A hold is committed when the
+order is paid and released by the sweeper if the session is abandoned. The
+sweeper expires a hold's Stripe session before returning its stock, so a
+released hold can no longer be paid.
+"""
+
+import asyncio
+import logging
+import os
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from catalog import collection_for, find_products
+from response_cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+# How long stock stays held for an unpaid checkout session
+INVENTORY_HOLD_MINUTES = float(os.environ.get('INVENTORY_HOLD_MINUTES', 60))
+INVENTORY_SWEEP_SECONDS = float(os.environ.get('INVENTORY_SWEEP_SECONDS', 60))
+
+def _quantities(cart_items: Iterable[dict]) -> Counter:
+    quantities = Counter()
+    for item in cart_items:
+        quantity = int(item.get('quantity', 1))
+        if quantity <= 0:
+            raise HTTPException(status_code=400, detail="Quantity must be at least 1")
+        quantities[item['product_id']] += quantity
+    return quantities
+
+async def _stock_changed(items: List[dict]):
+    """Cached product lists show stock, so drop the ones these items appear in"""
+    await response_cache.invalidate_products({item['collection_type'] for item in items})
+
+async def _restock(db, items: List[dict]):
+    for item in items:
+        await collection_for(db, item['collection_type']).update_one(
+            {"id": item['product_id']},
+            {"$inc": {"stock": item['quantity']}}
+        )
+    await _stock_changed(items)
+
+async def reserve(db, cart_items: Iterable[dict], products: Optional[dict] = None) -> dict:
+    """Take stock for every cart item or none of them; raises 409 when a product runs short.
+
+    Each decrement only applies while stock covers the quantity, so two buyers
+    racing for the last unit cannot both get it.
+    """
+    quantities = _quantities(cart_items)
+    if products is None:
+        products = await find_products(db, quantities.keys())
+
+    held = []
+    for product_id, quantity in quantities.items():
+        product = products.get(product_id)
+        if not product:
+            continue
+        result = await collection_for(db, product['collection_type']).update_one(
+            {"id": product_id, "stock": {"$gte": quantity}},
+            {"$inc": {"stock": -quantity}}
+        )
+        if result.modified_count == 0:
+            await _restock(db, held)
+            raise HTTPException(status_code=409, detail=f"Insufficient stock for {product.get('name', product_id)}")
+        held.append({"product_id": product_id, "collection_type": product['collection_type'], "quantity": quantity})
+
+    now = datetime.now(timezone.utc)
+    reservation = {
+        "id": str(uuid.uuid4()),
+        "items": held,
+        "status": "held",
+        "created_at": now,
+        "expires_at": now + timedelta(minutes=INVENTORY_HOLD_MINUTES)
+    }
+    try:
+        await db.stock_reservations.insert_one(dict(reservation))
+    except Exception:
+        await _restock(db, held)
+        raise
+    await _stock_changed(held)
+    return reservation
+
+async def attach_session(db, reservation_id: str, session_id: str):
+    await db.stock_reservations.update_one({"id": reservation_id}, {"$set": {"session_id": session_id}})
+
+async def release(db, reservation_id: str) -> bool:
+    """Return a held reservation's stock. Only the caller that flips it to released restocks."""
+    reservation = await db.stock_reservations.find_one_and_update(
+        {"id": reservation_id, "status": "held"},
+        {"$set": {"status": "released", "released_at": datetime.now(timezone.utc)}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if reservation is None:
+        return False
+    await _restock(db, reservation['items'])
+    return True
+
+async def commit(db, reservation_id: str) -> bool:
+    """Make a reservation's stock decrement permanent once its order is paid.
+
+    A reservation released before it was paid takes its stock again only
+    where stock still covers it; anything short is recorded on the
+    reservation for fulfilment to sort out rather than driving stock negative.
+    """
+    reservation = await db.stock_reservations.find_one_and_update(
+        {"id": reservation_id, "status": {"$in": ["held", "released"]}},
+        {"$set": {"status": "committed", "committed_at": datetime.now(timezone.utc)}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.BEFORE
+    )
+    if reservation is None:
+        return False
+    if reservation['status'] == "released":
+        # Paid after the hold lapsed (only possible if its session was never expired)
+        logger.warning(f"Reservation {reservation_id} was paid after it was released")
+        taken, shortfall = [], []
+        for item in reservation['items']:
+            result = await collection_for(db, item['collection_type']).update_one(
+                {"id": item['product_id'], "stock": {"$gte": item['quantity']}},
+                {"$inc": {"stock": -item['quantity']}}
+            )
+            (taken if result.modified_count else shortfall).append(item)
+        if shortfall:
+            logger.error(f"Reservation {reservation_id} is short of stock for {[item['product_id'] for item in shortfall]}")
+            await db.stock_reservations.update_one({"id": reservation_id}, {"$set": {"shortfall": shortfall}})
+        if taken:
+            await _stock_changed(taken)
+    return True
+
+async def _expire_session(db, reservation: dict, gateway) -> bool:
+    """Close the hold's checkout session; False if it must stay held"""
+    if gateway is None or not reservation.get('session_id'):
+        return True
+    try:
+        expired = await gateway.expire_session(reservation['session_id'])
+    except Exception as e:
+        logger.error(f"Could not expire checkout session {reservation['session_id']}, keeping its hold: {e}")
+        return False
+    if not expired:
+        # Paid while the hold lapsed; keep the stock until the payment is committed
+        await db.stock_reservations.update_one(
+            {"id": reservation['id'], "status": "held"},
+            {"$set": {"expires_at": datetime.now(timezone.utc) + timedelta(minutes=INVENTORY_HOLD_MINUTES)}}
+        )
+    return expired
+
+async def release_expired(db, gateway=None) -> int:
+    """Release every hold whose session was abandoned, expiring the session first"""
+    released = 0
+    now = datetime.now(timezone.utc)
+    async for reservation in db.stock_reservations.find({"status": "held", "expires_at": {"$lte": now}}, {"_id": 0, "id": 1, "session_id": 1}):
+        if not await _expire_session(db, reservation, gateway):
+            continue
+        if await release(db, reservation['id']):
+            released += 1
+    if released:
+        logger.info(f"Released {released} expired stock reservations")
+    return released
+
+async def run_sweeper(db, gateway=None):
+    """Periodically release expired holds"""
+    while True:
+        try:
+            await release_expired(db, gateway)
+        except Exception as e:
+            logger.error(f"Stock reservation sweep failed: {e}")
+        await asyncio.sleep(INVENTORY_SWEEP_SECONDS)
@@ -0,0 +1,231 @@
+"""
+Background Jobs
+Durable queue in the jobs collection for work that should not hold up a
+request. Jobs survive restarts: a job whose worker died is picked up again
+once its lease runs out.
+
+    await job_queue.enqueue(db, "clear_cart", {"user_id": ...}, key=f"clear_cart:{order_id}")
+
+    @job_queue.handler("clear_cart")
+    async def clear_cart(db, payload): ...
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', 1))
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', 60))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+JOB_BACKOFF_SECONDS = 2.0
+JOB_MAX_BACKOFF_SECONDS = 600.0
+# Finished jobs are kept this long for inspection; dead jobs are kept until retried
+JOB_RETENTION = timedelta(days=7)
+
+LATENCY_SAMPLES = 500
+
+Handler = Callable[[object, dict], Awaitable[None]]
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def _aware(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+def _percentile_ms(samples, p: float):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 1)
+
+class JobQueue:
+    """Mongo-backed job queue with leased claims, exponential backoff and a dead-letter state.
+
+    Jobs move queued -> running -> done, or back to queued with a delay when
+    the handler fails, and to dead once max_attempts is used up.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, Handler] = {}
+        self._wakeup = asyncio.Event()
+        self.processed = 0
+        self.failed = 0
+        self.dead = 0
+        self._latency = deque(maxlen=LATENCY_SAMPLES)  # enqueue -> finished
+        self._run_time = deque(maxlen=LATENCY_SAMPLES)
+
+    def handler(self, job_type: str):
+        """Register the coroutine that runs jobs of this type"""
+        def register(fn: Handler) -> Handler:
+            self._handlers[job_type] = fn
+            return fn
+        return register
+
+    @staticmethod
+    def _job(job_type: str, payload: dict, key: Optional[str], max_attempts: int, delay: float) -> dict:
+        now = _now()
+        job = {
+            "id": str(uuid.uuid4()),
+            "type": job_type,
+            "payload": payload,
+            "status": "queued",
+            "attempts": 0,
+            "max_attempts": max_attempts,
+            "run_at": now + timedelta(seconds=delay),
+            "created_at": now,
+        }
+        if key:
+            job["key"] = key
+        return job
+
+    async def enqueue(
+        self,
+        db,
+        job_type: str,
+        payload: dict,
+        key: Optional[str] = None,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        delay: float = 0
+    ) -> bool:
+        """Queue a job. With a key, a job already queued under that key is not queued again."""
+        try:
+            await db.jobs.insert_one(self._job(job_type, payload, key, max_attempts, delay))
+        except DuplicateKeyError:
+            return False
+        self._wakeup.set()
+        return True
+
+    async def enqueue_many(self, db, jobs: List[tuple]) -> int:
+        """Queue several (job_type, payload, key) jobs in one write, skipping duplicate keys"""
+        docs = [self._job(job_type, payload, key, JOB_MAX_ATTEMPTS, 0) for job_type, payload, key in jobs]
+        if not docs:
+            return 0
+        try:
+            result = await db.jobs.insert_many(docs, ordered=False)
+            inserted = len(result.inserted_ids)
+        except BulkWriteError as e:
+            inserted = e.details.get("nInserted", 0)
+        self._wakeup.set()
+        return inserted
+
+    async def _claim(self, db) -> Optional[dict]:
+        now = _now()
+        return await db.jobs.find_one_and_update(
+            {"$or": [
+                {"status": "queued", "run_at": {"$lte": now}},
+                # Lease ran out: the worker holding it died
+                {"status": "running", "locked_until": {"$lte": now}},
+            ]},
+            {
+                "$set": {"status": "running", "started_at": now, "locked_until": now + timedelta(seconds=JOB_LEASE_SECONDS)},
+                "$inc": {"attempts": 1}
+            },
+            sort=[("run_at", 1)],
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _run(self, db, job: dict):
+        handler = self._handlers.get(job["type"])
+        started = time.perf_counter()
+        try:
+            if handler is None:
+                raise RuntimeError(f"No handler registered for job type {job['type']}")
+            await handler(db, job["payload"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            await self._fail(db, job, e)
+            return
+        finally:
+            self._run_time.append(time.perf_counter() - started)
+
+        finished = _now()
+        self.processed += 1
+        self._latency.append((finished - _aware(job["created_at"])).total_seconds())
+        await db.jobs.update_one(
+            {"id": job["id"]},
+            {"$set": {"status": "done", "finished_at": finished, "expires_at": finished + JOB_RETENTION},
+             "$unset": {"locked_until": ""}}
+        )
+
+    async def _fail(self, db, job: dict, error: Exception):
+        error_text = f"{error.__class__.__name__}: {error}"
+        if job["attempts"] >= job["max_attempts"]:
+            self.dead += 1
+            logger.error(f"Job {job['id']} ({job['type']}) is dead after {job['attempts']} attempts: {error_text}")
+            update = {"status": "dead", "finished_at": _now(), "last_error": error_text}
+        else:
+            backoff = min(JOB_MAX_BACKOFF_SECONDS, JOB_BACKOFF_SECONDS * 2 ** (job["attempts"] - 1))
+            delay = random.uniform(backoff / 2, backoff)
+            logger.warning(f"Job {job['id']} ({job['type']}) failed, retrying in {delay:.1f}s: {error_text}")
+            update = {"status": "queued", "run_at": _now() + timedelta(seconds=delay), "last_error": error_text}
+        await db.jobs.update_one({"id": job["id"]}, {"$set": update, "$unset": {"locked_until": ""}})
+
+    async def run_worker(self, db):
+        """Claim and run jobs until cancelled"""
+        while True:
+            try:
+                job = await self._claim(db)
+            except Exception as e:
+                logger.error(f"Job claim failed: {e}")
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._run(db, job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job {job['id']} bookkeeping failed: {e}")
+
+    async def retry(self, db, job_id: str) -> bool:
+        """Requeue a dead job with a fresh set of attempts"""
+        result = await db.jobs.update_one(
+            {"id": job_id, "status": "dead"},
+            {"$set": {"status": "queued", "attempts": 0, "run_at": _now()}, "$unset": {"finished_at": ""}}
+        )
+        if result.modified_count:
+            self._wakeup.set()
+        return bool(result.modified_count)
+
+    async def stats(self, db) -> dict:
+        counts = {doc["_id"]: doc["count"] async for doc in db.jobs.aggregate([
+            {"$match": {"status": {"$in": ["queued", "running", "dead"]}}},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+        ])}
+        oldest = await db.jobs.find_one({"status": "queued"}, {"_id": 0, "run_at": 1}, sort=[("run_at", 1)])
+        return {
+            "workers": JOB_WORKERS,
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "dead": counts.get("dead", 0),
+            "oldest_queued_age_seconds": round(max(0.0, (_now() - _aware(oldest["run_at"])).total_seconds()), 1) if oldest else 0.0,
+            "processed": self.processed,
+            "failed_attempts": self.failed,
+            "dead_lettered": self.dead,
+            "latency_p50_ms": _percentile_ms(self._latency, 0.50),
+            "latency_p95_ms": _percentile_ms(self._latency, 0.95),
+            "run_p95_ms": _percentile_ms(self._run_time, 0.95),
+        }
+
+job_queue = JobQueue()
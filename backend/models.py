@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime, timezone
 import uuid
 
@@ -63,6 +63,8 @@ class Product(BaseModel):
     deal_percentage: Optional[float] = None  # Deal discount percentage
     deal_start_date: Optional[datetime] = None  # Deal start date
     deal_end_date: Optional[datetime] = None  # Deal end date
+    deal_active: bool = False  # Maintained by the deal scheduler
+    effective_price: Optional[float] = None  # Price after sale and live deals; maintained by the deal scheduler
     rating: float = 0.0
     review_count: int = 0
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -108,6 +110,7 @@ class Order(BaseModel):
     status: str = "pending"  # pending, processing, shipped, delivered, cancelled
     shipping_address: dict
     payment_method: str
+    idempotency_key: Optional[str] = None  # e.g. "stripe:<session_id>"; unique when set
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -133,6 +136,12 @@ class ReviewCreate(BaseModel):
     rating: int
     comment: str
 
+class ReviewSummary(BaseModel):
+    product_id: str
+    average_rating: float
+    review_count: int
+    histogram: Dict[str, int]  # "1".."5" -> number of reviews
+
 # Deal Models
 class Deal(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -0,0 +1,209 @@
+"""
+Order Finalization
+Turns a paid checkout transaction into exactly one order, whichever of the
+Stripe webhook and the status poll gets there first, and queues the order's
+side effects (cart, email, stock commit, sales, dashboard and report stats)
+as background jobs.
+"""
+
+import logging
+import uuid
+from datetime import datetime, timezone
+from collections import Counter
+from typing import Optional
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from models import Order
+from email_utils import send_order_confirmation_email
+from catalog import collection_for, find_products
+from jobs import job_queue
+from response_cache import response_cache
+from recording import record_once
+import inventory
+import dashboard
+import reports
+
+logger = logging.getLogger(__name__)
+
+def idempotency_key(session_id: str) -> str:
+    return f"stripe:{session_id}"
+
+async def enqueue_order_jobs(db, order_id: str, transaction: dict) -> int:
+    """Queue the post-payment work for an order; safe to call again for the same order"""
+    items = [
+        {"product_id": item['product_id'], "quantity": int(item.get('quantity', 1))}
+        for item in transaction['cart_items']
+    ]
+    if transaction.get('reservation_id'):
+        stock_job = ("commit_stock", {"reservation_id": transaction['reservation_id']}, f"commit_stock:{order_id}")
+    else:
+        stock_job = ("decrement_stock", {"order_id": order_id, "items": items}, f"decrement_stock:{order_id}")
+    return await job_queue.enqueue_many(db, [
+        ("clear_cart", {"user_id": transaction['user_id']}, f"clear_cart:{order_id}"),
+        ("order_confirmation_email", {
+            "email": transaction['user_email'],
+            "order_id": order_id,
+            "amount": transaction['amount'],
+            "currency": transaction['currency']
+        }, f"order_confirmation_email:{order_id}"),
+        stock_job,
+        ("record_sales", {"order_id": order_id, "items": items}, f"record_sales:{order_id}"),
+        ("record_dashboard", {"session_id": transaction['session_id']}, f"record_dashboard:{order_id}"),
+        ("record_report", {"session_id": transaction['session_id']}, f"record_report:{order_id}"),
+    ])
+
+def completed_status(transaction: dict) -> dict:
+    """Status response for a paid transaction"""
+    status = {
+        "status": "completed",
+        "payment_status": "paid",
+        "amount": transaction['amount'],
+        "currency": transaction['currency'].lower()
+    }
+    if transaction.get('order_id'):
+        status["order_id"] = transaction['order_id']
+    return status
+
+def transaction_status(transaction: dict) -> dict:
+    """Status response from what the transaction record says"""
+    if transaction['payment_status'] == "paid":
+        return completed_status(transaction)
+    return {
+        "status": transaction.get('status'),
+        "payment_status": transaction['payment_status'],
+        "amount": transaction['amount'],
+        "currency": transaction['currency'].lower()
+    }
+
+async def finalize_checkout(db, session_id: str) -> Optional[dict]:
+    """Create the order for a paid checkout session, at most once.
+
+    The caller that wins the conditional claim on the transaction inserts the
+    order and queues its side effects; every other caller just reads the result,
+    so repeated polls and webhook retries cost two queries each. Only this
+    claim marks a transaction paid, so an unpaid transaction has no order yet
+    whatever else has been written to it.
+    """
+    order_id = str(uuid.uuid4())
+    now = datetime.now(timezone.utc).isoformat()
+    claimed = {
+        "payment_status": "paid",
+        "status": "completed",
+        "order_id": order_id,
+        "finalized_at": now,
+        "updated_at": now
+    }
+    previous = await db.payment_transactions.find_one_and_update(
+        {"session_id": session_id, "order_id": {"$exists": False}, "payment_status": {"$ne": "paid"}},
+        {"$set": claimed},
+        projection={"_id": 0},
+        return_document=ReturnDocument.BEFORE
+    )
+    if previous is None:
+        # Already finalized by another request (or unknown)
+        transaction = await db.payment_transactions.find_one({"session_id": session_id}, {"_id": 0})
+        return transaction_status(transaction) if transaction else None
+    transaction = {**previous, **claimed}
+
+    order = Order(
+        id=order_id,
+        idempotency_key=idempotency_key(session_id),
+        user_id=transaction['user_id'],
+        items=transaction['cart_items'],
+        total_amount=transaction['amount'],
+        shipping_address=transaction['shipping_address'],
+        payment_method="stripe",
+        payment_status="paid"
+    )
+    order_dict = order.model_dump()
+    order_dict['created_at'] = order_dict['created_at'].isoformat()
+    order_dict['updated_at'] = order_dict['updated_at'].isoformat()
+    try:
+        await db.orders.insert_one(order_dict)
+    except DuplicateKeyError:
+        # An earlier attempt inserted the order but lost its claim: point the transaction at it
+        existing = await db.orders.find_one({"idempotency_key": order.idempotency_key}, {"_id": 0, "id": 1})
+        logger.warning(f"Order for checkout {session_id} already exists")
+        await db.payment_transactions.update_one({"session_id": session_id}, {"$set": {"order_id": existing['id']}})
+        transaction['order_id'] = existing['id']
+        # The earlier attempt may not have got as far as queueing the side effects
+        await enqueue_order_jobs(db, existing['id'], transaction)
+        return completed_status(transaction)
+    except Exception:
+        # Release the claim so the next poll or webhook retry can finalize
+        restore = {field: previous[field] for field in claimed if field in previous}
+        release = {"$unset": {field: "" for field in claimed if field not in previous}}
+        if restore:
+            release["$set"] = restore
+        await db.payment_transactions.update_one({"session_id": session_id, "order_id": order_id}, release)
+        raise
+
+    await enqueue_order_jobs(db, order.id, transaction)
+    return completed_status(transaction)
+
+# ============== ORDER JOBS ==============
+
+async def _update_products(db, items: list, update, order_id: Optional[str] = None, marker: Optional[str] = None) -> None:
+    """Apply update(quantity) to each item's product in its owning collection.
+
+    With an order_id, each product is claimed under the order's marker field
+    first, so a job that runs again (after a failure part way through, or a
+    lease that ran out) skips the products an earlier run already updated.
+    """
+    quantities = Counter()
+    for item in items:
+        quantities[item['product_id']] += item['quantity']
+    products = await find_products(db, quantities)
+
+    touched = set()
+    for product_id, quantity in quantities.items():
+        product = products.get(product_id)
+        if not product:
+            continue
+        if order_id:
+            claim = await db.orders.update_one({"id": order_id, marker: {"$ne": product_id}}, {"$addToSet": {marker: product_id}})
+            if not claim.modified_count:
+                if not await db.orders.find_one({"id": order_id}, {"_id": 1}):
+                    raise RuntimeError(f"Order {order_id} not found")
+                continue
+        try:
+            await collection_for(db, product['collection_type']).update_one({"id": product_id}, update(quantity))
+        except Exception:
+            if order_id:
+                await db.orders.update_one({"id": order_id}, {"$pull": {marker: product_id}})
+            raise
+        touched.add(product['collection_type'])
+    await response_cache.invalidate_products(touched)
+
+@job_queue.handler("clear_cart")
+async def clear_cart_job(db, payload: dict):
+    await db.cart_items.delete_many({"user_id": payload['user_id']})
+
+@job_queue.handler("order_confirmation_email")
+async def order_confirmation_email_job(db, payload: dict):
+    await send_order_confirmation_email(payload['email'], payload['order_id'], payload['amount'], payload['currency'])
+
+@job_queue.handler("commit_stock")
+async def commit_stock_job(db, payload: dict):
+    await inventory.commit(db, payload['reservation_id'])
+    await dashboard.refresh_low_stock(db)
+
+@job_queue.handler("decrement_stock")
+async def decrement_stock_job(db, payload: dict):
+    # Checkouts from before stock reservations: never below zero, since nothing held the stock
+    await _update_products(db, payload['items'], lambda quantity: [
+        {"$set": {"stock": {"$max": [0, {"$subtract": [{"$ifNull": ["$stock", 0]}, quantity]}]}}}
+    ], payload.get('order_id'), "stock_applied")
+    await dashboard.refresh_low_stock(db)
+
+@job_queue.handler("record_sales")
+async def record_sales_job(db, payload: dict):
+    await _update_products(db, payload['items'], lambda quantity: {"$inc": {"sold_count": quantity}}, payload.get('order_id'), "sales_applied")
+
+@job_queue.handler("record_dashboard")
+async def record_dashboard_job(db, payload: dict):
+    await record_once(db, payload['session_id'], dashboard.RECORDED, dashboard.record_order)
+
+@job_queue.handler("record_report")
+async def record_report_job(db, payload: dict):
+    await record_once(db, payload['session_id'], reports.RECORDED, reports.record_order)
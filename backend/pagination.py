@@ -0,0 +1,117 @@
+import base64
+import json
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from fastapi import HTTPException
+
+COUNT_CACHE_TTL_SECONDS = 30
+COUNT_CACHE_SIZE = 1000
+
+def encode_cursor(sort: List[Tuple[str, int]], doc: dict) -> str:
+    """Opaque cursor holding the sort key values of the last document on a page"""
+    payload = {"s": [field for field, _ in sort], "v": [doc.get(field) for field, _ in sort]}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort: List[Tuple[str, int]]) -> list:
+    """Sort key values from a cursor, rejecting cursors minted for a different sort"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        fields, values = payload["s"], payload["v"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if fields != [field for field, _ in sort] or len(values) != len(sort):
+        raise HTTPException(status_code=400, detail="Cursor does not match sort order")
+    return values
+
+def _after(field: str, direction: int, value) -> Optional[dict]:
+    """Condition for values strictly after value; null and missing sort lowest, as in Mongo"""
+    if value is None:
+        # Nothing sorts below null, so descending there is nothing after it
+        return {field: {"$ne": None}} if direction == 1 else None
+    if direction == 1:
+        return {field: {"$gt": value}}
+    # $lt never matches null or missing, which come last in a descending sort
+    return {"$or": [{field: {"$lt": value}}, {field: None}]}
+
+def keyset_filter(sort: List[Tuple[str, int]], values: list) -> dict:
+    """Filter for documents strictly after the cursor position in the given sort"""
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        after = _after(field, direction, values[i])
+        if after is None:
+            continue
+        clause = {sort[j][0]: values[j] for j in range(i)}
+        clause.update(after)
+        clauses.append(clause)
+    return {"$or": clauses}
+
+def with_tiebreak(sort: List[Tuple[str, int]]) -> List[Tuple[str, int]]:
+    """Append the unique id so every sort is a total order"""
+    if any(field == "id" for field, _ in sort):
+        return list(sort)
+    return list(sort) + [("id", 1)]
+
+async def fetch_page(
+    collection,
+    query: dict,
+    sort: List[Tuple[str, int]],
+    limit: int,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    projection: Optional[dict] = None
+) -> Tuple[list, Optional[str]]:
+    """One page of documents plus the cursor for the next page (None on the last page).
+
+    With a cursor the page starts right after it, so deep pages cost the same as
+    the first. Without one, skip is honoured for older clients.
+    """
+    sort = with_tiebreak(sort)
+    if cursor:
+        after = keyset_filter(sort, decode_cursor(cursor, sort))
+        query = {"$and": [query, after]} if query else after
+        skip = 0
+
+    find = collection.find(query, projection or {"_id": 0}).sort(sort)
+    if skip:
+        find = find.skip(skip)
+    docs = await find.limit(limit + 1).to_list(length=limit + 1)
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(sort, docs[-1])
+    return docs, next_cursor
+
+_count_cache = {}
+
+async def cached_count(collection, query: dict) -> int:
+    """Total for a listing: estimated for unfiltered queries, otherwise counted and cached briefly"""
+    if not query:
+        return await collection.estimated_document_count()
+
+    key = (collection.name, json.dumps(query, sort_keys=True, default=str))
+    hit = _count_cache.get(key)
+    now = time.monotonic()
+    if hit and hit[1] > now:
+        return hit[0]
+
+    total = await collection.count_documents(query)
+    if len(_count_cache) >= COUNT_CACHE_SIZE:
+        _count_cache.clear()
+    _count_cache[key] = (total, now + COUNT_CACHE_TTL_SECONDS)
+    return total
+
+async def count_by(collection, field: str, values: Iterable, match: Optional[dict] = None) -> Dict[object, int]:
+    """Count documents per value of field in one $group, for the values on a page (missing values count 0)"""
+    values = list(values)
+    if not values:
+        return {}
+    counts = {value: 0 for value in values}
+    pipeline = [
+        {"$match": {**(match or {}), field: {"$in": values}}},
+        {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+    ]
+    async for doc in collection.aggregate(pipeline):
+        counts[doc["_id"]] = doc["count"]
+    return counts
@@ -0,0 +1,147 @@
+import json
+import os
+import uuid
+from dataclasses import dataclass, field
+from typing import Optional
+import requests
+import stripe
+from fastapi import Request
+from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionRequest
+
+STRIPE_API_KEY = os.environ.get('STRIPE_API_KEY')
+# Public URL Stripe posts webhooks to; derived from the first request when unset
+STRIPE_WEBHOOK_URL = os.environ.get('STRIPE_WEBHOOK_URL')
+STRIPE_CONNECT_TIMEOUT = float(os.environ.get('STRIPE_CONNECT_TIMEOUT', 5))
+STRIPE_TIMEOUT = float(os.environ.get('STRIPE_TIMEOUT', 20))
+STRIPE_MAX_RETRIES = int(os.environ.get('STRIPE_MAX_RETRIES', 2))
+
+# 'stripe' in production; 'fake' completes payments in-process for load tests
+PAYMENT_GATEWAY = os.environ.get('PAYMENT_GATEWAY', 'stripe')
+
+class StripeGateway:
+    """App-scoped Stripe checkout client.
+
+    One StripeCheckout is built on first use and kept for the life of the
+    process, and the Stripe SDK is pointed at pooled HTTP clients with
+    explicit timeouts, so connections stay warm between checkouts.
+    """
+
+    name = "stripe"
+
+    def __init__(self, api_key: str = STRIPE_API_KEY, webhook_url: Optional[str] = STRIPE_WEBHOOK_URL):
+        self.api_key = api_key
+        self.webhook_url = webhook_url
+        self._checkout: Optional[StripeCheckout] = None
+
+        stripe.max_network_retries = STRIPE_MAX_RETRIES
+        stripe.default_http_client = stripe.RequestsClient(
+            timeout=(STRIPE_CONNECT_TIMEOUT, STRIPE_TIMEOUT),
+            session=requests.Session(),
+            async_fallback_client=stripe.HTTPXClient(timeout=STRIPE_TIMEOUT)
+        )
+
+    def bind(self, request: Request):
+        """Fix the webhook URL from the first request if it was not configured"""
+        if self.webhook_url is None:
+            self.webhook_url = f"{request.base_url}api/webhook/stripe"
+
+    @property
+    def checkout(self) -> StripeCheckout:
+        if self._checkout is None:
+            self._checkout = StripeCheckout(api_key=self.api_key, webhook_url=self.webhook_url)
+        return self._checkout
+
+    async def create_checkout_session(self, session_request: CheckoutSessionRequest):
+        return await self.checkout.create_checkout_session(session_request)
+
+    async def get_checkout_status(self, session_id: str):
+        return await self.checkout.get_checkout_status(session_id)
+
+    async def handle_webhook(self, body: bytes, signature: Optional[str]):
+        return await self.checkout.handle_webhook(body, signature)
+
+    async def expire_session(self, session_id: str) -> bool:
+        """Close an open session so it can no longer be paid; False if it was already paid"""
+        try:
+            await stripe.checkout.Session.expire_async(session_id, api_key=self.api_key)
+            return True
+        except stripe.InvalidRequestError:
+            # Only open sessions can be expired
+            session = await stripe.checkout.Session.retrieve_async(session_id, api_key=self.api_key)
+            return session.status == "expired"
+
+@dataclass
+class FakeSession:
+    session_id: str
+    url: str
+
+@dataclass
+class FakeStatus:
+    status: str
+    payment_status: str
+    amount_total: int
+    currency: str
+    metadata: dict = field(default_factory=dict)
+
+@dataclass
+class FakeWebhookEvent:
+    event_type: str
+    event_id: str
+    session_id: str
+    payment_status: str
+    metadata: dict = field(default_factory=dict)
+
+class FakeGateway:
+    """In-process gateway for load tests: every session is paid as soon as it is created.
+
+    Webhooks are unsigned JSON bodies: {"type", "session_id", "payment_status"}.
+    """
+
+    name = "fake"
+
+    def __init__(self):
+        self.sessions = {}
+
+    def bind(self, request: Request):
+        pass
+
+    async def create_checkout_session(self, session_request: CheckoutSessionRequest):
+        session_id = f"cs_fake_{uuid.uuid4().hex}"
+        self.sessions[session_id] = FakeStatus(
+            status="complete",
+            payment_status="paid",
+            amount_total=int(round(session_request.amount * 100)),
+            currency=session_request.currency,
+            metadata=dict(session_request.metadata or {})
+        )
+        url = session_request.success_url.replace("{CHECKOUT_SESSION_ID}", session_id)
+        return FakeSession(session_id=session_id, url=url)
+
+    async def get_checkout_status(self, session_id: str):
+        status = self.sessions.get(session_id)
+        if status is None:
+            return FakeStatus(status="expired", payment_status="unpaid", amount_total=0, currency="sgd")
+        return status
+
+    async def expire_session(self, session_id: str) -> bool:
+        status = self.sessions.get(session_id)
+        if status is not None and status.payment_status == "paid":
+            return False
+        self.sessions[session_id] = FakeStatus(status="expired", payment_status="unpaid", amount_total=0, currency="sgd")
+        return True
+
+    async def handle_webhook(self, body: bytes, signature: Optional[str]):
+        event = json.loads(body)
+        return FakeWebhookEvent(
+            event_type=event["type"],
+            event_id=event.get("id", f"evt_fake_{uuid.uuid4().hex}"),
+            session_id=event["session_id"],
+            payment_status=event.get("payment_status", "paid")
+        )
+
+payment_gateway = FakeGateway() if PAYMENT_GATEWAY == 'fake' else StripeGateway()
+
+def get_payment_gateway(request: Request):
+    """FastAPI dependency for the app-scoped payment gateway"""
+    payment_gateway.bind(request)
+    return payment_gateway
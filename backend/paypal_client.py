@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import Optional
+from urllib.parse import parse_qsl
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# PayPal Classic NVP API Configuration
+PAYPAL_MODE = os.environ.get("PAYPAL_MODE", "live")
+PAYPAL_API_ENDPOINT = os.environ.get(
+    "PAYPAL_NVP_ENDPOINT",
+    "https://api-3t.paypal.com/nvp" if PAYPAL_MODE == "live" else "https://api-3t.sandbox.paypal.com/nvp"
+)
+PAYPAL_USER = os.environ.get("PAYPAL_CLIENT_ID")  # API Username
+PAYPAL_PWD = os.environ.get("PAYPAL_CLIENT_SECRET")  # API Password
+PAYPAL_SIGNATURE = os.environ.get("PAYPAL_SIGNATURE")
+PAYPAL_VERSION = "204"
+
+PAYPAL_CONNECT_TIMEOUT = float(os.environ.get("PAYPAL_CONNECT_TIMEOUT", 3))
+PAYPAL_TIMEOUT = float(os.environ.get("PAYPAL_TIMEOUT", 15))
+PAYPAL_MAX_CONNECTIONS = int(os.environ.get("PAYPAL_MAX_CONNECTIONS", 20))
+PAYPAL_MAX_RETRIES = int(os.environ.get("PAYPAL_MAX_RETRIES", 2))
+PAYPAL_RETRY_BASE_SECONDS = 0.2
+
+# Read-only calls that are safe to send again after any failure
+IDEMPOTENT_METHODS = {"GetExpressCheckoutDetails", "GetTransactionDetails"}
+
+LATENCY_SAMPLES = 500
+
+class PayPalUnavailable(Exception):
+    """PayPal could not be reached or kept failing after retries"""
+
+class _MethodStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def snapshot(self) -> dict:
+        samples = sorted(self.latencies)
+
+        def percentile(p):
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 1) if samples else None
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "max_ms": round(samples[-1] * 1000, 1) if samples else None,
+        }
+
+class PayPalClient:
+    """Async NVP client sharing one pool of keep-alive connections.
+
+    Idempotent lookups are retried on any transport error or 5xx; calls that
+    move money are only retried when the connection was never established,
+    so a payment is never submitted twice.
+    """
+
+    def __init__(self, endpoint: str = PAYPAL_API_ENDPOINT, max_retries: int = PAYPAL_MAX_RETRIES):
+        self.endpoint = endpoint
+        self.max_retries = max_retries
+        self._client: Optional[httpx.AsyncClient] = None
+        self._stats = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(PAYPAL_TIMEOUT, connect=PAYPAL_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=PAYPAL_MAX_CONNECTIONS,
+                    max_keepalive_connections=PAYPAL_MAX_CONNECTIONS
+                )
+            )
+        return self._client
+
+    def _method_stats(self, method: str) -> _MethodStats:
+        return self._stats.setdefault(method, _MethodStats())
+
+    @staticmethod
+    def _retryable(method: str, error: Exception) -> bool:
+        if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+            return True
+        return method in IDEMPOTENT_METHODS
+
+    async def call(self, method: str, params: dict) -> dict:
+        """Make PayPal NVP API call and return the parsed response fields"""
+        payload = {
+            'METHOD': method,
+            'USER': PAYPAL_USER,
+            'PWD': PAYPAL_PWD,
+            'SIGNATURE': PAYPAL_SIGNATURE,
+            'VERSION': PAYPAL_VERSION,
+        }
+        payload.update(params)
+        stats = self._method_stats(method)
+
+        attempt = 0
+        while True:
+            stats.calls += 1
+            started = time.perf_counter()
+            try:
+                response = await self.client.post(self.endpoint, data=payload)
+                response.raise_for_status()
+                stats.latencies.append(time.perf_counter() - started)
+                return dict(parse_qsl(response.text, keep_blank_values=True))
+            except httpx.HTTPError as e:
+                stats.latencies.append(time.perf_counter() - started)
+                stats.errors += 1
+                if isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500:
+                    raise PayPalUnavailable(f"PayPal {method} rejected with HTTP {e.response.status_code}")
+                if attempt >= self.max_retries or not self._retryable(method, e):
+                    logger.error(f"PayPal {method} failed after {attempt + 1} attempt(s): {e!r}")
+                    raise PayPalUnavailable(f"PayPal {method} failed: {e.__class__.__name__}")
+
+            attempt += 1
+            stats.retries += 1
+            # Full jitter keeps retries from many requests from arriving together
+            await asyncio.sleep(random.uniform(0, PAYPAL_RETRY_BASE_SECONDS * 2 ** attempt))
+
+    def stats(self) -> dict:
+        return {
+            "endpoint": self.endpoint,
+            "methods": {method: stats.snapshot() for method, stats in self._stats.items()},
+        }
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+paypal_client = PayPalClient()
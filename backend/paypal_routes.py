@@ -1,43 +1,12 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
-import requests
 import os
 from datetime import datetime, timezone
 from typing import Optional
-from urllib.parse import urlencode, parse_qs
-
-# PayPal Classic NVP API Configuration
-PAYPAL_MODE = os.environ.get("PAYPAL_MODE", "live")
-PAYPAL_API_ENDPOINT = "https://api-3t.paypal.com/nvp" if PAYPAL_MODE == "live" else "https://api-3t.sandbox.paypal.com/nvp"
-PAYPAL_USER = os.environ.get("PAYPAL_CLIENT_ID")  # API Username
-PAYPAL_PWD = os.environ.get("PAYPAL_CLIENT_SECRET")  # API Password
-PAYPAL_SIGNATURE = os.environ.get("PAYPAL_SIGNATURE")
-PAYPAL_VERSION = "204"
+from paypal_client import paypal_client, PayPalUnavailable, PAYPAL_MODE
 
 paypal_router = APIRouter()
 
-def paypal_nvp_call(method: str, params: dict) -> dict:
-    """Make PayPal NVP API call"""
-    payload = {
-        'METHOD': method,
-        'USER': PAYPAL_USER,
-        'PWD': PAYPAL_PWD,
-        'SIGNATURE': PAYPAL_SIGNATURE,
-        'VERSION': PAYPAL_VERSION,
-    }
-    payload.update(params)
-    
-    response = requests.post(PAYPAL_API_ENDPOINT, data=payload)
-    
-    # Parse NVP response
-    response_dict = {}
-    for pair in response.text.split('&'):
-        if '=' in pair:
-            key, value = pair.split('=', 1)
-            response_dict[key] = requests.utils.unquote(value)
-    
-    return response_dict
-
 class PayPalOrderCreate(BaseModel):
     amount: float
     currency: str = "SGD"
@@ -72,7 +41,7 @@ async def create_paypal_payment(order_data: PayPalOrderCreate):
             **item_params
         }
         
-        response = paypal_nvp_call('SetExpressCheckout', params)
+        response = await paypal_client.call('SetExpressCheckout', params)
         
         if response.get('ACK') in ['Success', 'SuccessWithWarning']:
             token = response.get('TOKEN')
@@ -92,6 +61,8 @@ async def create_paypal_payment(order_data: PayPalOrderCreate):
 
     except HTTPException:
         raise
+    except PayPalUnavailable as e:
+        raise HTTPException(status_code=502, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"PayPal payment creation failed: {str(e)}")
 
@@ -104,7 +75,7 @@ async def execute_paypal_payment(payment_data: PayPalOrderCapture):
         details_params = {
             'TOKEN': payment_data.paymentID
         }
-        details_response = paypal_nvp_call('GetExpressCheckoutDetails', details_params)
+        details_response = await paypal_client.call('GetExpressCheckoutDetails', details_params)
         
         if details_response.get('ACK') not in ['Success', 'SuccessWithWarning']:
             error_msg = details_response.get('L_LONGMESSAGE0', 'Failed to get payment details')
@@ -119,7 +90,7 @@ async def execute_paypal_payment(payment_data: PayPalOrderCapture):
             'PAYMENTREQUEST_0_CURRENCYCODE': details_response.get('PAYMENTREQUEST_0_CURRENCYCODE', 'SGD')
         }
         
-        execute_response = paypal_nvp_call('DoExpressCheckoutPayment', execute_params)
+        execute_response = await paypal_client.call('DoExpressCheckoutPayment', execute_params)
         
         if execute_response.get('ACK') in ['Success', 'SuccessWithWarning']:
             return {
@@ -136,6 +107,8 @@ async def execute_paypal_payment(payment_data: PayPalOrderCapture):
             
     except HTTPException:
         raise
+    except PayPalUnavailable as e:
+        raise HTTPException(status_code=502, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"PayPal payment execution failed: {str(e)}")
 
@@ -148,7 +121,7 @@ async def get_payment_details(payment_id: str):
             'TOKEN': payment_id
         }
         
-        response = paypal_nvp_call('GetExpressCheckoutDetails', params)
+        response = await paypal_client.call('GetExpressCheckoutDetails', params)
         
         if response.get('ACK') in ['Success', 'SuccessWithWarning']:
             return {
@@ -164,5 +137,7 @@ async def get_payment_details(payment_id: str):
             
     except HTTPException:
         raise
+    except PayPalUnavailable as e:
+        raise HTTPException(status_code=502, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"Payment not found: {str(e)}")
@@ -0,0 +1,78 @@
+"""
+PayPal NVP Stub
+Local stand-in for the PayPal Classic NVP endpoint, for exercising checkout
+without a PayPal account.
+
+    uvicorn paypal_stub:app --port 8099
+    PAYPAL_NVP_ENDPOINT=http://127.0.0.1:8099/nvp uvicorn server:app
+
+PAYPAL_STUB_LATENCY_MS adds a delay to every call and PAYPAL_STUB_FAIL_RATE
+answers that fraction of calls with HTTP 503, to exercise timeouts and retries.
+tests/test_paypal_client.py drives the client against this app in-process.
+"""
+
+import asyncio
+import os
+import random
+import uuid
+from urllib.parse import urlencode
+from fastapi import FastAPI, Request, Response
+
+PAYPAL_STUB_LATENCY_MS = float(os.environ.get("PAYPAL_STUB_LATENCY_MS", 0))
+PAYPAL_STUB_FAIL_RATE = float(os.environ.get("PAYPAL_STUB_FAIL_RATE", 0))
+
+app = FastAPI()
+
+# token -> SetExpressCheckout fields and checkout status
+checkouts = {}
+
+def _nvp(**fields) -> Response:
+    return Response(content=urlencode(fields), media_type="text/plain")
+
+def _failure(message: str) -> Response:
+    return _nvp(ACK="Failure", L_SHORTMESSAGE0=message, L_LONGMESSAGE0=message)
+
+@app.post("/nvp")
+async def nvp(request: Request):
+    if PAYPAL_STUB_LATENCY_MS:
+        await asyncio.sleep(PAYPAL_STUB_LATENCY_MS / 1000)
+    if random.random() < PAYPAL_STUB_FAIL_RATE:
+        return Response(status_code=503)
+
+    fields = dict(await request.form())
+    method = fields.get("METHOD")
+
+    if method == "SetExpressCheckout":
+        token = f"EC-{uuid.uuid4().hex[:17].upper()}"
+        checkouts[token] = {**fields, "CHECKOUTSTATUS": "PaymentActionNotInitiated"}
+        return _nvp(ACK="Success", TOKEN=token)
+
+    checkout = checkouts.get(fields.get("TOKEN"))
+    if checkout is None:
+        return _failure("Invalid token.")
+
+    if method == "GetExpressCheckoutDetails":
+        return _nvp(
+            ACK="Success",
+            TOKEN=fields["TOKEN"],
+            CHECKOUTSTATUS=checkout["CHECKOUTSTATUS"],
+            EMAIL="buyer@example.com",
+            PAYERID="STUBPAYER",
+            PAYMENTREQUEST_0_AMT=checkout.get("PAYMENTREQUEST_0_AMT", "0.00"),
+            PAYMENTREQUEST_0_CURRENCYCODE=checkout.get("PAYMENTREQUEST_0_CURRENCYCODE", "SGD"),
+        )
+
+    if method == "DoExpressCheckoutPayment":
+        if checkout["CHECKOUTSTATUS"] == "PaymentActionCompleted":
+            return _failure("Payment has already been made for this token.")
+        checkout["CHECKOUTSTATUS"] = "PaymentActionCompleted"
+        return _nvp(
+            ACK="Success",
+            TOKEN=fields["TOKEN"],
+            PAYMENTINFO_0_TRANSACTIONID=uuid.uuid4().hex[:17].upper(),
+            PAYMENTINFO_0_PAYMENTSTATUS="Completed",
+            PAYMENTINFO_0_AMT=fields.get("PAYMENTREQUEST_0_AMT", "0.00"),
+            PAYMENTINFO_0_CURRENCYCODE=fields.get("PAYMENTREQUEST_0_CURRENCYCODE", "SGD"),
+        )
+
+    return _failure(f"Unsupported method {method}")
@@ -0,0 +1,110 @@
+"""
+Order Recording
+Paid orders reach the dashboard stats and the sales rollups two ways: a
+background job adds each order as it is paid, and a rebuild recounts them all.
+A flag on the payment transaction records which path counted it, so no order
+is counted twice or lost:
+
+- a job claims the flag with its claim time, applies its $inc, then sets the
+  flag to True
+- a rebuild takes a lock, flags every paid order no job has claimed, waits
+  for claimed ones to be applied, and recounts only flagged orders
+- jobs wait for the lock before claiming, so none writes mid-rebuild; an
+  order paid during a rebuild is added by its job once the lock is released
+"""
+
+import asyncio
+import logging
+import os
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# A rebuild holding its lock longer than this is assumed to have died
+REBUILD_LOCK_SECONDS = float(os.environ.get('REBUILD_LOCK_SECONDS', 600))
+# How long a rebuild waits for claimed orders to be applied, and a job for a rebuild to finish
+RECORD_WAIT_SECONDS = float(os.environ.get('RECORD_WAIT_SECONDS', 30))
+# A claim older than this belongs to a worker that died; the next rebuild counts its order
+RECORD_CLAIM_SECONDS = float(os.environ.get('RECORD_CLAIM_SECONDS', 600))
+POLL_SECONDS = 0.5
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+async def rebuilding(db, flag: str) -> bool:
+    return await db.rebuild_locks.find_one({"_id": flag, "expires_at": {"$gt": _now()}}) is not None
+
+async def wait_for_rebuild(db, flag: str) -> bool:
+    """Wait until no rebuild holds the lock for flag; False if one still does after RECORD_WAIT_SECONDS"""
+    deadline = _now() + timedelta(seconds=RECORD_WAIT_SECONDS)
+    while await rebuilding(db, flag):
+        if _now() >= deadline:
+            return False
+        await asyncio.sleep(POLL_SECONDS)
+    return True
+
+async def record_once(db, session_id: str, flag: str, record) -> None:
+    """Run record(db, transaction) once per transaction, even if the job runs again"""
+    if not await wait_for_rebuild(db, flag):
+        raise RuntimeError(f"Rebuild holding {flag} is still running")
+    claimed_at = _now()
+    transaction = await db.payment_transactions.find_one_and_update(
+        {"session_id": session_id, flag: {"$exists": False}},
+        {"$set": {flag: claimed_at}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if transaction is None:
+        return
+    claim = {"session_id": session_id, flag: claimed_at}
+    try:
+        # A rebuild that started after the wait above would not see this order
+        if await rebuilding(db, flag):
+            raise RuntimeError(f"Rebuild holding {flag} started")
+        await record(db, transaction)
+    except Exception:
+        await db.payment_transactions.update_one(claim, {"$unset": {flag: ""}})
+        raise
+    await db.payment_transactions.update_one(claim, {"$set": {flag: True}})
+
+async def _settle(db, flag: str, match: dict):
+    """Flag every order in match as counted by the rebuild once no job is part way through one"""
+    deadline = _now() + timedelta(seconds=RECORD_WAIT_SECONDS)
+    while True:
+        now = _now()
+        await db.payment_transactions.update_many(
+            {**match, "$or": [
+                {flag: {"$exists": False}},
+                {flag: {"$lt": now - timedelta(seconds=RECORD_CLAIM_SECONDS)}},
+            ]},
+            {"$set": {flag: True}}
+        )
+        if not await db.payment_transactions.count_documents({**match, flag: {"$type": "date"}}):
+            return
+        if now >= deadline:
+            raise HTTPException(status_code=409, detail="Paid orders are still being recorded, try again shortly")
+        await asyncio.sleep(POLL_SECONDS)
+
+@asynccontextmanager
+async def exclusive_rebuild(db, flag: str, match: dict):
+    """Hold the rebuild lock for flag; inside it, count only orders in match whose flag is True"""
+    token = str(uuid.uuid4())
+    now = _now()
+    try:
+        await db.rebuild_locks.update_one(
+            {"_id": flag, "expires_at": {"$lte": now}},
+            {"$set": {"token": token, "expires_at": now + timedelta(seconds=REBUILD_LOCK_SECONDS)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="A rebuild is already running")
+    try:
+        await _settle(db, flag, match)
+        yield
+    finally:
+        await db.rebuild_locks.delete_one({"_id": flag, "token": token})
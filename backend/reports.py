@@ -0,0 +1,292 @@
+"""
+Sales Reports
+Revenue, order counts, average order value, coupon usage and top products
+over a date range, served from daily rollups rather than payment_transactions:
+
+- sales_daily: orders, revenue, subtotal and discount per day
+- sales_products_daily: units and revenue per product per day
+- sales_coupons_daily: orders and discount per coupon code per day
+
+Each paid order is added to the rollups by a background job. rebuild()
+recomputes a range from payment_transactions with aggregation pipelines that
+$merge into the rollup collections, under recording.exclusive_rebuild so no
+job adds to a rollup mid-rebuild and no order is counted by both. The first
+report builds the rollups for all history, recorded in schema_migrations.
+Days are the UTC date an order was placed; weekly and monthly series are
+summed from the daily buckets.
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+from fastapi import HTTPException
+from pymongo import UpdateOne
+from catalog import find_products
+from recording import exclusive_rebuild, wait_for_rebuild
+
+logger = logging.getLogger(__name__)
+
+INTERVALS = ("day", "week", "month")
+DEFAULT_RANGE_DAYS = 30
+MAX_TOP_PRODUCTS = 50
+
+PAID = {"payment_status": "paid"}
+# Set on a payment transaction once its order is in the rollups
+RECORDED = "report_recorded"
+# schema_migrations marker set once the rollups cover all history
+BOOTSTRAP_ID = "sales_rollups"
+# YYYY-MM-DD of the ISO created_at string
+ORDER_DAY = {"$substrCP": ["$created_at", 0, 10]}
+
+def order_day(transaction: dict) -> str:
+    created_at = transaction['created_at']
+    if isinstance(created_at, datetime):
+        return created_at.astimezone(timezone.utc).date().isoformat()
+    return created_at[:10]
+
+def line_revenue(item: dict) -> float:
+    """Unit price the server charged; older transactions only have the cart's price"""
+    price = item.get('unit_price')
+    if price is None:
+        price = item.get('price') or 0
+    return float(price) * int(item.get('quantity', 1))
+
+def parse_range(start: Optional[str], end: Optional[str]) -> Tuple[str, str]:
+    try:
+        end_day = date.fromisoformat(end) if end else datetime.now(timezone.utc).date()
+        start_day = date.fromisoformat(start) if start else end_day - timedelta(days=DEFAULT_RANGE_DAYS - 1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    if start_day > end_day:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    return start_day.isoformat(), end_day.isoformat()
+
+def _bucket(day: str, interval: str) -> str:
+    if interval == "month":
+        return day[:7]
+    if interval == "week":
+        # Monday of the ISO week
+        value = date.fromisoformat(day)
+        return (value - timedelta(days=value.weekday())).isoformat()
+    return day
+
+# ============== INCREMENTAL ==============
+
+async def record_order(db, transaction: dict):
+    """Add one paid order to the rollups"""
+    day = order_day(transaction)
+    now = datetime.now(timezone.utc)
+    coupon = transaction.get('coupon') or {}
+
+    await db.sales_daily.update_one(
+        {"day": day},
+        {"$inc": {
+            "orders": 1,
+            "revenue": transaction['amount'],
+            "subtotal": transaction.get('subtotal', transaction['amount']),
+            "discount": transaction.get('discount') or 0,
+            "coupon_orders": 1 if coupon.get('code') else 0,
+        }, "$set": {"updated_at": now}},
+        upsert=True
+    )
+
+    products = {}
+    for item in transaction['cart_items']:
+        line = products.setdefault(item['product_id'], {"units": 0, "revenue": 0.0, "name": item.get('product_name')})
+        line["units"] += int(item.get('quantity', 1))
+        line["revenue"] += line_revenue(item)
+    requests = []
+    for product_id, line in products.items():
+        fields = {"updated_at": now}
+        if line["name"]:
+            fields["product_name"] = line["name"]
+        requests.append(UpdateOne(
+            {"day": day, "product_id": product_id},
+            {"$inc": {"units": line["units"], "revenue": line["revenue"]}, "$set": fields},
+            upsert=True
+        ))
+    if requests:
+        await db.sales_products_daily.bulk_write(requests, ordered=False)
+
+    if coupon.get('code'):
+        await db.sales_coupons_daily.update_one(
+            {"day": day, "code": coupon['code']},
+            {"$inc": {"orders": 1, "discount": coupon.get('discount_amount') or transaction.get('discount') or 0},
+             "$set": {"updated_at": now}},
+            upsert=True
+        )
+
+# ============== REBUILD ==============
+
+def _day_after(day: str) -> str:
+    return (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+
+def _in_range(start: str, end: str) -> dict:
+    return {**PAID, "created_at": {"$gte": start, "$lt": _day_after(end)}}
+
+def _rollup_pipelines(start: str, end: str) -> List[Tuple[str, list]]:
+    now = datetime.now(timezone.utc)
+    match = {"$match": {**_in_range(start, end), RECORDED: True}}
+    line_price = {"$ifNull": ["$cart_items.unit_price", {"$ifNull": ["$cart_items.price", 0]}]}
+    quantity = {"$ifNull": ["$cart_items.quantity", 1]}
+    return [
+        ("sales_daily", [
+            match,
+            {"$group": {
+                "_id": ORDER_DAY,
+                "orders": {"$sum": 1},
+                "revenue": {"$sum": "$amount"},
+                "subtotal": {"$sum": {"$ifNull": ["$subtotal", "$amount"]}},
+                "discount": {"$sum": {"$ifNull": ["$discount", 0]}},
+                "coupon_orders": {"$sum": {"$cond": [{"$ifNull": ["$coupon.code", False]}, 1, 0]}},
+            }},
+            {"$set": {"day": "$_id", "updated_at": now}},
+            {"$unset": "_id"},
+            {"$merge": {"into": "sales_daily", "on": "day", "whenMatched": "replace"}},
+        ]),
+        ("sales_products_daily", [
+            match,
+            {"$unwind": "$cart_items"},
+            {"$group": {
+                "_id": {"day": ORDER_DAY, "product_id": "$cart_items.product_id"},
+                "units": {"$sum": quantity},
+                "revenue": {"$sum": {"$multiply": [line_price, quantity]}},
+                "product_name": {"$last": "$cart_items.product_name"},
+            }},
+            {"$set": {"day": "$_id.day", "product_id": "$_id.product_id", "updated_at": now}},
+            {"$unset": "_id"},
+            {"$merge": {"into": "sales_products_daily", "on": ["day", "product_id"], "whenMatched": "replace"}},
+        ]),
+        ("sales_coupons_daily", [
+            match,
+            {"$match": {"coupon.code": {"$type": "string"}}},
+            {"$group": {
+                "_id": {"day": ORDER_DAY, "code": "$coupon.code"},
+                "orders": {"$sum": 1},
+                "discount": {"$sum": {"$ifNull": ["$coupon.discount_amount", {"$ifNull": ["$discount", 0]}]}},
+            }},
+            {"$set": {"day": "$_id.day", "code": "$_id.code", "updated_at": now}},
+            {"$unset": "_id"},
+            {"$merge": {"into": "sales_coupons_daily", "on": ["day", "code"], "whenMatched": "replace"}},
+        ]),
+    ]
+
+async def rebuild(db, start: str, end: str):
+    """Recompute the rollups for start..end (inclusive) from payment_transactions"""
+    days = {"day": {"$gte": start, "$lte": end}}
+    async with exclusive_rebuild(db, RECORDED, _in_range(start, end)):
+        for collection, pipeline in _rollup_pipelines(start, end):
+            await db[collection].delete_many(days)
+            await db.payment_transactions.aggregate(pipeline).to_list(length=None)
+    logger.info(f"Sales rollups rebuilt for {start}..{end}")
+
+async def _bootstrap(db):
+    first = await db.payment_transactions.find_one(PAID, {"_id": 0, "created_at": 1}, sort=[("created_at", 1)])
+    if first:
+        await rebuild(db, order_day(first), datetime.now(timezone.utc).date().isoformat())
+    await db.schema_migrations.update_one(
+        {"_id": BOOTSTRAP_ID},
+        {"$set": {"applied_at": datetime.now(timezone.utc).isoformat()}},
+        upsert=True
+    )
+
+async def ensure_rollups(db):
+    """Build the rollups from every paid transaction the first time they are needed"""
+    if await db.schema_migrations.find_one({"_id": BOOTSTRAP_ID}):
+        return
+    try:
+        await _bootstrap(db)
+    except HTTPException:
+        # Another request is already building them
+        await wait_for_rebuild(db, RECORDED)
+        if not await db.schema_migrations.find_one({"_id": BOOTSTRAP_ID}):
+            raise
+
+# ============== QUERIES ==============
+
+async def _series(db, start: str, end: str, interval: str) -> list:
+    buckets = OrderedDict()
+    async for day in db.sales_daily.find({"day": {"$gte": start, "$lte": end}}, {"_id": 0}).sort("day", 1):
+        bucket = buckets.setdefault(_bucket(day['day'], interval), {
+            "period": _bucket(day['day'], interval), "orders": 0, "revenue": 0.0, "discount": 0.0, "coupon_orders": 0
+        })
+        for field in ("orders", "revenue", "discount", "coupon_orders"):
+            bucket[field] += day.get(field, 0)
+    series = list(buckets.values())
+    for bucket in series:
+        bucket["revenue"] = round(bucket["revenue"], 2)
+        bucket["discount"] = round(bucket["discount"], 2)
+        bucket["average_order_value"] = round(bucket["revenue"] / bucket["orders"], 2) if bucket["orders"] else 0
+    return series
+
+async def _top_products(db, start: str, end: str, limit: int) -> dict:
+    ranking = lambda field: [
+        {"$sort": {field: -1, "_id": 1}},
+        {"$limit": limit},
+        {"$project": {"_id": 0, "product_id": "$_id", "product_name": 1, "units": 1, "revenue": 1}},
+    ]
+    result = await db.sales_products_daily.aggregate([
+        {"$match": {"day": {"$gte": start, "$lte": end}}},
+        {"$group": {
+            "_id": "$product_id",
+            "units": {"$sum": "$units"},
+            "revenue": {"$sum": "$revenue"},
+            "product_name": {"$last": "$product_name"},
+        }},
+        {"$facet": {"by_units": ranking("units"), "by_revenue": ranking("revenue")}},
+    ]).to_list(length=1)
+    top = result[0] if result else {"by_units": [], "by_revenue": []}
+    for lines in top.values():
+        for line in lines:
+            line['revenue'] = round(line['revenue'], 2)
+
+    # Name products the cart did not
+    unnamed = {line['product_id'] for lines in top.values() for line in lines if not line.get('product_name')}
+    if unnamed:
+        products = await find_products(db, unnamed)
+        for lines in top.values():
+            for line in lines:
+                if not line.get('product_name') and line['product_id'] in products:
+                    line['product_name'] = products[line['product_id']].get('name')
+    return top
+
+async def _coupons(db, start: str, end: str) -> list:
+    coupons = await db.sales_coupons_daily.aggregate([
+        {"$match": {"day": {"$gte": start, "$lte": end}}},
+        {"$group": {"_id": "$code", "orders": {"$sum": "$orders"}, "discount": {"$sum": "$discount"}}},
+        {"$sort": {"orders": -1, "_id": 1}},
+        {"$project": {"_id": 0, "code": "$_id", "orders": 1, "discount": 1}},
+    ]).to_list(length=None)
+    for coupon in coupons:
+        coupon['discount'] = round(coupon['discount'], 2)
+    return coupons
+
+async def sales_report(db, start: str, end: str, interval: str = "day", top: int = 10) -> dict:
+    if interval not in INTERVALS:
+        raise HTTPException(status_code=400, detail=f"Interval must be one of: {', '.join(INTERVALS)}")
+    top = max(1, min(top, MAX_TOP_PRODUCTS))
+    await ensure_rollups(db)
+    series, top_products, coupons = await asyncio.gather(
+        _series(db, start, end, interval),
+        _top_products(db, start, end, top),
+        _coupons(db, start, end),
+    )
+    orders = sum(bucket["orders"] for bucket in series)
+    revenue = round(sum(bucket["revenue"] for bucket in series), 2)
+    return {
+        "start": start,
+        "end": end,
+        "interval": interval,
+        "totals": {
+            "orders": orders,
+            "revenue": revenue,
+            "discount": round(sum(bucket["discount"] for bucket in series), 2),
+            "coupon_orders": sum(bucket["coupon_orders"] for bucket in series),
+            "average_order_value": round(revenue / orders, 2) if orders else 0,
+        },
+        "series": series,
+        "top_products": top_products,
+        "coupons": coupons,
+    }
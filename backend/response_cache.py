@@ -0,0 +1,150 @@
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Iterable, Optional
+from database import get_db
+from http_cache import bump_version, bump_versions, collection_version
+from catalog import PRODUCT_COLLECTIONS
+
+logger = logging.getLogger(__name__)
+
+# 'memory': per-process LRU; 'mongo': shared across workers through the response_cache collection
+RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND', 'memory')
+RESPONSE_CACHE_TTL_SECONDS = float(os.environ.get('RESPONSE_CACHE_TTL_SECONDS', 300))
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 2000))
+
+class MemoryBackend:
+    """Per-process LRU with per-entry expiry"""
+
+    def __init__(self, maxsize: int = RESPONSE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+
+    async def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, namespace: str, value, ttl: float):
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def delete_namespaces(self, namespaces: list):
+        prefixes = tuple(namespace + "@" for namespace in namespaces)
+        for key in [k for k in self._entries if k.startswith(prefixes)]:
+            del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+class MongoBackend:
+    """Shared cache in the response_cache collection, expired by a TTL index"""
+
+    @property
+    def collection(self):
+        return get_db().response_cache
+
+    async def get(self, key: str):
+        doc = await self.collection.find_one({"_id": key, "expires_at": {"$gt": datetime.now(timezone.utc)}})
+        return json.loads(doc["value"]) if doc else None
+
+    async def set(self, key: str, namespace: str, value, ttl: float):
+        await self.collection.replace_one(
+            {"_id": key},
+            {
+                "namespace": namespace,
+                # Stored as JSON so arbitrary CMS keys never collide with BSON rules
+                "value": json.dumps(value, default=str),
+                "expires_at": datetime.now(timezone.utc) + timedelta(seconds=ttl)
+            },
+            upsert=True
+        )
+
+    async def delete_namespaces(self, namespaces: list):
+        await self.collection.delete_many({"namespace": {"$in": namespaces}})
+
+class ResponseCache:
+    """Read-through cache for read-mostly endpoints, invalidated by the write handlers.
+
+    Keys carry the namespace's shared version, so an invalidation in any worker
+    makes every worker's entries for that namespace unreachable.
+    """
+
+    def __init__(self, backend, ttl: float = RESPONSE_CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(namespace: str, version: int, **params) -> str:
+        return f"{namespace}@{version}:" + json.dumps(params, sort_keys=True, default=str)
+
+    async def get_or_load(self, namespace: str, loader: Callable[[], Awaitable[Any]], ttl: Optional[float] = None, **params):
+        """Cached value for namespace+params, calling loader on a miss. Callers must not mutate the result."""
+        key = self.key(namespace, await collection_version(namespace), **params)
+        try:
+            value = await self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Response cache read failed for {key}: {e}")
+            value = None
+        if value is not None:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        value = await loader()
+        try:
+            await self.backend.set(key, namespace, value, ttl or self.ttl)
+        except Exception as e:
+            logger.warning(f"Response cache write failed for {key}: {e}")
+        return value
+
+    async def invalidate(self, namespace: str):
+        """Drop a namespace's cached responses and bump its version so ETags change too"""
+        self.invalidations += 1
+        await bump_version(namespace)
+        await self.backend.delete_namespaces([namespace])
+
+    async def invalidate_many(self, namespaces: Iterable[str]):
+        """invalidate() for several namespaces, with one write to each store"""
+        namespaces = list(dict.fromkeys(namespaces))
+        if not namespaces:
+            return
+        self.invalidations += len(namespaces)
+        await bump_versions(namespaces)
+        await self.backend.delete_namespaces(namespaces)
+
+    async def invalidate_products(self, collection_types: Iterable[str]):
+        """Product documents changed: drop the cached lists of the collections involved.
+
+        Only the special collections serve cached lists; single products are tagged by content.
+        """
+        await self.invalidate_many(PRODUCT_COLLECTIONS[t] for t in collection_types if t != "general")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        stats = {
+            "backend": RESPONSE_CACHE_BACKEND,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+        if isinstance(self.backend, MemoryBackend):
+            stats["size"] = len(self.backend)
+        return stats
+
+response_cache = ResponseCache(MongoBackend() if RESPONSE_CACHE_BACKEND == 'mongo' else MemoryBackend())
@@ -0,0 +1,149 @@
+"""
+Review Statistics
+Keeps rating_sum, review_count, rating_histogram and the average rating on
+products in all three collections, and serves per-product review summaries
+from them.
+
+Run directly to rebuild every product's stats from the reviews collection:
+    python reviews.py
+"""
+
+import asyncio
+from typing import Optional
+from pymongo import UpdateOne
+from catalog import PRODUCT_COLLECTIONS, collection_for, find_product, find_products
+from response_cache import response_cache
+
+STARS = range(1, 6)
+
+def _empty_histogram() -> dict:
+    return {str(star): 0 for star in STARS}
+
+async def _star_counts(db, product_id: str) -> dict:
+    """1-5 star histogram counted from the reviews collection"""
+    histogram = _empty_histogram()
+    async for doc in db.reviews.aggregate([
+        {"$match": {"product_id": product_id}},
+        {"$group": {"_id": "$rating", "count": {"$sum": 1}}},
+    ]):
+        if str(doc["_id"]) in histogram:
+            histogram[str(doc["_id"])] = doc["count"]
+    return histogram
+
+async def apply_review(db, product_id: str, rating: int) -> bool:
+    """Fold one new rating into the product's stats with a single atomic update.
+
+    Call after the review is inserted: a product reviewed before histograms
+    were kept gets its histogram counted from the reviews, this one included.
+    """
+    product = await find_product(db, product_id)
+    if not product:
+        return False
+    collection = collection_for(db, product['collection_type'])
+
+    # Products rated before rating_sum existed: seed it from the stored average
+    legacy_sum = {"$multiply": [{"$ifNull": ["$rating", 0]}, {"$ifNull": ["$review_count", 0]}]}
+    totals = {
+        "rating_sum": {"$add": [{"$ifNull": ["$rating_sum", legacy_sum]}, rating]},
+        "review_count": {"$add": [{"$ifNull": ["$review_count", 0]}, 1]},
+    }
+    average = {"$set": {"rating": {"$divide": ["$rating_sum", "$review_count"]}}}
+
+    seeded = False
+    if product.get('review_count') and not product.get('rating_histogram'):
+        histogram = await _star_counts(db, product_id)
+        result = await collection.update_one(
+            {"id": product_id, "rating_histogram": {"$exists": False}},
+            [{"$set": {**totals, "rating_histogram": {"$literal": histogram}}}, average]
+        )
+        # Lost to a concurrent review that seeded it first: add this one as usual
+        seeded = bool(result.modified_count)
+    if not seeded:
+        star = f"rating_histogram.{rating}"
+        await collection.update_one(
+            {"id": product_id},
+            [{"$set": {**totals, star: {"$add": [{"$ifNull": [f"${star}", 0]}, 1]}}}, average]
+        )
+    await response_cache.invalidate_products([product['collection_type']])
+    return True
+
+def summary_namespace(product_id: str) -> str:
+    """Response cache namespace for a product's review summary"""
+    return f"reviews:{product_id}"
+
+async def review_summary(db, product_id: str) -> Optional[dict]:
+    """Average, count and 1-5 star histogram for a product, read from its stored stats"""
+    product = await find_product(db, product_id)
+    if not product:
+        return None
+
+    count = product.get('review_count') or 0
+    histogram = product.get('rating_histogram')
+    if count and not histogram:
+        # Reviewed before histograms were kept: count the stars once
+        histogram = await _star_counts(db, product_id)
+
+    return {
+        "product_id": product_id,
+        "average_rating": round(product.get('rating') or 0, 2) if count else 0,
+        "review_count": count,
+        "histogram": {**_empty_histogram(), **(histogram or {})},
+    }
+
+async def rebuild_review_stats(db) -> int:
+    """Recompute every product's review stats from the reviews collection.
+
+    Invalidates the review summaries and cached lists of every product it touches.
+    """
+    pipeline = [
+        {"$group": {
+            "_id": "$product_id",
+            "rating_sum": {"$sum": "$rating"},
+            "review_count": {"$sum": 1},
+            **{f"stars_{star}": {"$sum": {"$cond": [{"$eq": ["$rating", star]}, 1, 0]}} for star in STARS},
+        }}
+    ]
+    stats = {doc["_id"]: doc async for doc in db.reviews.aggregate(pipeline)}
+    products = await find_products(db, stats.keys())
+
+    updates = {collection_type: [] for collection_type in PRODUCT_COLLECTIONS}
+    touched = []
+    for product_id, doc in stats.items():
+        product = products.get(product_id)
+        if not product:
+            continue
+        updates[product['collection_type']].append(UpdateOne({"id": product_id}, {"$set": {
+            "rating_sum": doc["rating_sum"],
+            "review_count": doc["review_count"],
+            "rating": doc["rating_sum"] / doc["review_count"],
+            "rating_histogram": {str(star): doc[f"stars_{star}"] for star in STARS},
+        }}))
+        touched.append(product_id)
+
+    for collection_type, requests in updates.items():
+        collection = collection_for(db, collection_type)
+        if requests:
+            await collection.bulk_write(requests, ordered=False)
+        # Products whose reviews are all gone
+        orphaned = {"review_count": {"$gt": 0}, "id": {"$nin": list(stats)}}
+        touched += [doc['id'] async for doc in collection.find(orphaned, {"_id": 0, "id": 1})]
+        await collection.update_many(
+            orphaned,
+            {"$set": {"rating_sum": 0, "review_count": 0, "rating": 0, "rating_histogram": _empty_histogram()}}
+        )
+
+    await response_cache.invalidate_many(summary_namespace(product_id) for product_id in touched)
+    await response_cache.invalidate_products(PRODUCT_COLLECTIONS)
+    return sum(len(requests) for requests in updates.values())
+
+async def main():
+    from database import get_db, close
+
+    try:
+        updated = await rebuild_review_stats(get_db())
+        print(f"✓ Rebuilt review stats for {updated} products")
+    finally:
+        close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
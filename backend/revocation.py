@@ -0,0 +1,70 @@
+import asyncio
+import hashlib
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+REVOCATION_REFRESH_SECONDS = float(os.environ.get('REVOCATION_REFRESH_SECONDS', 5))
+
+# Re-read a small window behind the newest entry seen, so revocations written
+# by other workers with slightly older timestamps are not skipped
+REFRESH_OVERLAP = timedelta(seconds=10)
+
+def token_digest(token: str) -> str:
+    """Compact fingerprint of a token for the revocation set"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()[:32]
+
+class RevocationList:
+    """In-process mirror of the revoked_tokens collection, refreshed incrementally"""
+
+    def __init__(self, refresh_interval: float = REVOCATION_REFRESH_SECONDS):
+        self.refresh_interval = refresh_interval
+        self._revoked = {}  # digest -> token expiry
+        self._last_seen = None
+        self._last_refresh = 0.0
+        self._lock = asyncio.Lock()
+
+    async def refresh(self, db, force: bool = False):
+        """Pull revocations recorded since the last refresh"""
+        if not force and time.monotonic() - self._last_refresh < self.refresh_interval:
+            return
+        async with self._lock:
+            if not force and time.monotonic() - self._last_refresh < self.refresh_interval:
+                return
+
+            query = {}
+            if self._last_seen is not None:
+                query["revoked_at"] = {"$gte": self._last_seen - REFRESH_OVERLAP}
+            async for doc in db.revoked_tokens.find(query, {"_id": 0, "token_digest": 1, "expires_at": 1, "revoked_at": 1}):
+                self._revoked[doc["token_digest"]] = _aware(doc["expires_at"])
+                revoked_at = _aware(doc["revoked_at"])
+                if self._last_seen is None or revoked_at > self._last_seen:
+                    self._last_seen = revoked_at
+
+            # Expired tokens fail signature checks anyway, so stop tracking them
+            now = datetime.now(timezone.utc)
+            for digest in [d for d, expires_at in self._revoked.items() if expires_at < now]:
+                del self._revoked[digest]
+            self._last_refresh = time.monotonic()
+
+    def is_revoked(self, token: str) -> bool:
+        return token_digest(token) in self._revoked
+
+    async def revoke(self, db, token: str, expires_at: datetime):
+        """Record a revoked token locally and for other workers"""
+        digest = token_digest(token)
+        self._revoked[digest] = expires_at
+        await db.revoked_tokens.update_one(
+            {"token_digest": digest},
+            {"$set": {"token_digest": digest, "expires_at": expires_at, "revoked_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+
+    def __len__(self):
+        return len(self._revoked)
+
+def _aware(value: datetime) -> datetime:
+    """Mongo returns naive UTC datetimes"""
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+revocation_list = RevocationList()
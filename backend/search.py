@@ -0,0 +1,174 @@
+import asyncio
+import bisect
+import logging
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from catalog import PRODUCT_COLLECTIONS, collection_for
+
+logger = logging.getLogger(__name__)
+
+SEARCH_REFRESH_SECONDS = float(os.environ.get('SEARCH_REFRESH_SECONDS', 300))
+# Listings filter and page at most this many of the best hits
+MAX_SEARCH_CANDIDATES = 1000
+
+# Weighted term frequency per field
+FIELD_WEIGHTS = {
+    "name": 3.0,
+    "tags": 2.0,
+    "sku": 2.0,
+    "description": 1.0,
+}
+
+# Prefix expansions score lower than exact term matches
+PREFIX_WEIGHT = 0.5
+MIN_PREFIX_LENGTH = 2
+MAX_PREFIX_EXPANSIONS = 50
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens"""
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+def _field_text(value) -> str:
+    if isinstance(value, list):
+        return " ".join(str(v) for v in value)
+    return str(value) if value else ""
+
+class SearchIndex:
+    """In-memory inverted index over all product collections with BM25 ranking"""
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[str, float]] = {}  # term -> {product_id: weighted tf}
+        self._doc_terms: Dict[str, Counter] = {}  # product_id -> weighted tf per term
+        self._doc_len: Dict[str, float] = {}
+        self._doc_type: Dict[str, str] = {}  # product_id -> collection_type
+        self._total_len = 0.0
+        self._sorted_terms: Optional[List[str]] = None
+
+    def __len__(self):
+        return len(self._doc_len)
+
+    def add(self, product: dict, collection_type: str):
+        """Index (or re-index) a product document"""
+        product_id = product['id']
+        self.remove(product_id)
+
+        terms = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(_field_text(product.get(field))):
+                terms[token] += weight
+        if not terms:
+            return
+
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[product_id] = tf
+        length = sum(terms.values())
+        self._doc_terms[product_id] = terms
+        self._doc_len[product_id] = length
+        self._doc_type[product_id] = collection_type
+        self._total_len += length
+        self._sorted_terms = None
+
+    def remove(self, product_id: str):
+        terms = self._doc_terms.pop(product_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(product_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_len -= self._doc_len.pop(product_id)
+        self._doc_type.pop(product_id, None)
+        self._sorted_terms = None
+
+    def _expand(self, token: str) -> List[Tuple[str, float]]:
+        """Exact term plus indexed terms that start with the token"""
+        expansions = [(token, 1.0)] if token in self._postings else []
+        if len(token) < MIN_PREFIX_LENGTH:
+            return expansions
+
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self._postings)
+        start = bisect.bisect_left(self._sorted_terms, token)
+        for term in self._sorted_terms[start:start + MAX_PREFIX_EXPANSIONS + 1]:
+            if not term.startswith(token):
+                break
+            if term != token:
+                expansions.append((term, PREFIX_WEIGHT))
+        return expansions
+
+    def search(self, query: str, collection_types: Optional[List[str]] = None) -> List[Tuple[str, str, float]]:
+        """Rank products for a query: [(product_id, collection_type, score)] best first"""
+        tokens = tokenize(query)
+        if not tokens or not self._doc_len:
+            return []
+
+        n = len(self._doc_len)
+        avg_len = self._total_len / n
+        scores: Dict[str, float] = {}
+        for token in dict.fromkeys(tokens):
+            for term, weight in self._expand(token):
+                postings = self._postings[term]
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for product_id, tf in postings.items():
+                    norm = tf + self.k1 * (1 - self.b + self.b * self._doc_len[product_id] / avg_len)
+                    scores[product_id] = scores.get(product_id, 0.0) + weight * idf * tf * (self.k1 + 1) / norm
+
+        results = [
+            (product_id, self._doc_type[product_id], score)
+            for product_id, score in scores.items()
+            if not collection_types or self._doc_type[product_id] in collection_types
+        ]
+        results.sort(key=lambda r: (-r[2], r[0]))
+        return results
+
+    async def rebuild(self, db):
+        """Rebuild from all product collections, swapping in the new index when done"""
+        fresh = SearchIndex()
+        projection = {"_id": 0, "id": 1, **{field: 1 for field in FIELD_WEIGHTS}}
+        for collection_type in PRODUCT_COLLECTIONS:
+            async for product in collection_for(db, collection_type).find({}, projection):
+                fresh.add(product, collection_type)
+        self.__dict__.update(fresh.__dict__)
+        logger.info(f"Search index built with {len(self)} products")
+
+    async def refresh_product(self, db, product_id: str, collection_type: str):
+        """Re-index one product after a write, dropping it if it no longer exists"""
+        product = await collection_for(db, collection_type).find_one({"id": product_id}, {"_id": 0})
+        if product:
+            self.add(product, collection_type)
+        else:
+            self.remove(product_id)
+
+    async def run_refresh(self, db):
+        """Periodically rebuild so writes made by other workers become searchable"""
+        while True:
+            try:
+                await self.rebuild(db)
+            except Exception as e:
+                logger.error(f"Search index rebuild failed: {e}")
+            await asyncio.sleep(SEARCH_REFRESH_SECONDS)
+
+search_index = SearchIndex()
+
+async def ranked_page(collection, ranked_ids: List[str], query: dict, skip: int, limit: int) -> Tuple[list, int]:
+    """One page of search hits in relevance order, plus the number of hits matching query.
+
+    Extra filters are checked by id only, so only the requested page is loaded in full.
+    """
+    ranked_ids = ranked_ids[:MAX_SEARCH_CANDIDATES]
+    if query:
+        matching = {doc['id'] async for doc in collection.find({**query, "id": {"$in": ranked_ids}}, {"_id": 0, "id": 1})}
+        ranked_ids = [product_id for product_id in ranked_ids if product_id in matching]
+    page_ids = ranked_ids[skip:skip + limit]
+    found = {doc['id']: doc async for doc in collection.find({"id": {"$in": page_ids}}, {"_id": 0})}
+    return [found[product_id] for product_id in page_ids if product_id in found], len(ranked_ids)
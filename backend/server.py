@@ -1,8 +1,9 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Cookie
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Cookie, Depends
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorDatabase
+import asyncio
 import os
 import logging
 import uuid
@@ -10,23 +11,32 @@ from pathlib import Path
 from typing import List, Optional
 from datetime import datetime, timedelta, timezone
 from emergentintegrations.llm.chat import LlmChat, UserMessage
-from email_utils import send_order_confirmation_email, send_welcome_email
+from email_utils import send_welcome_email
 
 from models import *
-from auth import get_current_user, get_current_user_optional, get_current_admin_user, get_password_hash, verify_password, create_access_token
+from auth import get_current_user, get_current_user_optional, get_current_admin_user, create_access_token, end_session
+from password_service import password_service
 from utils import slugify, generate_sku, generate_otp
+from catalog import find_product, find_products, remember
+from db_indexes import ensure_indexes
+from database import get_db
+import database
+from session_cache import session_cache
+from search import search_index, MAX_SEARCH_CANDIDATES
+from pagination import fetch_page
+from response_cache import response_cache
+from http_cache import conditional, collection_version, make_etag, document_etag
+from reviews import apply_review, review_summary, summary_namespace
+from deals import current_price_fields, deal_is_live, refresh_deals, run_scheduler as run_deal_scheduler
 from admin_routes import admin_router
 from special_collections_routes import special_router
 from paypal_routes import paypal_router
+from paypal_client import paypal_client
+import dashboard
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
-
 # LLM API Key
 EMERGENT_LLM_KEY = os.environ.get('EMERGENT_LLM_KEY')
 
@@ -52,17 +62,18 @@ class VerifyOtpRequest(BaseModel):
     otp: str
 
 @api_router.post("/auth/register")
-async def register(register_data: RegisterRequest):
+async def register(register_data: RegisterRequest, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Register new user with email/password"""
     existing_user = await db.users.find_one({"email": register_data.email})
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
     otp = generate_otp()
+    password_hash = await password_service.hash(register_data.password)
     await db.otps.insert_one({
         "email": register_data.email,
         "otp": otp,
-        "password_hash": get_password_hash(register_data.password),
+        "password_hash": password_hash,
         "name": register_data.name,
         "expires_at": (datetime.now(timezone.utc) + timedelta(minutes=10)).isoformat(),
         "created_at": datetime.now(timezone.utc).isoformat()
@@ -71,7 +82,7 @@ async def register(register_data: RegisterRequest):
     return {"message": "OTP sent to email", "otp": otp}
 
 @api_router.post("/auth/verify-otp")
-async def verify_otp(otp_data: VerifyOtpRequest, response: Response):
+async def verify_otp(otp_data: VerifyOtpRequest, response: Response, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Verify OTP and create user"""
     otp_doc = await db.otps.find_one({"email": otp_data.email, "otp": otp_data.otp})
     if not otp_doc:
@@ -90,6 +101,7 @@ async def verify_otp(otp_data: VerifyOtpRequest, response: Response):
     user_dict = user.model_dump()
     user_dict['created_at'] = user_dict['created_at'].isoformat()
     await db.users.insert_one(user_dict)
+    await dashboard.adjust(db, total_customers=1)
     
     session_token = create_access_token({"sub": user.id})
     session = UserSession(
@@ -117,13 +129,13 @@ async def verify_otp(otp_data: VerifyOtpRequest, response: Response):
     return {"message": "Registration successful", "session_token": session_token, "user": user}
 
 @api_router.post("/auth/login")
-async def login(login_data: LoginRequest, response: Response):
+async def login(login_data: LoginRequest, response: Response, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Login with email/password"""
     user = await db.users.find_one({"email": login_data.email}, {"_id": 0})
     if not user or not user.get('password_hash'):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    if not verify_password(login_data.password, user['password_hash']):
+    if not await password_service.verify(login_data.password, user['password_hash']):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     otp = generate_otp()
@@ -137,7 +149,7 @@ async def login(login_data: LoginRequest, response: Response):
     return {"message": "OTP sent to email", "otp": otp}
 
 @api_router.post("/auth/admin-login")
-async def admin_login(login_data: LoginRequest, response: Response):
+async def admin_login(login_data: LoginRequest, response: Response, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Direct admin login without OTP"""
     print(f"DEBUG: Admin login attempt for: {login_data.email}")
     
@@ -154,7 +166,7 @@ async def admin_login(login_data: LoginRequest, response: Response):
         raise HTTPException(status_code=403, detail="Admin access required")
     
     print(f"DEBUG: Testing password verification...")
-    password_valid = verify_password(login_data.password, user['password_hash'])
+    password_valid = await password_service.verify(login_data.password, user['password_hash'])
     print(f"DEBUG: Password valid: {password_valid}")
     
     if not password_valid:
@@ -185,7 +197,7 @@ async def admin_login(login_data: LoginRequest, response: Response):
     return {"message": "Login successful", "session_token": session_token, "user": user}
 
 @api_router.post("/auth/verify-login-otp")
-async def verify_login_otp(otp_data: VerifyOtpRequest, response: Response):
+async def verify_login_otp(otp_data: VerifyOtpRequest, response: Response, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Verify login OTP and create session"""
     otp_doc = await db.login_otps.find_one({"email": otp_data.email, "otp": otp_data.otp})
     if not otp_doc:
@@ -225,7 +237,7 @@ async def verify_login_otp(otp_data: VerifyOtpRequest, response: Response):
     return {"message": "Login successful", "session_token": session_token, "user": user}
 
 @api_router.get("/auth/session-data")
-async def get_session_data(request: Request):
+async def get_session_data(request: Request, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Process Emergent Auth session_id"""
     session_id = request.headers.get('X-Session-ID')
     if not session_id:
@@ -251,6 +263,7 @@ async def get_session_data(request: Request):
         user_dict = user.model_dump()
         user_dict['created_at'] = user_dict['created_at'].isoformat()
         await db.users.insert_one(user_dict)
+        await dashboard.adjust(db, total_customers=1)
     else:
         user = User(**user)
     
@@ -274,19 +287,19 @@ async def get_session_data(request: Request):
     }
 
 @api_router.get("/auth/me")
-async def get_me(request: Request, session_token: Optional[str] = Cookie(None)):
+async def get_me(request: Request, session_token: Optional[str] = Cookie(None), db: AsyncIOMotorDatabase = Depends(get_db)):
     """Get current user"""
     user = await get_current_user(request, db, session_token)
     return user
 
 @api_router.get("/users/me")
-async def get_current_user_info(request: Request, session_token: Optional[str] = Cookie(None)):
+async def get_current_user_info(request: Request, session_token: Optional[str] = Cookie(None), db: AsyncIOMotorDatabase = Depends(get_db)):
     """Get current user information"""
     user = await get_current_user(request, db, session_token)
     return user
 
 @api_router.put("/users/profile")
-async def update_user_profile(request: Request, session_token: Optional[str] = Cookie(None)):
+async def update_user_profile(request: Request, session_token: Optional[str] = Cookie(None), db: AsyncIOMotorDatabase = Depends(get_db)):
     """Update user profile"""
     user = await get_current_user(request, db, session_token)
     data = await request.json()
@@ -296,37 +309,47 @@ async def update_user_profile(request: Request, session_token: Optional[str] = C
         {"id": user['id']},
         {"$set": {"name": data.get('name', user['name'])}}
     )
+    session_cache.invalidate_user(user['id'])
     
     updated_user = await db.users.find_one({"id": user['id']}, {"_id": 0})
     return updated_user
 
 @api_router.post("/auth/logout")
-async def logout(request: Request, response: Response, session_token: Optional[str] = Cookie(None)):
+async def logout(request: Request, response: Response, session_token: Optional[str] = Cookie(None), db: AsyncIOMotorDatabase = Depends(get_db)):
     """Logout user"""
     token = session_token or request.headers.get('Authorization', '').replace('Bearer ', '')
     if token:
-        await db.user_sessions.delete_one({"session_token": token})
+        await end_session(db, token)
     response.delete_cookie("session_token")
     return {"message": "Logged out successfully"}
 
 # ============== CATEGORY ROUTES ==============
 
 @api_router.get("/categories", response_model=List[Category])
-async def get_categories():
+async def get_categories(request: Request, response: Response, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Get all categories"""
-    categories = await db.categories.find({}, {"_id": 0}).sort("order", 1).to_list(100)
-    return categories
+    not_modified = conditional(request, response, make_etag("categories", await collection_version("categories")))
+    if not_modified:
+        return not_modified
+    
+    async def load():
+        return await db.categories.find({}, {"_id": 0}).sort("order", 1).to_list(100)
+    return await response_cache.get_or_load("categories", load)
 
 @api_router.get("/categories/{category_id}", response_model=Category)
-async def get_category(category_id: str):
+async def get_category(category_id: str, request: Request, response: Response, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Get single category"""
     category = await db.categories.find_one({"id": category_id}, {"_id": 0})
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
+    
+    not_modified = conditional(request, response, document_etag(category))
+    if not_modified:
+        return not_modified
     return category
 
 @api_router.post("/categories", response_model=Category)
-async def create_category(category_data: CategoryCreate, request: Request, session_token: Optional[str] = Cookie(None)):
+async def create_category(category_data: CategoryCreate, request: Request, session_token: Optional[str] = Cookie(None), db: AsyncIOMotorDatabase = Depends(get_db)):
     """Create new category (Admin only)"""
     await get_current_admin_user(request, db, session_token)
     
@@ -341,13 +364,14 @@ async def create_category(category_data: CategoryCreate, request: Request, sessi
     category_dict = category.model_dump()
     category_dict['created_at'] = category_dict['created_at'].isoformat()
     await db.categories.insert_one(category_dict)
+    await response_cache.invalidate("categories")
     
     return category
 
 # ============== PRODUCT ROUTES ==============
 
 @api_router.get("/products/new-arrivals")
-async def get_new_arrivals(limit: int = 24):
+async def get_new_arrivals(limit: int = 24, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Get new arrivals (products from last 30 days)"""
     # Calculate date 30 days ago
     thirty_days_ago = datetime.now(timezone.utc) - timedelta(days=30)
@@ -361,7 +385,7 @@ async def get_new_arrivals(limit: int = 24):
     return products
 
 @api_router.get("/products/by-location/{location}")
-async def get_products_by_location(location: str, limit: int = 50):
+async def get_products_by_location(location: str, limit: int = 50, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Get products by Singapore landmark location"""
     products = await db.products.find(
         {"location": location},
@@ -371,7 +395,7 @@ async def get_products_by_location(location: str, limit: int = 50):
     return products
 
 @api_router.get("/products/batik-label")
-async def get_batik_products(limit: int = 50):
+async def get_batik_products(limit: int = 50, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Get BATIC Label products"""
     products = await db.products.find(
         {"is_batik_label": True},
@@ -381,17 +405,40 @@ async def get_batik_products(limit: int = 50):
     return products
 
 @api_router.get("/products/deals")
-async def get_deal_products(limit: int = 50):
+async def get_deal_products(limit: int = 50, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Get products on deal"""
     products = await db.products.find(
-        {"is_on_deal": True},
+        {"deal_active": True},
         {"_id": 0}
     ).limit(limit).to_list(length=limit)
     
     return products
 
+@api_router.get("/search")
+async def search_products(
+    q: str,
+    collection_type: Optional[str] = None,
+    limit: int = 20,
+    skip: int = 0,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Full-text search across general, Explore Singapore and Batik products"""
+    ranked = search_index.search(q, [collection_type] if collection_type else None)
+    page = ranked[skip:skip + limit]
+    products = await find_products(db, [product_id for product_id, _, _ in page])
+    
+    results = []
+    for product_id, _, score in page:
+        product = products.get(product_id)
+        if product:
+            product['score'] = round(score, 4)
+            results.append(product)
+    
+    return {"results": results, "total": len(ranked)}
+
 @api_router.get("/products", response_model=List[Product])
 async def get_products(
+    response: Response,
     limit: int = 100, 
     search: Optional[str] = None,
     category: Optional[str] = None,
@@ -401,19 +448,22 @@ async def get_products(
     category_id: Optional[str] = None,
     is_featured: Optional[bool] = None,
     is_bestseller: Optional[bool] = None,
-    skip: int = 0
+    skip: int = 0,
+    cursor: Optional[str] = None,
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
-    """Get products with advanced filters and sorting"""
+    """Get products with advanced filters and sorting.
+    
+    Pass the X-Next-Cursor response header back as `cursor` to fetch the next page.
+    """
     # Build query
     query = {}
     
-    # Search filter
+    # Search filter (ranked by the in-process search index)
+    ranked_ids = None
     if search:
-        query["$or"] = [
-            {"name": {"$regex": search, "$options": "i"}},
-            {"description": {"$regex": search, "$options": "i"}},
-            {"tags": {"$regex": search, "$options": "i"}}
-        ]
+        ranked_ids = [product_id for product_id, _, _ in search_index.search(search, ["general"])[:MAX_SEARCH_CANDIDATES]]
+        query["id"] = {"$in": ranked_ids}
     
     # Category filter (support both 'category' and 'category_id' for backward compatibility)
     if category:
@@ -427,21 +477,21 @@ async def get_products(
     if is_bestseller is not None:
         query["is_bestseller"] = is_bestseller
     
-    # Price range filter
+    # Price range filter (on the price customers pay, deals included)
     if min_price is not None or max_price is not None:
         price_query = {}
         if min_price is not None:
             price_query["$gte"] = min_price
         if max_price is not None:
             price_query["$lte"] = max_price
-        query["price"] = price_query
+        query["effective_price"] = price_query
     
     # Sorting
     sort_order = []
     if sort_by == "price_asc":
-        sort_order = [("price", 1)]
+        sort_order = [("effective_price", 1)]
     elif sort_by == "price_desc":
-        sort_order = [("price", -1)]
+        sort_order = [("effective_price", -1)]
     elif sort_by == "newest":
         sort_order = [("created_at", -1)]
     elif sort_by == "popular":
@@ -450,38 +500,34 @@ async def get_products(
         sort_order = [("rating", -1)]
     
     # Execute query
-    if sort_order:
-        products = await db.products.find(query, {"_id": 0}).sort(sort_order).skip(skip).limit(limit).to_list(length=None)
+    if ranked_ids is not None and not sort_order:
+        # Keep search relevance order, then page
+        matches = await db.products.find(query, {"_id": 0}).to_list(length=None)
+        rank = {product_id: position for position, product_id in enumerate(ranked_ids)}
+        matches.sort(key=lambda p: rank[p['id']])
+        products = matches[skip:skip + limit]
     else:
-        products = await db.products.find(query, {"_id": 0}).skip(skip).limit(limit).to_list(length=None)
+        products, next_cursor = await fetch_page(db.products, query, sort_order, limit, cursor=cursor, skip=skip)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
     
     return products
 
 @api_router.get("/products/{product_id}")
-async def get_product(product_id: str):
+async def get_product(product_id: str, request: Request, response: Response, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Get single product from any collection"""
-    # Try general products first
-    product = await db.products.find_one({"id": product_id}, {"_id": 0})
-    if product:
-        product['collection_type'] = 'general'
-        return product
-    
-    # Try Explore Singapore products
-    product = await db.explore_singapore_products.find_one({"id": product_id}, {"_id": 0})
-    if product:
-        product['collection_type'] = 'explore_singapore'
-        return product
-    
-    # Try Batik products
-    product = await db.batik_products.find_one({"id": product_id}, {"_id": 0})
-    if product:
-        product['collection_type'] = 'batik'
-        return product
-    
-    raise HTTPException(status_code=404, detail="Product not found")
+    product = await find_product(db, product_id)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    
+    # Price and stock change more often than catalog copy, so keep freshness short
+    not_modified = conditional(request, response, document_etag(product), max_age=15, stale_while_revalidate=60)
+    if not_modified:
+        return not_modified
+    return product
 
 @api_router.post("/products", response_model=Product)
-async def create_product(product_data: ProductCreate, request: Request, session_token: Optional[str] = Cookie(None)):
+async def create_product(product_data: ProductCreate, request: Request, session_token: Optional[str] = Cookie(None), db: AsyncIOMotorDatabase = Depends(get_db)):
     """Create new product (Admin only)"""
     await get_current_admin_user(request, db, session_token)
     
@@ -502,45 +548,49 @@ async def create_product(product_data: ProductCreate, request: Request, session_
     
     product_dict = product.model_dump()
     product_dict['created_at'] = product_dict['created_at'].isoformat()
+    product_dict.update(await current_price_fields(db, product_dict))
     await db.products.insert_one(product_dict)
+    remember(product.id, "general")
+    search_index.add(product_dict, "general")
+    await dashboard.adjust(db, total_products=1)
+    await dashboard.refresh_low_stock(db)
     
     return product
 
 @api_router.put("/products/{product_id}", response_model=Product)
-async def update_product(product_id: str, product_data: ProductCreate, request: Request, session_token: Optional[str] = Cookie(None)):
+async def update_product(product_id: str, product_data: ProductCreate, request: Request, session_token: Optional[str] = Cookie(None), db: AsyncIOMotorDatabase = Depends(get_db)):
     """Update product (Admin only)"""
     await get_current_admin_user(request, db, session_token)
     
-    existing = await db.products.find_one({"id": product_id}, {"_id": 0})
+    existing = await find_product(db, product_id, "general")
     if not existing:
         raise HTTPException(status_code=404, detail="Product not found")
     
     update_data = product_data.model_dump()
     update_data['slug'] = slugify(product_data.name)
+    update_data.update(await current_price_fields(db, {**existing, **update_data}))
     
     await db.products.update_one({"id": product_id}, {"$set": update_data})
     
     updated_product = await db.products.find_one({"id": product_id}, {"_id": 0})
+    search_index.add(updated_product, "general")
+    await dashboard.refresh_low_stock(db)
     return updated_product
 
 # ============== CART ROUTES ==============
 
 @api_router.get("/cart", response_model=List[dict])
-async def get_cart(request: Request, session_token: Optional[str] = Cookie(None)):
+async def get_cart(request: Request, session_token: Optional[str] = Cookie(None), db: AsyncIOMotorDatabase = Depends(get_db)):
     """Get user's cart with products from all collections"""
     user = await get_current_user(request, db, session_token)
     
     cart_items = await db.cart_items.find({"user_id": user['id']}, {"_id": 0}).to_list(100)
     
+    products = await find_products(db, [item['product_id'] for item in cart_items])
+    
     result = []
     for item in cart_items:
-        # Try to find product in all collections
-        product = await db.products.find_one({"id": item['product_id']}, {"_id": 0})
-        if not product:
-            product = await db.explore_singapore_products.find_one({"id": item['product_id']}, {"_id": 0})
-        if not product:
-            product = await db.batik_products.find_one({"id": item['product_id']}, {"_id": 0})
-        
+        product = products.get(item['product_id'])
         if product:
             result.append({
                 "cart_item": item,
@@ -550,7 +600,7 @@ async def get_cart(request: Request, session_token: Optional[str] = Cookie(None)
     return result
 
 @api_router.post("/cart")
-async def add_to_cart(cart_data: CartItemCreate, request: Request, session_token: Optional[str] = Cookie(None)):
+async def add_to_cart(cart_data: CartItemCreate, request: Request, session_token: Optional[str] = Cookie(None), db: AsyncIOMotorDatabase = Depends(get_db)):
     """Add item to cart"""
     user = await get_current_user(request, db, session_token)
     
@@ -580,7 +630,7 @@ async def add_to_cart(cart_data: CartItemCreate, request: Request, session_token
         return {"message": "Added to cart"}
 
 @api_router.delete("/cart/{cart_item_id}")
-async def remove_from_cart(cart_item_id: str, request: Request, session_token: Optional[str] = Cookie(None)):
+async def remove_from_cart(cart_item_id: str, request: Request, session_token: Optional[str] = Cookie(None), db: AsyncIOMotorDatabase = Depends(get_db)):
     """Remove item from cart"""
     user = await get_current_user(request, db, session_token)
     
@@ -593,7 +643,7 @@ async def remove_from_cart(cart_item_id: str, request: Request, session_token: O
 # ============== ORDER ROUTES ==============
 
 @api_router.get("/orders")
-async def get_user_orders(request: Request, session_token: Optional[str] = Cookie(None)):
+async def get_user_orders(request: Request, session_token: Optional[str] = Cookie(None), db: AsyncIOMotorDatabase = Depends(get_db)):
     """Get current user's orders"""
     user = await get_current_user(request, db, session_token)
     
@@ -603,10 +653,18 @@ async def get_user_orders(request: Request, session_token: Optional[str] = Cooki
         {"_id": 0}
     ).sort("created_at", -1).to_list(length=100)
     
+    # Attach current product details to order items
+    products = await find_products(db, [
+        item.get('product_id') for order in orders for item in order.get('cart_items') or []
+    ])
+    for order in orders:
+        for item in order.get('cart_items') or []:
+            item['product'] = products.get(item.get('product_id'))
+    
     return orders
 
 @api_router.post("/orders", response_model=Order)
-async def create_order(order_data: OrderCreate, request: Request, session_token: Optional[str] = Cookie(None)):
+async def create_order(order_data: OrderCreate, request: Request, session_token: Optional[str] = Cookie(None), db: AsyncIOMotorDatabase = Depends(get_db)):
     """Create new order"""
     user = await get_current_user(request, db, session_token)
     
@@ -629,17 +687,54 @@ async def create_order(order_data: OrderCreate, request: Request, session_token:
 
 # ============== REVIEW ROUTES ==============
 
+MAX_REVIEWS_PAGE = 100
+
 @api_router.get("/reviews/{product_id}", response_model=List[Review])
-async def get_product_reviews(product_id: str):
-    """Get product reviews"""
-    reviews = await db.reviews.find({"product_id": product_id}, {"_id": 0}).sort("created_at", -1).to_list(100)
+async def get_product_reviews(
+    response: Response,
+    product_id: str,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Get product reviews, newest first.
+    
+    Pass the X-Next-Cursor response header back as `cursor` to fetch the next page.
+    """
+    limit = max(1, min(limit, MAX_REVIEWS_PAGE))
+    reviews, next_cursor = await fetch_page(
+        db.reviews, {"product_id": product_id}, [("created_at", -1)], limit, cursor=cursor
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return reviews
 
+@api_router.get("/reviews/{product_id}/summary", response_model=ReviewSummary)
+async def get_review_summary(product_id: str, request: Request, response: Response, db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Average rating, review count and star histogram for a product"""
+    namespace = summary_namespace(product_id)
+    not_modified = conditional(
+        request, response, make_etag(namespace, await collection_version(namespace)),
+        max_age=15, stale_while_revalidate=60
+    )
+    if not_modified:
+        return not_modified
+    
+    async def load():
+        summary = await review_summary(db, product_id)
+        if not summary:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return summary
+    return await response_cache.get_or_load(namespace, load)
+
 @api_router.post("/reviews", response_model=Review)
-async def create_review(review_data: ReviewCreate, request: Request, session_token: Optional[str] = Cookie(None)):
+async def create_review(review_data: ReviewCreate, request: Request, session_token: Optional[str] = Cookie(None), db: AsyncIOMotorDatabase = Depends(get_db)):
     """Create product review"""
     user = await get_current_user(request, db, session_token)
     
+    if review_data.rating not in range(1, 6):
+        raise HTTPException(status_code=400, detail="Rating must be between 1 and 5")
+    
     review = Review(
         product_id=review_data.product_id,
         user_id=user['id'],
@@ -652,30 +747,23 @@ async def create_review(review_data: ReviewCreate, request: Request, session_tok
     review_dict['created_at'] = review_dict['created_at'].isoformat()
     await db.reviews.insert_one(review_dict)
     
-    reviews = await db.reviews.find({"product_id": review_data.product_id}, {"_id": 0}).to_list(1000)
-    avg_rating = sum(r['rating'] for r in reviews) / len(reviews)
-    await db.products.update_one(
-        {"id": review_data.product_id},
-        {"$set": {"rating": avg_rating, "review_count": len(reviews)}}
-    )
+    await apply_review(db, review_data.product_id, review_data.rating)
+    await response_cache.invalidate(summary_namespace(review_data.product_id))
     
     return review
 
 # ============== DEAL ROUTES ==============
 
 @api_router.get("/deals", response_model=List[Deal])
-async def get_deals():
+async def get_deals(db: AsyncIOMotorDatabase = Depends(get_db)):
     """Get active deals"""
-    now = datetime.now(timezone.utc).isoformat()
-    deals = await db.deals.find({
-        "is_active": True,
-        "start_date": {"$lte": now},
-        "end_date": {"$gte": now}
-    }, {"_id": 0}).to_list(100)
-    return deals
+    async def load():
+        # is_live is kept current by the deal scheduler, which also invalidates this cache
+        return await db.deals.find({"is_live": True}, {"_id": 0}).to_list(100)
+    return await response_cache.get_or_load("deals", load)
 
 @api_router.post("/deals", response_model=Deal)
-async def create_deal(deal_data: DealCreate, request: Request, session_token: Optional[str] = Cookie(None)):
+async def create_deal(deal_data: DealCreate, request: Request, session_token: Optional[str] = Cookie(None), db: AsyncIOMotorDatabase = Depends(get_db)):
     """Create deal (Admin only)"""
     await get_current_admin_user(request, db, session_token)
     
@@ -693,20 +781,29 @@ async def create_deal(deal_data: DealCreate, request: Request, session_token: Op
     deal_dict['created_at'] = deal_dict['created_at'].isoformat()
     deal_dict['start_date'] = deal_dict['start_date'].isoformat()
     deal_dict['end_date'] = deal_dict['end_date'].isoformat()
+    deal_dict['is_live'] = deal_is_live(deal_dict, datetime.now(timezone.utc))
     await db.deals.insert_one(deal_dict)
+    await response_cache.invalidate("deals")
+    # Reprice the deal's products now rather than at the next scheduler tick
+    await refresh_deals(db)
     
     return deal
 
 # ============== CMS ROUTES ==============
 
 @api_router.get("/cms/{page}")
-async def get_cms_sections(page: str):
+async def get_cms_sections(page: str, request: Request, response: Response, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Get CMS sections for a page"""
-    sections = await db.cms_sections.find({"page": page}, {"_id": 0}).sort("order", 1).to_list(100)
-    return sections
+    not_modified = conditional(request, response, make_etag("cms", page, await collection_version(f"cms:{page}")))
+    if not_modified:
+        return not_modified
+    
+    async def load():
+        return await db.cms_sections.find({"page": page}, {"_id": 0}).sort("order", 1).to_list(100)
+    return await response_cache.get_or_load(f"cms:{page}", load)
 
 @api_router.put("/cms/{section_id}")
-async def update_cms_section(section_id: str, update_data: CMSSectionUpdate, request: Request, session_token: Optional[str] = Cookie(None)):
+async def update_cms_section(section_id: str, update_data: CMSSectionUpdate, request: Request, session_token: Optional[str] = Cookie(None), db: AsyncIOMotorDatabase = Depends(get_db)):
     """Update CMS section (Admin only)"""
     await get_current_admin_user(request, db, session_token)
     
@@ -716,12 +813,14 @@ async def update_cms_section(section_id: str, update_data: CMSSectionUpdate, req
     await db.cms_sections.update_one({"id": section_id}, {"$set": update_dict})
     
     section = await db.cms_sections.find_one({"id": section_id}, {"_id": 0})
+    if section:
+        await response_cache.invalidate(f"cms:{section['page']}")
     return section
 
 # ============== AI CHAT ROUTES ==============
 
 @api_router.post("/chat")
-async def chat(chat_data: ChatRequest):
+async def chat(chat_data: ChatRequest, db: AsyncIOMotorDatabase = Depends(get_db)):
     """AI Shopping Assistant"""
     user_msg = ChatMessage(
         session_id=chat_data.session_id,
@@ -752,7 +851,7 @@ async def chat(chat_data: ChatRequest):
     return {"message": response}
 
 @api_router.post("/ai/generate-description")
-async def generate_product_description(product_name: str, category: str, request: Request, session_token: Optional[str] = Cookie(None)):
+async def generate_product_description(product_name: str, category: str, request: Request, session_token: Optional[str] = Cookie(None), db: AsyncIOMotorDatabase = Depends(get_db)):
     """Generate AI product description (Admin only)"""
     await get_current_admin_user(request, db, session_token)
     
@@ -774,7 +873,7 @@ class CouponValidate(BaseModel):
     code: str
 
 @api_router.post("/coupons/validate")
-async def validate_coupon(coupon_data: CouponValidate):
+async def validate_coupon(coupon_data: CouponValidate, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Validate coupon code"""
     coupon = await db.coupons.find_one({"code": coupon_data.code.upper()}, {"_id": 0})
     
@@ -801,20 +900,19 @@ async def validate_coupon(coupon_data: CouponValidate):
 # ============== WISHLIST ROUTES ==============
 
 @api_router.get("/wishlist")
-async def get_wishlist(request: Request, session_token: Optional[str] = Cookie(None)):
+async def get_wishlist(request: Request, session_token: Optional[str] = Cookie(None), db: AsyncIOMotorDatabase = Depends(get_db)):
     """Get user's wishlist"""
     user = await get_current_user(request, db, session_token)
     
     wishlist_items = await db.wishlist.find({"user_id": user['id']}, {"_id": 0}).to_list(100)
     
-    # Fetch product details
-    product_ids = [item['product_id'] for item in wishlist_items]
-    products = await db.products.find({"id": {"$in": product_ids}}, {"_id": 0}).to_list(100)
+    # Fetch product details from all collections
+    products = await find_products(db, [item['product_id'] for item in wishlist_items])
     
     # Combine wishlist items with product details
     result = []
     for item in wishlist_items:
-        product = next((p for p in products if p['id'] == item['product_id']), None)
+        product = products.get(item['product_id'])
         if product:
             result.append({
                 "wishlist_item": item,
@@ -824,7 +922,7 @@ async def get_wishlist(request: Request, session_token: Optional[str] = Cookie(N
     return result
 
 @api_router.post("/wishlist/{product_id}")
-async def add_to_wishlist(product_id: str, request: Request, session_token: Optional[str] = Cookie(None)):
+async def add_to_wishlist(product_id: str, request: Request, session_token: Optional[str] = Cookie(None), db: AsyncIOMotorDatabase = Depends(get_db)):
     """Add product to wishlist"""
     user = await get_current_user(request, db, session_token)
     
@@ -844,7 +942,7 @@ async def add_to_wishlist(product_id: str, request: Request, session_token: Opti
     return {"message": "Added to wishlist", "id": wishlist_item['id']}
 
 @api_router.delete("/wishlist/{product_id}")
-async def remove_from_wishlist(product_id: str, request: Request, session_token: Optional[str] = Cookie(None)):
+async def remove_from_wishlist(product_id: str, request: Request, session_token: Optional[str] = Cookie(None), db: AsyncIOMotorDatabase = Depends(get_db)):
     """Remove product from wishlist"""
     user = await get_current_user(request, db, session_token)
     
@@ -857,11 +955,14 @@ async def remove_from_wishlist(product_id: str, request: Request, session_token:
 
 # ============== STRIPE PAYMENT ROUTES ==============
 
-from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest
+from emergentintegrations.payments.stripe.checkout import CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest
 from pydantic import BaseModel
 from typing import Dict
-
-STRIPE_API_KEY = os.environ.get('STRIPE_API_KEY')
+from payment_gateway import get_payment_gateway, payment_gateway
+from checkout_status import checkout_status_cache
+from orders import completed_status, finalize_checkout
+from jobs import job_queue, JOB_WORKERS
+import inventory
 
 class CheckoutRequest(BaseModel):
     cart_items: List[dict]
@@ -871,7 +972,7 @@ class CheckoutRequest(BaseModel):
     coupon_code: Optional[str] = None
 
 @api_router.post("/checkout/create-session")
-async def create_checkout_session(checkout_req: CheckoutRequest, request: Request, session_token: Optional[str] = Cookie(None)):
+async def create_checkout_session(checkout_req: CheckoutRequest, request: Request, session_token: Optional[str] = Cookie(None), db: AsyncIOMotorDatabase = Depends(get_db), gateway = Depends(get_payment_gateway)):
     """Create Stripe checkout session (supports guest checkout)"""
     user = await get_current_user_optional(request, db, session_token)
     
@@ -881,18 +982,17 @@ async def create_checkout_session(checkout_req: CheckoutRequest, request: Reques
     
     # Calculate total from backend (SECURITY: Never trust frontend amounts)
     # Search across all product collections
+    products = await find_products(db, [item['product_id'] for item in checkout_req.cart_items])
     subtotal = 0.0
     for item in checkout_req.cart_items:
-        # Try all collections
-        product = await db.products.find_one({"id": item['product_id']}, {"_id": 0})
-        if not product:
-            product = await db.explore_singapore_products.find_one({"id": item['product_id']}, {"_id": 0})
-        if not product:
-            product = await db.batik_products.find_one({"id": item['product_id']}, {"_id": 0})
-        
+        product = products.get(item['product_id'])
         if product:
-            price = float(product.get('sale_price') or product.get('price'))
-            subtotal += price * item['quantity']
+            price = product.get('effective_price')
+            if price is None:
+                price = product.get('sale_price') or product.get('price')
+            # The price actually charged, for sales reports
+            item['unit_price'] = float(price)
+            subtotal += float(price) * item['quantity']
     
     # Apply coupon discount if provided
     discount_amount = 0.0
@@ -922,11 +1022,6 @@ async def create_checkout_session(checkout_req: CheckoutRequest, request: Reques
     # Calculate final amount after discount
     total_amount = max(0, subtotal - discount_amount)
     
-    # Initialize Stripe Checkout
-    host_url = str(request.base_url)
-    webhook_url = f"{host_url}api/webhook/stripe"
-    stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url=webhook_url)
-    
     # Create success and cancel URLs
     success_url = f"{checkout_req.frontend_origin}/order-success?session_id={{CHECKOUT_SESSION_ID}}"
     cancel_url = f"{checkout_req.frontend_origin}/checkout"
@@ -945,6 +1040,9 @@ async def create_checkout_session(checkout_req: CheckoutRequest, request: Reques
         metadata["coupon_code"] = coupon_data['code']
         metadata["discount_amount"] = str(discount_amount)
     
+    # Hold stock until the session is paid or abandoned
+    reservation = await inventory.reserve(db, checkout_req.cart_items, products)
+    
     # Create checkout session
     session_request = CheckoutSessionRequest(
         amount=total_amount,
@@ -954,7 +1052,12 @@ async def create_checkout_session(checkout_req: CheckoutRequest, request: Reques
         metadata=metadata
     )
     
-    session: CheckoutSessionResponse = await stripe_checkout.create_checkout_session(session_request)
+    try:
+        session: CheckoutSessionResponse = await gateway.create_checkout_session(session_request)
+    except Exception:
+        await inventory.release(db, reservation['id'])
+        raise
+    await inventory.attach_session(db, reservation['id'], session.session_id)
     
     # Store payment transaction
     transaction = {
@@ -973,107 +1076,83 @@ async def create_checkout_session(checkout_req: CheckoutRequest, request: Reques
         "shipping_address": checkout_req.shipping_address,
         "coupon": coupon_data,
         "metadata": metadata,
+        "reservation_id": reservation['id'],
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     await db.payment_transactions.insert_one(transaction)
     
     return {"url": session.url, "session_id": session.session_id}
 
-@api_router.get("/checkout/status/{session_id}")
-async def get_checkout_status(session_id: str, request: Request, session_token: Optional[str] = Cookie(None)):
-    """Get checkout session status"""
-    user = await get_current_user(request, db, session_token)
-    
-    # Initialize Stripe Checkout
-    host_url = str(request.base_url)
-    webhook_url = f"{host_url}api/webhook/stripe"
-    stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url=webhook_url)
-    
-    # Get status from Stripe
-    status_response: CheckoutStatusResponse = await stripe_checkout.get_checkout_status(session_id)
-    
-    # Find transaction
+async def _resolve_checkout_status(db: AsyncIOMotorDatabase, gateway, session_id: str) -> dict:
+    """Answer from the transaction record when possible, asking Stripe only about unpaid sessions"""
     transaction = await db.payment_transactions.find_one({"session_id": session_id}, {"_id": 0})
     
     if not transaction:
         raise HTTPException(status_code=404, detail="Transaction not found")
     
-    # Update transaction if payment completed and not already processed
-    if status_response.payment_status == "paid" and transaction['payment_status'] != "paid":
-        # Update transaction
-        await db.payment_transactions.update_one(
-            {"session_id": session_id},
-            {"$set": {
-                "payment_status": "paid",
-                "status": "completed",
-                "updated_at": datetime.now(timezone.utc).isoformat()
-            }}
-        )
-        
-        # Create order from transaction
-        order = Order(
-            user_id=transaction['user_id'],
-            items=transaction['cart_items'],
-            total_amount=transaction['amount'],
-            shipping_address=transaction['shipping_address'],
-            payment_method="stripe",
-            payment_status="paid"
-        )
-        
-        order_dict = order.model_dump()
-        order_dict['created_at'] = order_dict['created_at'].isoformat()
-        order_dict['updated_at'] = order_dict['updated_at'].isoformat()
-        await db.orders.insert_one(order_dict)
-        
-        # Clear user's cart
-        await db.cart_items.delete_many({"user_id": transaction['user_id']})
-        
-        # Send order confirmation email
-        await send_order_confirmation_email(
-            transaction['user_email'],
-            order.id,
-            transaction['amount'],
-            transaction['currency']
-        )
-        
-        return {
-            "status": "completed",
-            "payment_status": "paid",
-            "order_id": order.id,
-            "amount": status_response.amount_total / 100,
-            "currency": status_response.currency
-        }
+    # Webhook already confirmed payment
+    if transaction['payment_status'] == "paid":
+        return completed_status(transaction)
     
-    return {
+    pending = checkout_status_cache.get_pending(session_id)
+    if pending:
+        return pending
+    
+    # Get status from Stripe
+    checkout_status_cache.gateway_calls += 1
+    status_response: CheckoutStatusResponse = await gateway.get_checkout_status(session_id)
+    
+    if status_response.payment_status == "paid":
+        return await finalize_checkout(db, session_id)
+    if status_response.status == "expired" and transaction.get('reservation_id'):
+        await inventory.release(db, transaction['reservation_id'])
+    
+    status = {
         "status": status_response.status,
         "payment_status": status_response.payment_status,
         "amount": status_response.amount_total / 100,
         "currency": status_response.currency
     }
+    checkout_status_cache.set_pending(session_id, status)
+    return status
+
+@api_router.get("/checkout/status/{session_id}")
+async def get_checkout_status(session_id: str, request: Request, session_token: Optional[str] = Cookie(None), db: AsyncIOMotorDatabase = Depends(get_db), gateway = Depends(get_payment_gateway)):
+    """Get checkout session status.
+    
+    Concurrent polls for the same session share one lookup.
+    """
+    user = await get_current_user(request, db, session_token)
+    
+    return await checkout_status_cache.resolve(session_id, lambda: _resolve_checkout_status(db, gateway, session_id))
 
 @api_router.post("/webhook/stripe")
-async def stripe_webhook(request: Request):
+async def stripe_webhook(request: Request, db: AsyncIOMotorDatabase = Depends(get_db), gateway = Depends(get_payment_gateway)):
     """Handle Stripe webhooks"""
     body = await request.body()
     signature = request.headers.get("Stripe-Signature")
     
-    host_url = str(request.base_url)
-    webhook_url = f"{host_url}api/webhook/stripe"
-    stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url=webhook_url)
-    
     try:
-        webhook_response = await stripe_checkout.handle_webhook(body, signature)
+        webhook_response = await gateway.handle_webhook(body, signature)
         
         # Update transaction based on webhook event
         if webhook_response.event_type == "checkout.session.completed":
-            await db.payment_transactions.update_one(
-                {"session_id": webhook_response.session_id},
-                {"$set": {
-                    "payment_status": webhook_response.payment_status,
-                    "status": "completed",
-                    "webhook_received_at": datetime.now(timezone.utc).isoformat()
-                }}
-            )
+            session_id = webhook_response.session_id
+            checkout_status_cache.forget(session_id)
+            received_at = datetime.now(timezone.utc).isoformat()
+            
+            # Complete the order now so status polls are answered locally; retries are no-ops
+            if webhook_response.payment_status == "paid":
+                await finalize_checkout(db, session_id)
+                await db.payment_transactions.update_one(
+                    {"session_id": session_id},
+                    {"$set": {"webhook_received_at": received_at}}
+                )
+            else:
+                await db.payment_transactions.update_one(
+                    {"session_id": session_id, "payment_status": {"$ne": "paid"}},
+                    {"$set": {"payment_status": webhook_response.payment_status, "webhook_received_at": received_at}}
+                )
         
         return {"status": "success"}
     except Exception as e:
@@ -1098,7 +1177,7 @@ app.mount("/api/uploads", StaticFiles(directory="/app/uploads"), name="uploads")
 # ============== SEO ROUTES ==============
 
 @app.get("/sitemap.xml")
-async def generate_sitemap():
+async def generate_sitemap(db: AsyncIOMotorDatabase = Depends(get_db)):
     """Generate XML sitemap for SEO"""
     from fastapi.responses import Response
     
@@ -1153,6 +1232,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 # Configure logging
@@ -1162,6 +1242,22 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+background_tasks = []
+
+@app.on_event("startup")
+async def startup_db_client():
+    await database.connect()
+    await ensure_indexes(get_db())
+    background_tasks.append(asyncio.create_task(search_index.run_refresh(get_db())))
+    background_tasks.append(asyncio.create_task(inventory.run_sweeper(get_db(), payment_gateway)))
+    background_tasks.append(asyncio.create_task(run_deal_scheduler(get_db())))
+    for _ in range(JOB_WORKERS):
+        background_tasks.append(asyncio.create_task(job_queue.run_worker(get_db())))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    for task in background_tasks:
+        task.cancel()
+    await paypal_client.aclose()
+    database.close()
+    password_service.shutdown()
\ No newline at end of file
@@ -0,0 +1,74 @@
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', 10000))
+SESSION_CACHE_TTL_SECONDS = float(os.environ.get('SESSION_CACHE_TTL_SECONDS', 60))
+
+class SessionCache:
+    """LRU + TTL cache of session token -> (user, session expiry).
+
+    Methods never await, so each call is atomic on the event loop and safe to
+    use from concurrent request handlers without a lock.
+    """
+
+    def __init__(self, maxsize: int = SESSION_CACHE_SIZE, ttl: float = SESSION_CACHE_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # token -> (user, expires_at, stale_at)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token: str) -> Optional[dict]:
+        """Return the cached user for a token, or None if absent, stale or expired"""
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        user, expires_at, stale_at = entry
+        if time.monotonic() >= stale_at or expires_at < datetime.now(timezone.utc):
+            del self._entries[token]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return dict(user)
+
+    def set(self, token: str, user: dict, expires_at: datetime):
+        """Cache a validated session"""
+        self._entries[token] = (dict(user), expires_at, time.monotonic() + self.ttl)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, token: str):
+        """Drop a single session (logout)"""
+        self._entries.pop(token, None)
+
+    def invalidate_user(self, user_id: str):
+        """Drop every cached session for a user (profile or permission change)"""
+        for token in [t for t, (user, _, _) in self._entries.items() if user.get('id') == user_id]:
+            del self._entries[token]
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+session_cache = SessionCache()
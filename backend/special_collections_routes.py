@@ -1,30 +1,36 @@
-from fastapi import APIRouter, HTTPException, Request, Cookie
+from fastapi import APIRouter, HTTPException, Request, Response, Cookie, Depends
 from typing import Optional, List
 from datetime import datetime, timezone
 import uuid
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from database import get_db
 from auth import get_current_admin_user
-
-# Get DB connection
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'singgifts_db')]
+from catalog import remember, forget
+from search import search_index
+from response_cache import response_cache
+from http_cache import conditional, collection_version, make_etag
+from deals import current_price_fields
 
 special_router = APIRouter()
 
 # ============== LANDMARKS MANAGEMENT ==============
 
 @special_router.get("/api/landmarks")
-async def get_landmarks():
+async def get_landmarks(request: Request, response: Response, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Get all landmarks (public)"""
-    landmarks = await db.landmarks.find({}, {"_id": 0}).to_list(1000)
-    return landmarks
+    not_modified = conditional(request, response, make_etag("landmarks", await collection_version("landmarks")))
+    if not_modified:
+        return not_modified
+    
+    async def load():
+        return await db.landmarks.find({}, {"_id": 0}).to_list(1000)
+    return await response_cache.get_or_load("landmarks", load)
 
 @special_router.post("/api/admin/landmarks")
 async def create_landmark(
     request: Request,
-    session_token: Optional[str] = Cookie(None)
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Create new landmark (admin only)"""
     await get_current_admin_user(request, db, session_token)
@@ -41,13 +47,15 @@ async def create_landmark(
     }
     
     await db.landmarks.insert_one(landmark)
+    await response_cache.invalidate("landmarks")
     return {"message": "Landmark created successfully", "landmark": landmark}
 
 @special_router.put("/api/admin/landmarks/{landmark_id}")
 async def update_landmark(
     landmark_id: str,
     request: Request,
-    session_token: Optional[str] = Cookie(None)
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Update landmark (admin only)"""
     await get_current_admin_user(request, db, session_token)
@@ -68,6 +76,7 @@ async def update_landmark(
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Landmark not found")
+    await response_cache.invalidate("landmarks")
     
     return {"message": "Landmark updated successfully"}
 
@@ -75,18 +84,25 @@ async def update_landmark(
 async def delete_landmark(
     landmark_id: str,
     request: Request,
-    session_token: Optional[str] = Cookie(None)
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Delete landmark (admin only)"""
     await get_current_admin_user(request, db, session_token)
     
     # Also delete all products associated with this landmark
+    products = await db.explore_singapore_products.find({"landmark_id": landmark_id}, {"_id": 0, "id": 1}).to_list(None)
     await db.explore_singapore_products.delete_many({"landmark_id": landmark_id})
+    for product in products:
+        forget(product["id"])
+        search_index.remove(product["id"])
     
     result = await db.landmarks.delete_one({"id": landmark_id})
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Landmark not found")
+    await response_cache.invalidate("landmarks")
+    await response_cache.invalidate("explore_singapore_products")
     
     return {"message": "Landmark and associated products deleted successfully"}
 
@@ -94,20 +110,30 @@ async def delete_landmark(
 
 @special_router.get("/api/explore-singapore-products")
 async def get_explore_singapore_products(
-    landmark_id: Optional[str] = None
+    request: Request,
+    response: Response,
+    landmark_id: Optional[str] = None,
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Get Explore Singapore products (public)"""
+    version = await collection_version("explore_singapore_products")
+    not_modified = conditional(request, response, make_etag("explore_singapore_products", landmark_id, version))
+    if not_modified:
+        return not_modified
+    
     query = {}
     if landmark_id:
         query["landmark_id"] = landmark_id
     
-    products = await db.explore_singapore_products.find(query, {"_id": 0}).to_list(1000)
-    return products
+    async def load():
+        return await db.explore_singapore_products.find(query, {"_id": 0}).to_list(1000)
+    return await response_cache.get_or_load("explore_singapore_products", load, landmark_id=landmark_id)
 
 @special_router.post("/api/admin/explore-singapore-products")
 async def create_explore_singapore_product(
     request: Request,
-    session_token: Optional[str] = Cookie(None)
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Create Explore Singapore product (admin only)"""
     await get_current_admin_user(request, db, session_token)
@@ -130,14 +156,19 @@ async def create_explore_singapore_product(
         "updated_at": datetime.now(timezone.utc).isoformat()
     }
     
+    product.update(await current_price_fields(db, product))
     await db.explore_singapore_products.insert_one(product)
+    remember(product["id"], "explore_singapore")
+    search_index.add(product, "explore_singapore")
+    await response_cache.invalidate("explore_singapore_products")
     return {"message": "Product created successfully", "product": product}
 
 @special_router.put("/api/admin/explore-singapore-products/{product_id}")
 async def update_explore_singapore_product(
     product_id: str,
     request: Request,
-    session_token: Optional[str] = Cookie(None)
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Update Explore Singapore product (admin only)"""
     await get_current_admin_user(request, db, session_token)
@@ -155,6 +186,7 @@ async def update_explore_singapore_product(
         "images": data.get("images", []),
         "updated_at": datetime.now(timezone.utc).isoformat()
     }
+    update_data.update(await current_price_fields(db, {**update_data, "id": product_id}))
     
     result = await db.explore_singapore_products.update_one(
         {"id": product_id},
@@ -163,6 +195,8 @@ async def update_explore_singapore_product(
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
+    await search_index.refresh_product(db, product_id, "explore_singapore")
+    await response_cache.invalidate("explore_singapore_products")
     
     return {"message": "Product updated successfully"}
 
@@ -170,7 +204,8 @@ async def update_explore_singapore_product(
 async def delete_explore_singapore_product(
     product_id: str,
     request: Request,
-    session_token: Optional[str] = Cookie(None)
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Delete Explore Singapore product (admin only)"""
     await get_current_admin_user(request, db, session_token)
@@ -179,21 +214,30 @@ async def delete_explore_singapore_product(
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
+    forget(product_id)
+    search_index.remove(product_id)
+    await response_cache.invalidate("explore_singapore_products")
     
     return {"message": "Product deleted successfully"}
 
 # ============== BATIK LABEL PRODUCTS ==============
 
 @special_router.get("/api/batik-products")
-async def get_batik_products():
+async def get_batik_products(request: Request, response: Response, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Get Batik Label products (public)"""
-    products = await db.batik_products.find({}, {"_id": 0}).to_list(1000)
-    return products
+    not_modified = conditional(request, response, make_etag("batik_products", await collection_version("batik_products")))
+    if not_modified:
+        return not_modified
+    
+    async def load():
+        return await db.batik_products.find({}, {"_id": 0}).to_list(1000)
+    return await response_cache.get_or_load("batik_products", load)
 
 @special_router.post("/api/admin/batik-products")
 async def create_batik_product(
     request: Request,
-    session_token: Optional[str] = Cookie(None)
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Create Batik product (admin only)"""
     await get_current_admin_user(request, db, session_token)
@@ -215,14 +259,19 @@ async def create_batik_product(
         "updated_at": datetime.now(timezone.utc).isoformat()
     }
     
+    product.update(await current_price_fields(db, product))
     await db.batik_products.insert_one(product)
+    remember(product["id"], "batik")
+    search_index.add(product, "batik")
+    await response_cache.invalidate("batik_products")
     return {"message": "Product created successfully", "product": product}
 
 @special_router.put("/api/admin/batik-products/{product_id}")
 async def update_batik_product(
     product_id: str,
     request: Request,
-    session_token: Optional[str] = Cookie(None)
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Update Batik product (admin only)"""
     await get_current_admin_user(request, db, session_token)
@@ -239,6 +288,7 @@ async def update_batik_product(
         "images": data.get("images", []),
         "updated_at": datetime.now(timezone.utc).isoformat()
     }
+    update_data.update(await current_price_fields(db, {**update_data, "id": product_id}))
     
     result = await db.batik_products.update_one(
         {"id": product_id},
@@ -247,6 +297,8 @@ async def update_batik_product(
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
+    await search_index.refresh_product(db, product_id, "batik")
+    await response_cache.invalidate("batik_products")
     
     return {"message": "Product updated successfully"}
 
@@ -254,7 +306,8 @@ async def update_batik_product(
 async def delete_batik_product(
     product_id: str,
     request: Request,
-    session_token: Optional[str] = Cookie(None)
+    session_token: Optional[str] = Cookie(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Delete Batik product (admin only)"""
     await get_current_admin_user(request, db, session_token)
@@ -263,5 +316,8 @@ async def delete_batik_product(
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
+    forget(product_id)
+    search_index.remove(product_id)
+    await response_cache.invalidate("batik_products")
     
     return {"message": "Product deleted successfully"}
@@ -15,6 +15,7 @@ function ProductDetailPage({ user, updateCartCount }) {
   const { productId } = useParams();
   const [product, setProduct] = useState(null);
   const [reviews, setReviews] = useState([]);
+  const [reviewsCursor, setReviewsCursor] = useState(null);
   const [relatedProducts, setRelatedProducts] = useState([]);
   const [loading, setLoading] = useState(true);
   const [quantity, setQuantity] = useState(1);
@@ -33,6 +34,17 @@ function ProductDetailPage({ user, updateCartCount }) {
     }
   }, [product]);
 
+  const loadMoreReviews = async () => {
+    try {
+      const response = await axios.get(`${API}/reviews/${productId}`, { params: { cursor: reviewsCursor } });
+      setReviews(prev => [...prev, ...response.data]);
+      setReviewsCursor(response.headers['x-next-cursor'] || null);
+    } catch (error) {
+      console.error('Error fetching reviews:', error);
+      toast.error('Failed to load more reviews');
+    }
+  };
+
   const fetchProductDetails = async () => {
     try {
       const [productRes, reviewsRes] = await Promise.all([
@@ -42,6 +54,7 @@ function ProductDetailPage({ user, updateCartCount }) {
 
       setProduct(productRes.data);
       setReviews(reviewsRes.data);
+      setReviewsCursor(reviewsRes.headers['x-next-cursor'] || null);
 
       // Fetch related products based on collection type
       if (productRes.data.category_id) {
@@ -396,6 +409,16 @@ function ProductDetailPage({ user, updateCartCount }) {
                   <p className="text-gray-700 font-inter">{review.comment}</p>
                 </div>
               ))}
+              {reviewsCursor && (
+                <div className="text-center">
+                  <button
+                    onClick={loadMoreReviews}
+                    className="px-6 py-2 border border-gray-300 rounded-lg text-gray-700 font-inter hover:bg-gray-50"
+                  >
+                    Load more reviews
+                  </button>
+                </div>
+              )}
             </div>
           )}
         </div>
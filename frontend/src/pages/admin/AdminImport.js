@@ -10,6 +10,21 @@ function AdminImport() {
   const [importing, setImporting] = useState(false);
   const [importType, setImportType] = useState('products');
 
+  // Give up polling after 30 minutes; the import keeps running on the server
+  const IMPORT_POLL_MS = 2000;
+  const IMPORT_POLL_ATTEMPTS = 900;
+
+  const waitForImport = async (importId) => {
+    for (let attempt = 0; attempt < IMPORT_POLL_ATTEMPTS; attempt++) {
+      await new Promise(resolve => setTimeout(resolve, IMPORT_POLL_MS));
+      const response = await axios.get(`${API}/admin/import-csv/${importId}`, { withCredentials: true });
+      if (response.data.status !== 'running') {
+        return response.data;
+      }
+    }
+    return null;
+  };
+
   const handleFileUpload = async (e, type) => {
     const file = e.target.files[0];
     if (!file) return;
@@ -30,7 +45,19 @@ function AdminImport() {
         headers: { 'Content-Type': 'multipart/form-data' }
       });
 
-      toast.success(response.data.message || 'Import successful');
+      if (response.status === 202) {
+        // Large file: poll the background import until it finishes
+        const result = await waitForImport(response.data.import_id);
+        if (!result) {
+          toast.info('Import is still running; check the products list again later');
+        } else if (result.status === 'failed') {
+          toast.error(result.message || 'Import failed');
+        } else {
+          toast.success(result.message || 'Import successful');
+        }
+      } else {
+        toast.success(response.data.message || 'Import successful');
+      }
     } catch (error) {
       toast.error(error.response?.data?.detail || 'Import failed');
     } finally {
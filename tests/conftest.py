@@ -0,0 +1,56 @@
+"""
+Shared fixtures: backend modules on the import path and an in-memory Motor
+database (mongomock-motor) per test.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+def _project(doc, projection):
+    if doc is None or not projection:
+        return doc
+    if any(value for key, value in projection.items() if key != "_id"):
+        keep = {key for key, value in projection.items() if value}
+        doc = {key: value for key, value in doc.items() if key in keep or (key == "_id" and projection.get("_id", 1))}
+    else:
+        doc = {key: value for key, value in doc.items() if key not in projection}
+    return doc
+
+@pytest.fixture
+def db(monkeypatch):
+    database = AsyncMongoMockClient()["singgifts_test"]
+    collection_class = type(database.test)
+
+    # mongomock re-reads a ReturnDocument.AFTER result with the original filter
+    # when a projection is given, which misses once the update changed a
+    # filtered field; apply the projection here instead
+    find_one_and_update = collection_class.find_one_and_update
+
+    async def projected_find_one_and_update(self, *args, projection=None, **kwargs):
+        return _project(await find_one_and_update(self, *args, **kwargs), projection)
+
+    monkeypatch.setattr(collection_class, "find_one_and_update", projected_find_one_and_update)
+
+    # Module-level caches resolve the database through database.get_db
+    import database as database_module
+    import http_cache
+    import response_cache
+    for module in (database_module, http_cache, response_cache):
+        monkeypatch.setattr(module, "get_db", lambda: database)
+
+    # Process-wide state must not leak between tests
+    from collections import OrderedDict
+    import catalog
+    monkeypatch.setattr(catalog, "_routes", OrderedDict())
+    monkeypatch.setattr(http_cache, "_versions", {})
+    monkeypatch.setattr(response_cache.response_cache, "backend", response_cache.MemoryBackend())
+    return database
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from checkout_status import CheckoutStatusCache
+
+pytestmark = pytest.mark.anyio
+
+async def test_concurrent_polls_share_one_resolution():
+    cache = CheckoutStatusCache()
+    calls = []
+    release = asyncio.Event()
+
+    async def resolver():
+        calls.append(1)
+        await release.wait()
+        return {"payment_status": "unpaid"}
+
+    polls = [asyncio.create_task(cache.resolve("cs_1", resolver)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+    assert await asyncio.gather(*polls) == [{"payment_status": "unpaid"}] * 5
+    assert len(calls) == 1
+    assert cache.stats()["coalesced"] == 4
+    assert cache.stats()["in_flight"] == 0
+
+async def test_failure_reaches_every_waiter_and_is_not_kept():
+    cache = CheckoutStatusCache()
+    release = asyncio.Event()
+
+    async def failing():
+        await release.wait()
+        raise RuntimeError("stripe timeout")
+
+    polls = [asyncio.create_task(cache.resolve("cs_1", failing)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*polls, return_exceptions=True)
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+    async def paid():
+        return {"payment_status": "paid"}
+
+    assert await cache.resolve("cs_1", paid) == {"payment_status": "paid"}
+
+async def test_pending_status_expires(monkeypatch):
+    cache = CheckoutStatusCache(ttl=3)
+    clock = [100.0]
+    monkeypatch.setattr("checkout_status.time.monotonic", lambda: clock[0])
+
+    cache.set_pending("cs_1", {"payment_status": "unpaid"})
+    assert cache.get_pending("cs_1") == {"payment_status": "unpaid"}
+    clock[0] += 3
+    assert cache.get_pending("cs_1") is None
+
+    cache.set_pending("cs_1", {"payment_status": "unpaid"})
+    cache.forget("cs_1")
+    assert cache.get_pending("cs_1") is None
+    assert cache.stats()["pending_hits"] == 1
+
+def test_pending_cache_is_bounded(monkeypatch):
+    cache = CheckoutStatusCache(ttl=3, maxsize=2)
+    clock = [100.0]
+    monkeypatch.setattr("checkout_status.time.monotonic", lambda: clock[0])
+    cache.set_pending("cs_1", {})
+    clock[0] += 5
+    cache.set_pending("cs_2", {})
+    cache.set_pending("cs_3", {})
+    assert cache.stats()["pending_sessions"] == 2
+    assert cache.get_pending("cs_1") is None
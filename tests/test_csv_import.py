@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import csv_import
+from db_indexes import INDEX_VERSION, dedupe_skus, ensure_indexes
+
+pytestmark = pytest.mark.anyio
+
+HEADER = "sku,name,description,price,stock,category_id\n"
+
+def _csv(tmp_path, name, rows):
+    path = tmp_path / name
+    path.write_text(HEADER + "".join(f"{row}\n" for row in rows), encoding="utf-8")
+    return str(path)
+
+async def test_products_upsert_on_sku(db, tmp_path):
+    first = _csv(tmp_path, "first.csv", [
+        "SG-1,Merlion keychain,Brass,12.5,10,souvenirs",
+        "SG-2,Orchid brooch,Enamel,30,5,jewellery",
+        "SG-3,,No name,1,1,souvenirs",
+    ])
+    result = await csv_import.run_import(db, first, "products")
+    assert (result["imported_count"], result["updated_count"], result["error_count"]) == (2, 0, 1)
+    assert result["errors"] == ["Row 4: missing name"]
+    keychain = await db.products.find_one({"sku": "SG-1"})
+
+    second = _csv(tmp_path, "second.csv", [
+        "SG-1,Merlion keychain,Brass,14,7,souvenirs",
+        "SG-4,Batik fan,Silk,20,3,souvenirs",
+    ])
+    result = await csv_import.run_import(db, second, "products")
+    assert (result["imported_count"], result["updated_count"], result["error_count"]) == (1, 1, 0)
+
+    updated = await db.products.find_one({"sku": "SG-1"})
+    assert updated["id"] == keychain["id"]
+    assert updated["created_at"] == keychain["created_at"]
+    assert (updated["price"], updated["stock"]) == (14.0, 7)
+    assert await db.products.count_documents({}) == 3
+
+async def test_dedupe_skus_keeps_oldest(db):
+    await db.products.insert_many([
+        {"id": "new", "sku": "SG-1", "created_at": "2024-03-01T00:00:00+00:00"},
+        {"id": "old", "sku": "SG-1", "created_at": "2024-01-01T00:00:00+00:00"},
+        {"id": "mid", "sku": "SG-1", "created_at": "2024-02-01T00:00:00+00:00"},
+        {"id": "solo", "sku": "SG-2", "created_at": "2024-01-01T00:00:00+00:00"},
+    ])
+    await db.batik_products.insert_one({"id": "b", "sku": "SG-1", "created_at": "2024-01-01T00:00:00+00:00"})
+
+    assert await dedupe_skus(db) == 2
+    skus = {p["id"]: p["sku"] async for p in db.products.find()}
+    assert skus == {"old": "SG-1", "mid": "SG-1-DUP2", "new": "SG-1-DUP3", "solo": "SG-2"}
+    assert (await db.batik_products.find_one({"id": "b"}))["sku"] == "SG-1"
+    assert await dedupe_skus(db) == 0
+
+async def test_reimport_reprices_products(db, tmp_path):
+    await csv_import.run_import(db, _csv(tmp_path, "first.csv", [
+        "SG-1,Merlion keychain,Brass,10,10,souvenirs",
+        "SG-2,Orchid brooch,Enamel,40,5,jewellery",
+    ]), "products")
+    brooch = await db.products.find_one({"sku": "SG-2"})
+    assert (await db.products.find_one({"sku": "SG-1"}))["effective_price"] == 10.0
+    await db.deals.insert_one({"id": "d1", "product_ids": [brooch["id"]], "discount_percentage": 25, "is_active": True})
+
+    await csv_import.run_import(db, _csv(tmp_path, "second.csv", [
+        "SG-1,Merlion keychain,Brass,20,10,souvenirs",
+        "SG-2,Orchid brooch,Enamel,60,5,jewellery",
+    ]), "products")
+    keychain = await db.products.find_one({"sku": "SG-1"})
+    assert (keychain["price"], keychain["effective_price"], keychain["deal_active"]) == (20.0, 20.0, False)
+    brooch = await db.products.find_one({"sku": "SG-2"})
+    assert (brooch["effective_price"], brooch["deal_active"]) == (45.0, True)
+
+async def test_ensure_indexes_leaves_duplicate_skus_alone(db):
+    await db.products.insert_many([
+        {"id": "old", "sku": "SG-1", "created_at": "2024-01-01T00:00:00+00:00"},
+        {"id": "new", "sku": "SG-1", "created_at": "2024-02-01T00:00:00+00:00"},
+    ])
+    await db.batik_products.insert_one({"id": "b", "sku": "SG-1"})
+
+    drift = await ensure_indexes(db)
+    assert drift["products"]["missing"] == ["sku_1"]
+    assert "batik_products" not in drift
+    assert [p["sku"] async for p in db.products.find()] == ["SG-1", "SG-1"]
+    assert await db.schema_migrations.find_one({"_id": "indexes"}) is None
+
+    assert await dedupe_skus(db) == 1
+    assert await ensure_indexes(db) == {}
+    assert (await db.products.index_information())["sku_1"]["unique"]
+    assert (await db.schema_migrations.find_one({"_id": "indexes"}))["version"] == INDEX_VERSION
+
+async def test_import_without_heartbeat_is_reported_failed(db):
+    now = datetime.now(timezone.utc)
+    await db.csv_imports.insert_many([
+        {"id": "alive", "status": "running", "updated_at": now},
+        {"id": "dead", "status": "running", "updated_at": now - timedelta(hours=1)},
+        {"id": "done", "status": "completed", "updated_at": now - timedelta(hours=1)},
+    ])
+
+    assert (await csv_import.import_status(db, "alive"))["status"] == "running"
+    dead = await csv_import.import_status(db, "dead")
+    assert dead["status"] == "failed"
+    assert (await db.csv_imports.find_one({"id": "dead"}))["status"] == "failed"
+    assert (await csv_import.import_status(db, "done"))["status"] == "completed"
+    assert await csv_import.import_status(db, "missing") is None
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from deals import price_fields, refresh_deals
+
+pytestmark = pytest.mark.anyio
+
+NOW = datetime(2024, 5, 1, 12, tzinfo=timezone.utc)
+
+def _iso(moment: datetime) -> str:
+    return moment.isoformat()
+
+def test_price_fields_take_the_best_live_discount():
+    product = {"id": "p1", "price": 100, "sale_price": 90}
+    assert price_fields(product, {}, NOW) == {"deal_active": False, "effective_price": 90.0}
+    assert price_fields(product, {"p1": 20}, NOW) == {"deal_active": True, "effective_price": 80.0}
+    # A sale price below the discounted price still wins
+    assert price_fields(product, {"p1": 5}, NOW) == {"deal_active": True, "effective_price": 90.0}
+
+    own_deal = {**product, "is_on_deal": True, "deal_percentage": 30,
+                "deal_start_date": _iso(NOW - timedelta(days=1)), "deal_end_date": _iso(NOW + timedelta(days=1))}
+    assert price_fields(own_deal, {"p1": 20}, NOW) == {"deal_active": True, "effective_price": 70.0}
+    expired = {**own_deal, "deal_end_date": _iso(NOW - timedelta(hours=1))}
+    assert price_fields(expired, {}, NOW) == {"deal_active": False, "effective_price": 90.0}
+
+async def test_refresh_deals_materializes_state_and_next_boundary(db):
+    now = datetime.now(timezone.utc)
+    ends = now + timedelta(hours=2)
+    await db.deals.insert_many([
+        {"id": "live", "product_ids": ["p1"], "discount_percentage": 25, "is_active": True,
+         "start_date": _iso(now - timedelta(days=1)), "end_date": _iso(ends)},
+        {"id": "future", "product_ids": ["b1"], "discount_percentage": 50, "is_active": True,
+         "start_date": _iso(now + timedelta(days=1)), "end_date": _iso(now + timedelta(days=2))},
+    ])
+    await db.products.insert_many([
+        {"id": "p1", "price": 40.0},
+        {"id": "p2", "price": 10.0, "effective_price": 10.0, "deal_active": False},
+    ])
+    await db.batik_products.insert_one({"id": "b1", "price": 80.0})
+
+    changed, next_boundary = await refresh_deals(db)
+    assert changed == 4
+    assert abs((next_boundary - ends).total_seconds()) < 1
+    assert {d["id"]: d["is_live"] async for d in db.deals.find()} == {"live": True, "future": False}
+    p1 = await db.products.find_one({"id": "p1"})
+    assert (p1["deal_active"], p1["effective_price"]) == (True, 30.0)
+    b1 = await db.batik_products.find_one({"id": "b1"})
+    assert (b1["deal_active"], b1["effective_price"]) == (False, 80.0)
+
+    # Nothing changed since: nothing is rewritten
+    assert (await refresh_deals(db))[0] == 0
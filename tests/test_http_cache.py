@@ -0,0 +1,98 @@
+import pytest
+from fastapi import Request, Response
+
+import catalog
+import http_cache
+import inventory
+import orders
+from http_cache import collection_version, conditional, make_etag
+from response_cache import response_cache
+from reviews import apply_review, rebuild_review_stats, summary_namespace
+
+pytestmark = pytest.mark.anyio
+
+def _request(if_none_match=None) -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+async def _batik_etag() -> str:
+    # Read past the per-worker version memo, as another worker would
+    http_cache._versions.clear()
+    return make_etag("batik_products", await collection_version("batik_products"))
+
+def test_conditional_returns_304_for_matching_etag():
+    etag = make_etag("categories", 3)
+
+    response = Response()
+    assert conditional(_request(), response, etag) is None
+    assert response.headers["ETag"] == etag
+
+    not_modified = conditional(_request(f'"other", {etag[2:]}'), Response(), etag)
+    assert not_modified.status_code == 304
+    assert not_modified.headers["ETag"] == etag
+
+async def test_invalidate_drops_cached_list_and_moves_etag(db):
+    loads = []
+
+    async def load():
+        loads.append(1)
+        return [{"id": "b1"}]
+
+    await response_cache.get_or_load("batik_products", load)
+    await response_cache.get_or_load("batik_products", load)
+    before = await _batik_etag()
+    await response_cache.invalidate_products(["batik", "general"])
+    await response_cache.get_or_load("batik_products", load)
+
+    assert len(loads) == 2
+    assert await _batik_etag() != before
+
+async def test_review_changes_list_etag(db):
+    await db.batik_products.insert_one({"id": "b1", "name": "Sarong"})
+    # Routed lookup; the cold-path $unionWith is not available in mongomock
+    catalog.remember("b1", "batik")
+    before = await _batik_etag()
+
+    assert await apply_review(db, "b1", 4)
+    assert await _batik_etag() != before
+
+async def test_rebuild_review_stats_invalidates_summaries(db):
+    await db.batik_products.insert_many([
+        {"id": "b1", "name": "Sarong"},
+        {"id": "b2", "name": "Scarf", "review_count": 2, "rating": 5},
+    ])
+    await db.reviews.insert_many([{"product_id": "b1", "rating": 3}, {"product_id": "b1", "rating": 5}])
+    http_cache._versions.clear()
+    summaries = {pid: await collection_version(summary_namespace(pid)) for pid in ("b1", "b2")}
+    before = await _batik_etag()
+
+    await rebuild_review_stats(db)
+
+    http_cache._versions.clear()
+    for pid, version in summaries.items():
+        assert await collection_version(summary_namespace(pid)) > version
+    assert await _batik_etag() != before
+    assert (await db.batik_products.find_one({"id": "b2"}))["review_count"] == 0
+
+async def test_stock_writes_change_list_etag(db):
+    await db.batik_products.insert_one({"id": "b1", "name": "Sarong", "stock": 5})
+
+    before = await _batik_etag()
+    reservation = await inventory.reserve(db, [{"product_id": "b1", "quantity": 2}])
+    after_reserve = await _batik_etag()
+    assert after_reserve != before
+
+    assert await inventory.release(db, reservation['id'])
+    after_release = await _batik_etag()
+    assert after_release != after_reserve
+
+    # Paid after release: stock is taken again
+    assert await inventory.commit(db, reservation['id'])
+    assert await _batik_etag() != after_release
+
+async def test_record_sales_changes_list_etag(db):
+    await db.batik_products.insert_one({"id": "b1", "name": "Sarong", "stock": 5})
+    before = await _batik_etag()
+
+    await orders.record_sales_job(db, {"items": [{"product_id": "b1", "quantity": 1}]})
+    assert await _batik_etag() != before
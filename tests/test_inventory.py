@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+import catalog
+import inventory
+
+pytestmark = pytest.mark.anyio
+
+class Gateway:
+    """Stands in for the payment gateway's expire_session"""
+
+    def __init__(self, paid=(), failing=()):
+        self.paid = set(paid)
+        self.failing = set(failing)
+        self.expired = []
+
+    async def expire_session(self, session_id):
+        if session_id in self.failing:
+            raise RuntimeError("gateway unavailable")
+        if session_id in self.paid:
+            return False
+        self.expired.append(session_id)
+        return True
+
+async def _stock(db, product_id):
+    return (await db.products.find_one({"id": product_id}))['stock']
+
+async def _lapse(db, reservation_id):
+    await db.stock_reservations.update_one(
+        {"id": reservation_id},
+        {"$set": {"expires_at": datetime.now(timezone.utc) - timedelta(minutes=1)}}
+    )
+
+@pytest.fixture
+async def product(db):
+    await db.products.insert_one({"id": "p1", "name": "Merlion keychain", "stock": 2})
+    catalog.remember("p1", "general")
+    return "p1"
+
+async def test_reserve_never_takes_more_than_stock(db, product):
+    reservation = await inventory.reserve(db, [{"product_id": product, "quantity": 2}])
+    assert await _stock(db, product) == 0
+    assert reservation['items'] == [{"product_id": product, "collection_type": "general", "quantity": 2}]
+
+    with pytest.raises(HTTPException) as excinfo:
+        await inventory.reserve(db, [{"product_id": product, "quantity": 1}])
+    assert excinfo.value.status_code == 409
+    assert await _stock(db, product) == 0
+
+async def test_sweeper_expires_session_then_releases(db, product):
+    reservation = await inventory.reserve(db, [{"product_id": product, "quantity": 1}])
+    await inventory.attach_session(db, reservation['id'], "cs_1")
+    await _lapse(db, reservation['id'])
+    gateway = Gateway()
+
+    assert await inventory.release_expired(db, gateway) == 1
+    assert gateway.expired == ["cs_1"]
+    assert await _stock(db, product) == 2
+    assert (await db.stock_reservations.find_one({"id": reservation['id']}))['status'] == "released"
+
+async def test_sweeper_keeps_hold_when_session_was_paid_or_unreachable(db, product):
+    paid = await inventory.reserve(db, [{"product_id": product, "quantity": 1}])
+    unreachable = await inventory.reserve(db, [{"product_id": product, "quantity": 1}])
+    await inventory.attach_session(db, paid['id'], "cs_paid")
+    await inventory.attach_session(db, unreachable['id'], "cs_down")
+    await _lapse(db, paid['id'])
+    await _lapse(db, unreachable['id'])
+
+    assert await inventory.release_expired(db, Gateway(paid={"cs_paid"}, failing={"cs_down"})) == 0
+    assert await _stock(db, product) == 0
+
+    held = await db.stock_reservations.find_one({"id": paid['id']})
+    assert held['status'] == "held"
+    assert held['expires_at'].replace(tzinfo=timezone.utc) > datetime.now(timezone.utc)
+    assert await inventory.commit(db, paid['id'])
+    assert await _stock(db, product) == 0
+
+async def test_commit_after_release_does_not_oversell(db, product):
+    late = await inventory.reserve(db, [{"product_id": product, "quantity": 2}])
+    await inventory.release(db, late['id'])
+    await inventory.reserve(db, [{"product_id": product, "quantity": 1}])
+
+    assert await inventory.commit(db, late['id'])
+    assert await _stock(db, product) == 1
+    committed = await db.stock_reservations.find_one({"id": late['id']})
+    assert committed['status'] == "committed"
+    assert [item['product_id'] for item in committed['shortfall']] == [product]
+
+async def test_commit_is_once_only(db, product):
+    reservation = await inventory.reserve(db, [{"product_id": product, "quantity": 1}])
+    assert await inventory.commit(db, reservation['id'])
+    assert not await inventory.commit(db, reservation['id'])
+    assert not await inventory.release(db, reservation['id'])
+    assert await _stock(db, product) == 1
@@ -0,0 +1,98 @@
+from datetime import timedelta
+
+import pytest
+
+import jobs
+from db_indexes import INDEXES
+from jobs import JobQueue
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+def queue():
+    queue = JobQueue()
+    queue.calls = []
+    queue.failures = 0
+
+    @queue.handler("flaky")
+    async def flaky(db, payload):
+        queue.calls.append(payload)
+        if queue.failures:
+            queue.failures -= 1
+            raise RuntimeError("smtp timeout")
+
+    return queue
+
+async def _run_due(db, queue) -> bool:
+    """Claim and run one due job, as a worker would"""
+    job = await queue._claim(db)
+    if job is None:
+        return False
+    await queue._run(db, job)
+    return True
+
+async def _make_due(db):
+    await db.jobs.update_many({"status": "queued"}, {"$set": {"run_at": jobs._now() - timedelta(seconds=1)}})
+
+async def test_failed_job_is_retried_with_backoff(db, queue):
+    queue.failures = 2
+    await queue.enqueue(db, "flaky", {"n": 1})
+
+    assert await _run_due(db, queue)
+    job = await db.jobs.find_one({})
+    assert (job["status"], job["attempts"]) == ("queued", 1)
+    assert job["last_error"] == "RuntimeError: smtp timeout"
+    # Backing off: not due yet
+    assert not await _run_due(db, queue)
+
+    for _ in range(2):
+        await _make_due(db)
+        assert await _run_due(db, queue)
+    job = await db.jobs.find_one({})
+    assert (job["status"], job["attempts"]) == ("done", 3)
+    assert len(queue.calls) == 3
+    assert (queue.processed, queue.failed) == (1, 2)
+
+async def test_job_is_dead_lettered_then_retried(db, queue):
+    queue.failures = 5
+    await queue.enqueue(db, "flaky", {"n": 1}, max_attempts=2)
+    assert await _run_due(db, queue)
+    await _make_due(db)
+    assert await _run_due(db, queue)
+
+    job = await db.jobs.find_one({})
+    assert job["status"] == "dead"
+    await _make_due(db)
+    assert not await _run_due(db, queue)
+    assert (await queue.stats(db))["dead"] == 1
+
+    queue.failures = 0
+    assert await queue.retry(db, job["id"])
+    assert await _run_due(db, queue)
+    assert (await db.jobs.find_one({}))["status"] == "done"
+
+async def test_expired_lease_is_reclaimed(db, queue):
+    await queue.enqueue(db, "flaky", {"n": 1})
+    job = await queue._claim(db)
+    assert job["status"] == "running"
+    assert await queue._claim(db) is None
+
+    # The worker died holding the lease
+    await db.jobs.update_one({"id": job["id"]}, {"$set": {"locked_until": jobs._now() - timedelta(seconds=1)}})
+    assert await _run_due(db, queue)
+    job = await db.jobs.find_one({})
+    assert (job["status"], job["attempts"]) == ("done", 2)
+
+async def test_keyed_jobs_are_queued_once(db, queue):
+    await db.jobs.create_indexes(INDEXES["jobs"])
+    assert await queue.enqueue(db, "flaky", {"n": 1}, key="flaky:1")
+    assert not await queue.enqueue(db, "flaky", {"n": 1}, key="flaky:1")
+    assert await queue.enqueue_many(db, [("flaky", {"n": 1}, "flaky:1"), ("flaky", {"n": 2}, "flaky:2")]) == 1
+    assert await db.jobs.count_documents({}) == 2
+
+async def test_unknown_job_type_fails(db, queue):
+    await queue.enqueue(db, "missing", {}, max_attempts=1)
+    assert await _run_due(db, queue)
+    job = await db.jobs.find_one({})
+    assert job["status"] == "dead"
+    assert "No handler registered" in job["last_error"]
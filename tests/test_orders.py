@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+
+import orders
+
+pytestmark = pytest.mark.anyio
+
+ITEMS = [{"product_id": "p1", "quantity": 2}, {"product_id": "b1", "quantity": 1}]
+
+async def _catalog(db):
+    await db.products.insert_one({"id": "p1", "stock": 10, "sold_count": 0})
+    await db.batik_products.insert_one({"id": "b1", "stock": 4, "sold_count": 5})
+    await db.orders.insert_one({"id": "o1"})
+
+async def _product(db, collection: str, product_id: str) -> dict:
+    return await db[collection].find_one({"id": product_id}, {"_id": 0})
+
+async def test_record_sales_applies_once_per_order(db):
+    await _catalog(db)
+    payload = {"order_id": "o1", "items": ITEMS}
+
+    await orders.record_sales_job(db, payload)
+    await orders.record_sales_job(db, payload)
+
+    assert (await _product(db, "products", "p1"))["sold_count"] == 2
+    assert (await _product(db, "batik_products", "b1"))["sold_count"] == 6
+
+async def test_record_sales_rerun_after_partial_failure(db, monkeypatch):
+    await _catalog(db)
+    payload = {"order_id": "o1", "items": ITEMS}
+    collection_class = type(db.batik_products)
+    update_one = collection_class.update_one
+
+    async def failing_update_one(self, filter, update, *args, **kwargs):
+        if self.name == "batik_products":
+            raise RuntimeError("primary stepped down")
+        return await update_one(self, filter, update, *args, **kwargs)
+
+    monkeypatch.setattr(collection_class, "update_one", failing_update_one)
+    with pytest.raises(RuntimeError):
+        await orders.record_sales_job(db, payload)
+    monkeypatch.setattr(collection_class, "update_one", update_one)
+
+    # The retry only applies what the failed run did not
+    await orders.record_sales_job(db, payload)
+    assert (await _product(db, "products", "p1"))["sold_count"] == 2
+    assert (await _product(db, "batik_products", "b1"))["sold_count"] == 6
+
+async def test_decrement_stock_applies_once_and_never_below_zero(db):
+    await _catalog(db)
+    payload = {"order_id": "o1", "items": [{"product_id": "p1", "quantity": 3}, {"product_id": "b1", "quantity": 9}]}
+
+    await orders.decrement_stock_job(db, payload)
+    await orders.decrement_stock_job(db, payload)
+
+    assert (await _product(db, "products", "p1"))["stock"] == 7
+    assert (await _product(db, "batik_products", "b1"))["stock"] == 0
+
+async def test_guarded_job_for_unknown_order_fails(db):
+    await _catalog(db)
+    with pytest.raises(RuntimeError):
+        await orders.record_sales_job(db, {"order_id": "missing", "items": ITEMS})
+
+def _transaction(session_id: str) -> dict:
+    return {
+        "id": session_id, "session_id": session_id, "user_id": "u1", "user_email": "buyer@example.com", "amount": 25.0, "currency": "sgd",
+        "payment_status": "pending", "cart_items": [{"product_id": "p1", "product_name": "Merlion keychain", "quantity": 1, "price": 25.0}],
+        "shipping_address": {"line1": "1 Merlion Walk", "postal_code": "049213"},
+    }
+
+async def test_finalize_checkout_creates_one_order_under_concurrency(db):
+    await db.payment_transactions.insert_one(_transaction("cs_1"))
+
+    # Webhook and status polls racing each other
+    results = await asyncio.gather(*(orders.finalize_checkout(db, "cs_1") for _ in range(3)))
+    transaction = await db.payment_transactions.find_one({"session_id": "cs_1"})
+    assert {result["order_id"] for result in results} == {transaction["order_id"]}
+    assert all(result["status"] == "completed" for result in results)
+
+    order = await db.orders.find_one({"id": transaction["order_id"]})
+    assert order["idempotency_key"] == orders.idempotency_key("cs_1")
+    assert await db.orders.count_documents({}) == 1
+    jobs = [job["key"] async for job in db.jobs.find()]
+    assert sorted(jobs) == sorted(set(jobs))
+    assert f"record_sales:{order['id']}" in jobs
+
+async def test_finalize_checkout_adopts_order_from_lost_claim(db):
+    await db.payment_transactions.insert_one(_transaction("cs_1"))
+    await db.orders.insert_one({"id": "o-earlier", "idempotency_key": orders.idempotency_key("cs_1")})
+    await db.orders.create_index("idempotency_key", unique=True)
+
+    result = await orders.finalize_checkout(db, "cs_1")
+    assert result["order_id"] == "o-earlier"
+    assert (await db.payment_transactions.find_one({"session_id": "cs_1"}))["order_id"] == "o-earlier"
+    assert await db.orders.count_documents({}) == 1
+    assert await db.jobs.count_documents({"key": "record_sales:o-earlier"}) == 1
+
+async def test_finalize_unknown_session(db):
+    assert await orders.finalize_checkout(db, "cs_missing") is None
+
+async def test_finalize_checkout_after_admin_status_edit(db):
+    # An admin edit on a pending transaction writes updated_at
+    await db.payment_transactions.insert_one({**_transaction("cs_1"), "status": "processing", "updated_at": "2024-05-01T00:00:00+00:00"})
+
+    result = await orders.finalize_checkout(db, "cs_1")
+    transaction = await db.payment_transactions.find_one({"session_id": "cs_1"})
+    assert result["order_id"] == transaction["order_id"]
+    assert transaction["payment_status"] == "paid"
+    assert await db.orders.count_documents({}) == 1
+
+async def test_failed_order_insert_restores_transaction(db, monkeypatch):
+    await db.payment_transactions.insert_one({**_transaction("cs_1"), "status": "processing", "updated_at": "then"})
+    collection_class = type(db.orders)
+    insert_one = collection_class.insert_one
+
+    async def failing_insert_one(self, document, *args, **kwargs):
+        if self.name == "orders":
+            raise RuntimeError("primary stepped down")
+        return await insert_one(self, document, *args, **kwargs)
+
+    monkeypatch.setattr(collection_class, "insert_one", failing_insert_one)
+    with pytest.raises(RuntimeError):
+        await orders.finalize_checkout(db, "cs_1")
+    transaction = await db.payment_transactions.find_one({"session_id": "cs_1"}, {"_id": 0})
+    assert (transaction["payment_status"], transaction["status"], transaction["updated_at"]) == ("pending", "processing", "then")
+    assert "order_id" not in transaction and "finalized_at" not in transaction
+
+    # Not claimable while the claim is held elsewhere: the stored status is reported, not a paid one
+    await db.payment_transactions.update_one({"session_id": "cs_1"}, {"$set": {"order_id": "o-other"}})
+    monkeypatch.setattr(collection_class, "insert_one", insert_one)
+    result = await orders.finalize_checkout(db, "cs_1")
+    assert (result["status"], result["payment_status"]) == ("processing", "pending")
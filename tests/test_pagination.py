@@ -0,0 +1,61 @@
+import pytest
+from fastapi import HTTPException
+
+from pagination import count_by, decode_cursor, encode_cursor, fetch_page, keyset_filter
+
+pytestmark = pytest.mark.anyio
+
+async def _all_pages(collection, sort, limit):
+    seen, cursor = [], None
+    while True:
+        docs, cursor = await fetch_page(collection, {}, sort, limit, cursor=cursor)
+        seen += [doc['id'] for doc in docs]
+        if not cursor:
+            return seen
+
+def test_cursor_round_trip_and_sort_mismatch():
+    sort = [("rating", -1), ("id", 1)]
+    cursor = encode_cursor(sort, {"rating": 4.5, "id": "p1"})
+    assert decode_cursor(cursor, sort) == [4.5, "p1"]
+    with pytest.raises(HTTPException):
+        decode_cursor(cursor, [("price", 1), ("id", 1)])
+    with pytest.raises(HTTPException):
+        decode_cursor("not-a-cursor", sort)
+
+def test_keyset_filter_descending_includes_nulls():
+    after = keyset_filter([("rating", -1), ("id", 1)], [3.0, "p1"])
+    assert after == {"$or": [
+        {"$or": [{"rating": {"$lt": 3.0}}, {"rating": None}]},
+        {"rating": 3.0, "id": {"$gt": "p1"}},
+    ]}
+
+async def test_pages_cover_every_document_once(db):
+    await db.products.insert_many([{"id": f"p{i:02d}", "price": i % 4} for i in range(23)])
+
+    ids = await _all_pages(db.products, [("price", 1), ("id", 1)], 5)
+    assert len(ids) == 23 and len(set(ids)) == 23
+
+@pytest.mark.parametrize("direction", [1, -1])
+async def test_pages_cross_null_boundary(db, direction):
+    # Imported products may have no rating at all, or an explicit null
+    await db.products.insert_many(
+        [{"id": f"r{i}", "rating": float(i % 3)} for i in range(7)]
+        + [{"id": f"n{i}"} for i in range(4)]
+        + [{"id": f"z{i}", "rating": None} for i in range(2)]
+    )
+    expected = [doc['id'] async for doc in db.products.find({}).sort([("rating", direction), ("id", 1)])]
+
+    for limit in (1, 2, 3, 5):
+        assert await _all_pages(db.products, [("rating", direction)], limit) == expected
+
+async def test_count_by_groups_in_one_query(db):
+    await db.payment_transactions.insert_many([
+        {"user_id": "a", "payment_status": "paid"},
+        {"user_id": "a", "payment_status": "paid"},
+        {"user_id": "b", "payment_status": "pending"},
+        {"user_id": "c", "payment_status": "paid"},
+    ])
+
+    counts = await count_by(db.payment_transactions, "user_id", ["a", "b", "d"], {"payment_status": "paid"})
+    assert counts == {"a": 2, "b": 0, "d": 0}
+    assert await count_by(db.payment_transactions, "user_id", []) == {}
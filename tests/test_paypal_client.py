@@ -0,0 +1,112 @@
+import httpx
+import pytest
+
+import paypal_client
+import paypal_stub
+from paypal_client import PayPalClient, PayPalUnavailable
+
+pytestmark = pytest.mark.anyio
+
+ENDPOINT = "http://paypal-stub/nvp"
+
+class FlakyTransport(httpx.AsyncBaseTransport):
+    """The stub app behind a transport that fails the first connect_failures requests"""
+
+    def __init__(self, connect_failures: int = 0):
+        self.inner = httpx.ASGITransport(app=paypal_stub.app)
+        self.connect_failures = connect_failures
+        self.requests = 0
+
+    async def handle_async_request(self, request):
+        self.requests += 1
+        if self.requests <= self.connect_failures:
+            raise httpx.ConnectError("connection refused", request=request)
+        return await self.inner.handle_async_request(request)
+
+@pytest.fixture
+def stub(monkeypatch):
+    monkeypatch.setattr(paypal_client, "PAYPAL_RETRY_BASE_SECONDS", 0)
+    monkeypatch.setattr(paypal_stub, "checkouts", {})
+    monkeypatch.setattr(paypal_stub, "PAYPAL_STUB_FAIL_RATE", 0)
+    return paypal_stub
+
+def _client(transport=None) -> PayPalClient:
+    client = PayPalClient(endpoint=ENDPOINT, max_retries=2)
+    client._client = httpx.AsyncClient(transport=transport or FlakyTransport())
+    return client
+
+def _fail_next(monkeypatch, failures: int):
+    """Make the stub answer the next calls with 503"""
+    outcomes = iter([0.0] * failures)
+    monkeypatch.setattr(paypal_stub, "PAYPAL_STUB_FAIL_RATE", 0.5)
+    monkeypatch.setattr(paypal_stub.random, "random", lambda: next(outcomes, 1.0))
+
+async def test_express_checkout_flow(stub):
+    client = _client()
+    try:
+        started = await client.call("SetExpressCheckout", {"PAYMENTREQUEST_0_AMT": "42.50", "PAYMENTREQUEST_0_CURRENCYCODE": "SGD"})
+        assert started["ACK"] == "Success"
+        token = started["TOKEN"]
+
+        details = await client.call("GetExpressCheckoutDetails", {"TOKEN": token})
+        assert details["CHECKOUTSTATUS"] == "PaymentActionNotInitiated"
+        assert details["PAYMENTREQUEST_0_AMT"] == "42.50"
+
+        paid = await client.call("DoExpressCheckoutPayment", {"TOKEN": token, "PAYERID": details["PAYERID"], "PAYMENTREQUEST_0_AMT": "42.50"})
+        assert paid["PAYMENTINFO_0_PAYMENTSTATUS"] == "Completed"
+
+        again = await client.call("DoExpressCheckoutPayment", {"TOKEN": token, "PAYERID": details["PAYERID"]})
+        assert again["ACK"] == "Failure"
+    finally:
+        await client.aclose()
+
+async def test_idempotent_lookup_retries_through_5xx(stub, monkeypatch):
+    client = _client()
+    try:
+        token = (await client.call("SetExpressCheckout", {}))["TOKEN"]
+        _fail_next(monkeypatch, 2)
+
+        details = await client.call("GetExpressCheckoutDetails", {"TOKEN": token})
+        assert details["ACK"] == "Success"
+        stats = client.stats()["methods"]["GetExpressCheckoutDetails"]
+        assert (stats["calls"], stats["errors"], stats["retries"]) == (3, 2, 2)
+    finally:
+        await client.aclose()
+
+async def test_lookup_gives_up_after_max_retries(stub, monkeypatch):
+    client = _client()
+    try:
+        token = (await client.call("SetExpressCheckout", {}))["TOKEN"]
+        _fail_next(monkeypatch, 3)
+
+        with pytest.raises(PayPalUnavailable):
+            await client.call("GetExpressCheckoutDetails", {"TOKEN": token})
+        assert client.stats()["methods"]["GetExpressCheckoutDetails"]["calls"] == 3
+    finally:
+        await client.aclose()
+
+async def test_payment_is_not_resent_after_5xx(stub, monkeypatch):
+    client = _client()
+    try:
+        token = (await client.call("SetExpressCheckout", {}))["TOKEN"]
+        _fail_next(monkeypatch, 1)
+
+        with pytest.raises(PayPalUnavailable):
+            await client.call("DoExpressCheckoutPayment", {"TOKEN": token})
+        assert client.stats()["methods"]["DoExpressCheckoutPayment"]["calls"] == 1
+        assert stub.checkouts[token]["CHECKOUTSTATUS"] == "PaymentActionNotInitiated"
+    finally:
+        await client.aclose()
+
+async def test_payment_retries_when_connection_never_opened(stub):
+    transport = FlakyTransport()
+    client = _client(transport)
+    try:
+        token = (await client.call("SetExpressCheckout", {}))["TOKEN"]
+        transport.connect_failures, transport.requests = 1, 0
+
+        paid = await client.call("DoExpressCheckoutPayment", {"TOKEN": token})
+        assert paid["ACK"] == "Success"
+        assert client.stats()["methods"]["DoExpressCheckoutPayment"]["retries"] == 1
+    finally:
+        await client.aclose()
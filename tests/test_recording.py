@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+import dashboard
+import recording
+import reports
+from recording import exclusive_rebuild, record_once
+
+pytestmark = pytest.mark.anyio
+
+FLAG = "report_recorded"
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(recording, "POLL_SECONDS", 0.01)
+    monkeypatch.setattr(recording, "RECORD_WAIT_SECONDS", 0.05)
+
+def _transaction(session_id, amount=10.0, **fields):
+    return {
+        "id": session_id, "session_id": session_id, "payment_status": "paid", "amount": amount,
+        "cart_items": [], "created_at": "2024-05-01T08:00:00+00:00", **fields
+    }
+
+class Recorder:
+    def __init__(self):
+        self.recorded = []
+
+    async def __call__(self, db, transaction):
+        self.recorded.append(transaction["session_id"])
+
+async def test_record_once_records_each_transaction_once(db):
+    await db.payment_transactions.insert_one(_transaction("cs_1"))
+    record = Recorder()
+
+    await record_once(db, "cs_1", FLAG, record)
+    await record_once(db, "cs_1", FLAG, record)
+    assert record.recorded == ["cs_1"]
+    assert (await db.payment_transactions.find_one({"session_id": "cs_1"}))[FLAG] is True
+
+async def test_failed_record_releases_claim(db):
+    await db.payment_transactions.insert_one(_transaction("cs_1"))
+
+    async def fail(db, transaction):
+        raise RuntimeError("rollup write failed")
+
+    with pytest.raises(RuntimeError):
+        await record_once(db, "cs_1", FLAG, fail)
+    assert FLAG not in await db.payment_transactions.find_one({"session_id": "cs_1"})
+
+async def test_rebuild_claims_unrecorded_orders(db):
+    await db.payment_transactions.insert_many([
+        _transaction("cs_recorded", **{FLAG: True}),
+        _transaction("cs_unrecorded"),
+        _transaction("cs_abandoned_claim", **{FLAG: datetime.now(timezone.utc) - timedelta(hours=1)}),
+        _transaction("cs_unpaid", payment_status="pending"),
+    ])
+    async with exclusive_rebuild(db, FLAG, reports.PAID):
+        flags = {t["session_id"]: t.get(FLAG) async for t in db.payment_transactions.find()}
+        assert flags == {"cs_recorded": True, "cs_unrecorded": True, "cs_abandoned_claim": True, "cs_unpaid": None}
+    assert await db.rebuild_locks.count_documents({}) == 0
+
+    # The job for an order the rebuild counted does nothing
+    record = Recorder()
+    await record_once(db, "cs_unrecorded", FLAG, record)
+    assert record.recorded == []
+
+async def test_jobs_wait_for_rebuild(db):
+    await db.payment_transactions.insert_one(_transaction("cs_1", payment_status="pending"))
+    record = Recorder()
+    async with exclusive_rebuild(db, FLAG, reports.PAID):
+        # Paid mid-rebuild: the rebuild did not count it, so its job must run afterwards
+        await db.payment_transactions.update_one({"session_id": "cs_1"}, {"$set": {"payment_status": "paid"}})
+        with pytest.raises(RuntimeError):
+            await record_once(db, "cs_1", FLAG, record)
+        assert FLAG not in await db.payment_transactions.find_one({"session_id": "cs_1"})
+
+    await record_once(db, "cs_1", FLAG, record)
+    assert record.recorded == ["cs_1"]
+
+async def test_rebuild_waits_for_claimed_orders_and_excludes_others(db):
+    await db.payment_transactions.insert_one(_transaction("cs_1", **{FLAG: datetime.now(timezone.utc)}))
+    with pytest.raises(HTTPException) as excinfo:
+        async with exclusive_rebuild(db, FLAG, reports.PAID):
+            pass
+    assert excinfo.value.status_code == 409
+    assert await db.rebuild_locks.count_documents({}) == 0
+
+    async with exclusive_rebuild(db, FLAG, {"session_id": "none"}):
+        with pytest.raises(HTTPException) as excinfo:
+            async with exclusive_rebuild(db, FLAG, {"session_id": "none"}):
+                pass
+        assert excinfo.value.status_code == 409
+
+async def test_dashboard_counts_each_order_once(db):
+    await db.payment_transactions.insert_many([_transaction("cs_1", 10.0), _transaction("cs_2", 5.0)])
+    stats = await dashboard.rebuild(db)
+    assert (stats["total_orders"], stats["total_revenue"]) == (2, 15.0)
+
+    # Jobs queued for orders the rebuild counted, then one for a new order
+    await db.payment_transactions.insert_one(_transaction("cs_3", 7.5))
+    for session_id in ("cs_1", "cs_2", "cs_3"):
+        await record_once(db, session_id, dashboard.RECORDED, dashboard.record_order)
+    stats = await dashboard.get_stats(db)
+    assert (stats["total_orders"], stats["total_revenue"]) == (3, 22.5)
+    assert stats["recent_orders"][0]["session_id"] == "cs_3"
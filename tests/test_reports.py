@@ -0,0 +1,66 @@
+import pytest
+from fastapi import HTTPException
+
+import reports
+
+pytestmark = pytest.mark.anyio
+
+def _transaction(session_id, created_at, amount, items, coupon=None, discount=0):
+    return {
+        "session_id": session_id, "payment_status": "paid", "created_at": created_at, "amount": amount,
+        "subtotal": amount + discount, "discount": discount, "coupon": coupon, "cart_items": items,
+    }
+
+async def test_rollups_serve_series_top_products_and_coupons(db):
+    await reports.record_order(db, _transaction("cs_1", "2024-05-06T09:00:00+00:00", 30.0, [
+        {"product_id": "p1", "product_name": "Merlion keychain", "quantity": 2, "unit_price": 10.0},
+        {"product_id": "p2", "product_name": "Orchid brooch", "quantity": 1, "price": 10.0},
+    ]))
+    await reports.record_order(db, _transaction("cs_2", "2024-05-07T23:59:00+00:00", 18.0, [
+        {"product_id": "p2", "product_name": "Orchid brooch", "quantity": 2, "unit_price": 10.0},
+    ], coupon={"code": "SAVE10", "discount_amount": 2.0}, discount=2.0))
+    await reports.record_order(db, _transaction("cs_3", "2024-05-13T10:00:00+00:00", 10.0, [
+        {"product_id": "p1", "product_name": "Merlion keychain", "quantity": 1, "unit_price": 10.0},
+    ]))
+
+    report = await reports.sales_report(db, "2024-05-06", "2024-05-13", "week")
+    assert report["totals"] == {
+        "orders": 3, "revenue": 58.0, "discount": 2.0, "coupon_orders": 1, "average_order_value": 19.33
+    }
+    assert [(b["period"], b["orders"], b["revenue"]) for b in report["series"]] == [
+        ("2024-05-06", 2, 48.0), ("2024-05-13", 1, 10.0)
+    ]
+    assert [(p["product_id"], p["units"]) for p in report["top_products"]["by_units"]] == [("p1", 3), ("p2", 3)]
+    assert [(p["product_id"], p["revenue"]) for p in report["top_products"]["by_revenue"]] == [("p1", 30.0), ("p2", 30.0)]
+    assert report["coupons"] == [{"code": "SAVE10", "orders": 1, "discount": 2.0}]
+
+    daily = await reports.sales_report(db, "2024-05-07", "2024-05-07")
+    assert daily["series"] == [{
+        "period": "2024-05-07", "orders": 1, "revenue": 18.0, "discount": 2.0, "coupon_orders": 1,
+        "average_order_value": 18.0
+    }]
+
+def test_parse_range_rejects_bad_dates():
+    assert reports.parse_range("2024-05-01", "2024-05-31") == ("2024-05-01", "2024-05-31")
+    for start, end in (("2024-05-31", "2024-05-01"), ("May 1", None)):
+        with pytest.raises(HTTPException) as excinfo:
+            reports.parse_range(start, end)
+        assert excinfo.value.status_code == 400
+
+async def test_first_report_builds_rollups_for_all_history(db, monkeypatch):
+    await db.payment_transactions.insert_many([
+        {"session_id": "cs_2", "payment_status": "paid", "created_at": "2023-11-02T10:00:00+00:00"},
+        {"session_id": "cs_1", "payment_status": "pending", "created_at": "2023-01-01T10:00:00+00:00"},
+    ])
+    rebuilt = []
+
+    async def rebuild(db, start, end):
+        rebuilt.append((start, end))
+
+    # mongomock has no $merge, so check what gets rebuilt rather than the rollups
+    monkeypatch.setattr(reports, "rebuild", rebuild)
+    await reports.sales_report(db, "2024-05-01", "2024-05-31")
+    await reports.sales_report(db, "2024-05-01", "2024-05-31")
+    assert len(rebuilt) == 1
+    assert rebuilt[0][0] == "2023-11-02"
+    assert rebuilt[0][1] >= "2024-05-31"
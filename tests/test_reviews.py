@@ -0,0 +1,69 @@
+import pytest
+
+import catalog
+from response_cache import response_cache
+from reviews import apply_review, rebuild_review_stats, review_summary, summary_namespace
+
+pytestmark = pytest.mark.anyio
+
+async def test_rebuild_review_stats_and_summary(db):
+    await db.products.insert_many([
+        {"id": "p1", "name": "Merlion keychain"},
+        # Its reviews were all deleted
+        {"id": "p2", "name": "Orchid brooch", "review_count": 2, "rating": 4.5, "rating_sum": 9},
+    ])
+    await db.batik_products.insert_one({"id": "b1", "name": "Batik scarf"})
+    await db.reviews.insert_many([
+        {"product_id": "p1", "rating": 5},
+        {"product_id": "p1", "rating": 4},
+        {"product_id": "p1", "rating": 4},
+        {"product_id": "b1", "rating": 2},
+        {"product_id": "gone", "rating": 1},
+    ])
+    loads = []
+
+    async def load():
+        loads.append(1)
+        return {"cached": True}
+
+    catalog.remember("p2", "general")
+    await response_cache.get_or_load(summary_namespace("p2"), load)
+    assert await rebuild_review_stats(db) == 2
+    await response_cache.get_or_load(summary_namespace("p2"), load)
+    assert len(loads) == 2
+
+    assert await review_summary(db, "p1") == {
+        "product_id": "p1", "average_rating": 4.33, "review_count": 3,
+        "histogram": {"1": 0, "2": 0, "3": 0, "4": 2, "5": 1},
+    }
+    summary = await review_summary(db, "p2")
+    assert (summary["review_count"], summary["average_rating"]) == (0, 0)
+    assert (await review_summary(db, "b1"))["histogram"]["2"] == 1
+
+async def test_summary_counts_stars_for_products_without_histogram(db):
+    await db.products.insert_one({"id": "p1", "review_count": 2, "rating": 3.0})
+    await db.reviews.insert_many([{"product_id": "p1", "rating": 1}, {"product_id": "p1", "rating": 5}])
+    catalog.remember("p1", "general")
+
+    summary = await review_summary(db, "p1")
+    assert summary["histogram"] == {"1": 1, "2": 0, "3": 0, "4": 0, "5": 1}
+    assert summary["average_rating"] == 3.0
+
+async def test_apply_review_to_legacy_product_counts_earlier_stars(db):
+    # Two reviews from before rating_sum and histograms were kept
+    await db.products.insert_one({"id": "p1", "review_count": 2, "rating": 4.0})
+    catalog.remember("p1", "general")
+    await db.reviews.insert_many([
+        {"product_id": "p1", "rating": 5}, {"product_id": "p1", "rating": 3}, {"product_id": "p1", "rating": 1}
+    ])
+
+    assert await apply_review(db, "p1", 1)
+    summary = await review_summary(db, "p1")
+    assert summary["histogram"] == {"1": 1, "2": 0, "3": 1, "4": 0, "5": 1}
+    assert (summary["review_count"], summary["average_rating"]) == (3, 3.0)
+
+    await db.reviews.insert_one({"product_id": "p1", "rating": 5})
+    assert await apply_review(db, "p1", 5)
+    summary = await review_summary(db, "p1")
+    assert summary["histogram"] == {"1": 1, "2": 0, "3": 1, "4": 0, "5": 2}
+    assert (summary["review_count"], summary["average_rating"]) == (4, 3.5)
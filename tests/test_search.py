@@ -0,0 +1,46 @@
+import pytest
+
+import search
+from search import SearchIndex, ranked_page
+
+pytestmark = pytest.mark.anyio
+
+def test_ranks_name_matches_above_description_matches():
+    index = SearchIndex()
+    index.add({"id": "a", "name": "Merlion keychain", "description": "A souvenir"}, "general")
+    index.add({"id": "b", "name": "Tote bag", "description": "Printed with a merlion"}, "general")
+    index.add({"id": "c", "name": "Batik scarf", "description": "Silk"}, "batik")
+
+    assert [product_id for product_id, _, _ in index.search("merlion")] == ["a", "b"]
+    assert index.search("merl")[0][0] == "a"
+    assert index.search("merlion", ["batik"]) == []
+
+def test_remove_drops_product():
+    index = SearchIndex()
+    index.add({"id": "a", "name": "Orchid brooch"}, "general")
+    index.remove("a")
+    assert index.search("orchid") == []
+    assert len(index) == 0
+
+async def test_ranked_page_keeps_relevance_order_and_filters(db):
+    await db.products.insert_many([
+        {"id": f"p{i}", "name": f"Product {i}", "category_id": "even" if i % 2 == 0 else "odd"}
+        for i in range(10)
+    ])
+    ranked = [f"p{i}" for i in (7, 2, 9, 4, 0, 5)]
+
+    products, total = await ranked_page(db.products, ranked, {}, 1, 3)
+    assert [p['id'] for p in products] == ["p2", "p9", "p4"]
+    assert total == 6
+
+    products, total = await ranked_page(db.products, ranked, {"category_id": "even"}, 0, 2)
+    assert [p['id'] for p in products] == ["p2", "p4"]
+    assert total == 3
+
+async def test_ranked_page_caps_candidates(db, monkeypatch):
+    monkeypatch.setattr(search, "MAX_SEARCH_CANDIDATES", 3)
+    await db.products.insert_many([{"id": f"p{i}", "name": "x"} for i in range(5)])
+
+    products, total = await ranked_page(db.products, [f"p{i}" for i in range(5)], {}, 0, 10)
+    assert [p['id'] for p in products] == ["p0", "p1", "p2"]
+    assert total == 3